@@ -4,9 +4,10 @@
 # ------ Copyright (C) 2020 University of Strathclyde and Author ------
 # ---------------------- Author: Callum Wilson ------------------------
 # --------------- e-mail: callum.j.wilson@strath.ac.uk ----------------
-"""Contains the gym environment wrapper class"""
+"""Contains the gym environment wrapper class and a vectorised CartPole environment"""
 
 import gym
+import numpy as np
 
 
 class Environment(gym.Wrapper):
@@ -24,7 +25,7 @@ class Environment(gym.Wrapper):
 
 	Methods
 	-------
-	reset()
+	reset(**kwargs)
 		Flattens the state output
 	step(a,render=False,**kwargs)
 		Flattens the state output, gives option of rendering the environment
@@ -52,10 +53,10 @@ class Environment(gym.Wrapper):
 		self.state_size = gym.spaces.flatdim(self.observation_space)
 		self.action_size = self.action_space.n
 
-	def reset(self):
-		"""Additionally flatten and reshape the state output"""
+	def reset(self, **kwargs):
+		"""Additionally flatten and reshape the state output, kwargs e.g. seed are passed to gym"""
 		# s = super().reset()
-		s, _ = super().reset() # New gym version(0.18.0->0.26.1), with GPU very slow
+		s, _ = super().reset(**kwargs) # New gym version(0.18.0->0.26.1), with GPU very slow
 		return gym.spaces.flatten(self.observation_space,s).reshape(1,-1)
 
 	def step(self,a,render=False,**kwargs):
@@ -78,3 +79,121 @@ class Environment(gym.Wrapper):
 		if render:
 			super().render(**kwargs)
 		return gym.spaces.flatten(self.observation_space,s).reshape(1,-1),r,d,info
+
+
+class VecCartPole(object):
+	"""
+	A batch of CartPole environments stepped together, implemented in numpy
+
+	Follows the dynamics, termination conditions and rewards of gym's
+	CartPole. Environments which finish an episode are reset automatically,
+	so the states returned by `step` are always valid inputs for the next
+	action selection.
+
+	...
+
+	Attributes
+	----------
+	state_size : int
+		Size of the environment state space
+	action size : int
+		Size of the environment action space
+	n_env : int
+		Number of environments
+	max_steps : int
+		Number of steps after which an episode is truncated
+	s : np.ndarray
+		Current state of each environment, shape n_env x 4
+	t : np.ndarray
+		Number of steps taken in the current episode of each environment
+	rand_state : np.random.RandomState
+		Random state for generating initial states
+
+	Methods
+	-------
+	reset()
+		Resets all environments and returns their states
+	step(a)
+		Steps all environments with actions a, resetting any which are done
+	"""
+	state_size = 4
+	action_size = 2
+	gravity = 9.8
+	masscart = 1.0
+	masspole = 0.1
+	total_mass = masspole + masscart
+	length = 0.5
+	polemass_length = masspole*length
+	force_mag = 10.0
+	tau = 0.02
+	theta_threshold = 12*2*np.pi/360
+	x_threshold = 2.4
+
+	def __init__(self, n_env=64, max_steps=200, seed=None):
+		"""
+		Parameters
+		----------
+		n_env : int, optional
+			Number of environments, default 64
+		max_steps : int, optional
+			Number of steps after which an episode is truncated, default 200 as in
+			CartPole-v0
+		seed : int, optional
+			Seed for generating initial states, default None
+		"""
+		self.n_env = n_env
+		self.max_steps = max_steps
+		self.rand_state = np.random.RandomState(seed)
+		self.s = np.zeros((n_env,self.state_size))
+		self.t = np.zeros(n_env, dtype=int)
+
+	def reset(self):
+		"""Reset all environments, returning states with one row per environment"""
+		self.s = self.rand_state.uniform(-0.05,0.05,(self.n_env,self.state_size))
+		self.t[:] = 0
+		return self.s.copy()
+
+	def step(self, a):
+		"""
+		Step every environment, resetting those which reach the end of an episode
+
+		...
+
+		Parameters
+		----------
+		a : array-like of int
+			Action to execute in each environment
+
+		Returns
+		-------
+		s : np.ndarray
+			Next state of each environment, or the initial state of a new episode
+			for environments which are done
+		r : np.ndarray
+			Reward for each environment
+		d : np.ndarray of bool
+			Indicates environments whose episode ended at this step
+		info : dict
+			'terminal_state' holds the final states of environments which are done
+		"""
+		x, x_dot, theta, theta_dot = self.s.T
+		force = np.where(np.asarray(a)==1, self.force_mag, -self.force_mag)
+		costheta = np.cos(theta)
+		sintheta = np.sin(theta)
+		temp = (force + self.polemass_length*theta_dot**2*sintheta)/self.total_mass
+		thetaacc = (self.gravity*sintheta - costheta*temp)/(
+			self.length*(4.0/3.0 - self.masspole*costheta**2/self.total_mass))
+		xacc = temp - self.polemass_length*thetaacc*costheta/self.total_mass
+		self.s = np.stack([x + self.tau*x_dot, x_dot + self.tau*xacc,
+						   theta + self.tau*theta_dot, theta_dot + self.tau*thetaacc], axis=1)
+		self.t += 1
+
+		terminated = (np.abs(self.s[:,0])>self.x_threshold) | (np.abs(self.s[:,2])>self.theta_threshold)
+		d = terminated | (self.t>=self.max_steps)
+		r = np.ones(self.n_env)
+		info = {'terminal_state':self.s[d]}
+		n_done = np.count_nonzero(d)
+		if n_done:
+			self.s[d] = self.rand_state.uniform(-0.05,0.05,(n_done,self.state_size))
+			self.t[d] = 0
+		return self.s.copy(), r, d, info
@@ -0,0 +1,239 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/. */
+# ------ Copyright (C) 2020 University of Strathclyde and Author ------
+# ---------------------- Author: Callum Wilson ------------------------
+# --------------- e-mail: callum.j.wilson@strath.ac.uk ----------------
+"""Running repeated experiments over hyper-parameter grids and seeds"""
+
+import hashlib
+import itertools
+import multiprocessing
+import os
+import pickle
+import random
+import numpy as np
+from .q_agents import QAgent
+from .utils import train_agent
+
+
+def param_grid(base_params, grid=None):
+	"""
+	Expand a grid of hyper-parameters into a list of configurations
+
+	...
+
+	Parameters
+	----------
+	base_params : dict
+		Keyword arguments shared by every configuration
+	grid : dict, optional
+		Lists of values for each varied keyword argument, every combination is used
+
+	Returns
+	-------
+	list of dict
+		One set of keyword arguments for each combination, in a fixed order
+	"""
+	if 'seed' in base_params or (grid and 'seed' in grid):
+		raise ValueError("The seed of each run is taken from the seeds list, not from the parameters")
+	if not grid:
+		return [dict(base_params)]
+	names = sorted(grid)
+	configs = []
+	for values in itertools.product(*(grid[name] for name in names)):
+		config = dict(base_params)
+		config.update(zip(names,values))
+		configs.append(config)
+	return configs
+
+def config_key(config):
+	"""
+	Stable identifier of a configuration, independent of its position in the grid
+
+	...
+
+	Parameters
+	----------
+	config : dict
+		`QAgent` keyword arguments of a run
+
+	Returns
+	-------
+	str
+		Hash of the pickled configuration with its keys sorted
+	"""
+	return hashlib.sha1(pickle.dumps(sorted(config.items(), key=lambda item: item[0]))).hexdigest()
+
+def run_job(job):
+	"""
+	Train one agent from a fresh environment and return its results record
+
+	Runs in a worker process; the agent owns its own graph and session, which
+	are closed before returning.
+
+	...
+
+	Parameters
+	----------
+	job : tuple
+		(config_id, config, seed, N_ep, env_name) where config contains the
+		`QAgent` keyword arguments including `net_type`
+
+	Returns
+	-------
+	dict
+		Results record with the config_id, seed, config, number of episodes,
+		environment name, episode rewards and steps, and the final network
+		parameters
+	"""
+	from .environment import Environment
+	config_id, config, seed, N_ep, env_name = job
+	np.random.seed(seed)
+	random.seed(seed)
+	env = Environment(env_name)
+	env.reset(seed=seed)
+	env.action_space.seed(seed)
+	agent = QAgent(env, seed=seed, **config)
+	R_ep, steps, agent = train_agent(agent, env, N_ep)
+	record = {'config_id':config_id, 'seed':seed, 'config':config, 'N_ep':N_ep, 'env_name':env_name,
+			  'R':np.asarray(R_ep, dtype=np.float32), 'step':np.asarray(steps, dtype=np.int32),
+			  'params':agent.nn.get_params()}
+	agent.close()
+	env.close()
+	return record
+
+def read_records(fname):
+	"""
+	Read every complete record from an experiment file
+
+	A record cut short by an interrupted write is ignored, along with
+	anything after it.
+
+	...
+
+	Parameters
+	----------
+	fname : str
+		Experiment file written by `run_experiment`
+
+	Returns
+	-------
+	records : list of dict
+		Complete records in the order they were written
+	offset : int
+		Size in bytes of the complete records at the start of the file
+	"""
+	records = []
+	offset = 0
+	try:
+		f = open(fname,'rb')
+	except FileNotFoundError:
+		return records, offset
+	with f:
+		while True:
+			try:
+				records.append(pickle.load(f))
+			except EOFError:
+				break
+			except Exception: # truncated tail, e.g. unpickling a partial array
+				break
+			offset = f.tell()
+	return records, offset
+
+def load_experiment(fname):
+	"""
+	Load an experiment file as columns with one entry per completed run
+
+	Runs of different lengths are padded to the longest one, with nan
+	rewards and 0 steps after their last episode.
+
+	...
+
+	Parameters
+	----------
+	fname : str
+		Experiment file written by `run_experiment`
+
+	Returns
+	-------
+	dict
+		'config_id', 'seed', 'config', 'N_ep', 'env_name' and 'params' lists,
+		and 'R' and 'step' arrays of shape (n_run, longest N_ep)
+	"""
+	records, _ = read_records(fname)
+	columns = {name:[record.get(name) for record in records]
+			   for name in ('config_id','seed','config','env_name','params')}
+	columns['N_ep'] = [len(record['R']) for record in records]
+	n_ep = max(columns['N_ep'], default=0)
+	columns['R'] = np.full((len(records),n_ep), np.nan, dtype=np.float32)
+	columns['step'] = np.zeros((len(records),n_ep), dtype=np.int32)
+	for i, record in enumerate(records):
+		columns['R'][i,:len(record['R'])] = record['R']
+		columns['step'][i,:len(record['step'])] = record['step']
+	return columns
+
+def run_experiment(fname, base_params, seeds, N_ep, grid=None, env_name='CartPole-v0',
+				   n_proc=None, show_progress=False):
+	"""
+	Train agents for every configuration and seed on a pool of processes
+
+	Each completed run is appended to `fname` as one pickled record as soon as
+	it finishes, so an interrupted experiment can be restarted and only the
+	runs not already in the file are repeated. Finished runs are matched on
+	their stored configuration, seed, number of episodes and environment, so
+	records of other runs, e.g. of configurations no longer in the grid, are
+	kept but not counted as done. Configurations must be
+	picklable, so `f_heur` should be defined at module level rather than in
+	a notebook.
+
+	...
+
+	Parameters
+	----------
+	fname : str
+		Append-only file of results, read back with `load_experiment`
+	base_params : dict
+		`QAgent` keyword arguments shared by every run, including `net_type`
+	seeds : list of int
+		Seeds used for each configuration
+	N_ep : int
+		Number of training episodes in each run
+	grid : dict, optional
+		Lists of values for hyper-parameters varied between configurations
+	env_name : str, optional
+		Name of the gym environment, default 'CartPole-v0'
+	n_proc : int, optional
+		Number of worker processes, default the number of CPUs
+	show_progress : bool, optional
+		Displays a tqdm progress bar
+
+	Returns
+	-------
+	dict
+		All results in `fname`, as returned by `load_experiment`
+	"""
+	configs = param_grid(base_params, grid)
+	records, offset = read_records(fname)
+	if os.path.exists(fname) and os.path.getsize(fname) > offset:
+		with open(fname,'r+b') as f:
+			f.truncate(offset)
+	done = {(config_key(record['config']),record['seed'],len(record['R']),record.get('env_name'))
+			for record in records}
+	jobs = [(config_id, config, seed, N_ep, env_name)
+			for config_id, config in enumerate(configs) for seed in seeds
+			if (config_key(config),seed,N_ep,env_name) not in done]
+	if jobs:
+		# Spawned workers start without any tensorflow state from this process
+		ctx = multiprocessing.get_context('spawn')
+		n_proc = min(n_proc or os.cpu_count(), len(jobs))
+		with ctx.Pool(n_proc) as pool, open(fname,'ab') as f:
+			results = pool.imap_unordered(run_job, jobs)
+			if show_progress:
+				from tqdm.auto import tqdm
+				results = tqdm(results, total=len(jobs))
+			for record in results:
+				pickle.dump(record, f)
+				f.flush()
+				os.fsync(f.fileno())
+	return load_experiment(fname)
@@ -6,11 +6,31 @@
 # --------------- e-mail: callum.j.wilson@strath.ac.uk ----------------
 """Classes containing tensorflow implementations of Q-Networks"""
 
-try:
-	import tensorflow.compat.v1 as tf
-	tf.disable_v2_behavior()
-except ImportError:
-	import tensorflow as tf
+import numpy as np
+
+
+def _import_tensorflow():
+	"""Import tensorflow with v1 behaviour, replacing the lazy module reference `tf`"""
+	global tf
+	if isinstance(tf, _LazyTensorflow):
+		try:
+			import tensorflow.compat.v1 as tf
+			tf.disable_v2_behavior()
+		except ImportError:
+			import tensorflow as tf
+	return tf
+
+class _LazyTensorflow(object):
+	"""Stands in for tensorflow until an attribute is first used, e.g. on building a network"""
+	def __getattr__(self, name):
+		return getattr(_import_tensorflow(), name)
+
+tf = _LazyTensorflow()
+
+
+def new_session():
+	"""Return a tensorflow session with its own graph"""
+	return tf.Session(graph=tf.Graph())
 
 
 class SingleLayerNetwork(object):
@@ -43,14 +63,18 @@ class SingleLayerNetwork(object):
 		Assignment operations for new parameters
 	updateModel : tf.Operation
 		For running network updates
+	trainStep : tf.Operation or None
+		Fused Q-learning update built by `build_train_step`, defined by the
+		subclasses which support it
+	syncModel, softSyncModel : tf.Operation or None
+		Operations copying parameters from a source network, built by `build_sync`
 	sess : tf.Session
-		Tensorflow session
+		Tensorflow session, which may be shared with other networks in the same graph
 	"""
-	sess = tf.Session()
 	def __init__(self, state_size, action_size,
 				N_hid=None, activation_function='tanh',
 				w_mag=0.1, b_mag=0.0, W_mag=0.1,
-				is_target=False, **kwargs):
+				is_target=False, sess=None, **kwargs):
 		"""
 		Parameters
 		----------
@@ -64,14 +88,20 @@ class SingleLayerNetwork(object):
 			Initialisation magnitude for each set of parameters, default 0.1, 0.0, 0.1
 		is_target : bool, optional
 			Whether the network is a target network which does not update, default False
+		sess : tf.Session, optional
+			Session for the current default graph, e.g. shared by an agent's online and
+			target networks, default a new session for the current default graph
 		"""
+		self.sess = tf.Session() if sess is None else sess
 		self.N_hid = 2*action_size if N_hid is None else N_hid
+		self.action_size = action_size
 		self.s_input = tf.placeholder(shape=[None,state_size],dtype=tf.float32)
 		self.w_in = tf.Variable(tf.random_uniform([state_size,self.N_hid],0,w_mag))
 		self.b_in = tf.Variable(tf.random_uniform([1,self.N_hid],0,b_mag))
 		self.W = tf.Variable(tf.random_uniform([self.N_hid,action_size],0,W_mag))
 
 		act_fn = tf.keras.activations.get(activation_function)
+		self.act_fn = act_fn
 		self.act = act_fn(tf.add(tf.matmul(self.s_input,self.w_in),self.b_in))
 		self.Q_est = tf.matmul(self.act,self.W)
 		self.prep_state = None
@@ -85,6 +115,9 @@ class SingleLayerNetwork(object):
 						self.b_in.assign(self.new_params['b'])]
 
 		self.updateModel = tf.no_op()
+		self.trainStep = None
+		self.syncModel = None
+		self.softSyncModel = None
 
 	def var_init(self):
 		"""Initial graph variables"""
@@ -101,6 +134,10 @@ class SingleLayerNetwork(object):
 		"""Return current values of updatable parameters"""
 		return self.sess.run(self.params)
 
+	def preprocess(self, s):
+		"""Return the preprocessed form of states `s` defined by `prep_state`"""
+		return self.sess.run(self.prep_state,feed_dict={self.s_input:s})
+
 	def Q_predict(self, s=None, s_prep=None):
 		"""
 		Return predicted action-values for the state
@@ -130,6 +167,84 @@ class SingleLayerNetwork(object):
 		"""Method for updating network parameters"""
 		self.sess.run(self.updateModel)
 
+	def build_sync(self, source, tau=None):
+		"""
+		Build operations which copy parameters from `source` within the graph
+
+		...
+
+		Parameters
+		----------
+		source : SingleLayerNetwork
+			Network in the same graph whose parameters are copied
+		tau : float, optional
+			If given, also build a soft update p = tau*p_source + (1-tau)*p
+		"""
+		pairs = [(self.params[key],source.params[key]) for key in self.params]
+		self.syncModel = tf.group(*[p.assign(p_s) for p, p_s in pairs])
+		if tau is not None:
+			self.softSyncModel = tf.group(*[p.assign(tf.add(tf.scalar_mul(tau,p_s),
+				tf.scalar_mul(1.0-tau,p))) for p, p_s in pairs])
+
+	def sync(self, soft=False):
+		"""Copy parameters from the source network, softly if `soft`"""
+		self.sess.run(self.softSyncModel if soft else self.syncModel)
+
+	def Q_graph(self, s):
+		"""Return a tensor of action-values estimated by this network for states `s`"""
+		return tf.matmul(self.act_fn(tf.add(tf.matmul(s,self.w_in),self.b_in)),self.W)
+
+	def Q_targets(self, Q, Q_next, gamma, scale_td=False):
+		"""
+		Build placeholders for a minibatch of transitions and the Q-learning targets
+
+		Also builds `td_error` for the actions taken and `w_batch`, optional
+		importance sampling weights which default to 1.
+
+		...
+
+		Parameters
+		----------
+		Q : tf.Tensor
+			Current action-value estimates for the minibatch states, actions on the last axis
+		Q_next : tf.Tensor
+			Target network action-value estimates for the next states, the same shape as Q
+		gamma : float
+			Discount factor for Q-learning
+		scale_td : bool, optional
+			Scale the TD error of each target by `w_batch`, which weights the squared
+			error loss of gradient based updates, default False
+
+		Returns
+		-------
+		tf.Tensor
+			Q with the values of the actions taken replaced by r + gamma*max(Q_next)
+			for non-terminal transitions and r for terminal transitions
+		"""
+		self.a_batch = tf.placeholder(shape=[None],dtype=tf.int32)
+		self.r_batch = tf.placeholder(shape=[None],dtype=tf.float32)
+		self.done_batch = tf.placeholder(shape=[None],dtype=tf.float32)
+		self.w_batch = tf.placeholder_with_default(tf.ones_like(self.r_batch),shape=[None])
+		y = tf.add(self.r_batch,
+			gamma*tf.multiply(tf.subtract(1.0,self.done_batch),tf.reduce_max(Q_next,-1)))
+		mask = tf.one_hot(self.a_batch,self.action_size)
+		self.td_error = tf.subtract(y,tf.reduce_sum(tf.multiply(mask,Q),-1))
+		td = tf.multiply(self.w_batch,self.td_error) if scale_td else self.td_error
+		return tf.add(Q,tf.multiply(mask,tf.expand_dims(td,-1)))
+
+	def train_step(self, s, a, r, s_next, done, w=None):
+		"""Run the fused Q-learning update on a minibatch of transitions, returning TD errors"""
+		return self.sess.run([self.trainStep,self.td_error],
+							 feed_dict=self.train_feed(s, a, r, s_next, done, w))[1]
+
+	def train_feed(self, s, a, r, s_next, done, w=None):
+		"""Feed dictionary for `trainStep`, with importance sampling weights `w` if given"""
+		feed_dict = {self.s_batch:s, self.s_next:s_next, self.a_batch:a, self.r_batch:r,
+					 self.done_batch:done}
+		if w is not None:
+			feed_dict[self.w_batch] = w
+		return feed_dict
+
 	def close(self):
 		"""Close the tensorflow session"""
 		self.sess.close()
@@ -148,6 +263,8 @@ class QNet(SingleLayerNetwork):
 		Placeholder for target action-values
 	updateModel : tf.Operation
 		Runs RMSPropOptimizer to minimize mean squared error
+	trainer : tf.train.RMSPropOptimizer
+		Optimizer shared by `updateModel` and `trainStep`
 	"""
 	def __init__(self, state_size, action_size,
 				 alpha=0.01, clip_norm=None, minibatch_size=5, **kwargs):
@@ -169,22 +286,34 @@ class QNet(SingleLayerNetwork):
 
 		self.k = int(minibatch_size)
 		self.nextQ = tf.placeholder(shape=[None,action_size],dtype=tf.float32)
-		loss = tf.reduce_sum(tf.square(self.nextQ - self.Q_est))
-		trainer = tf.train.RMSPropOptimizer(alpha)
-
-		if clip_norm is not None:
-			grads = trainer.compute_gradients(loss,[self.W,self.w_in,self.b_in])
-			cap_grads = [(tf.clip_by_norm(grad, clip_norm), var) for grad, var in grads]
-			self.updateModel = trainer.apply_gradients(cap_grads)
-		else:
-			self.updateModel = trainer.minimize(loss,var_list=[self.W,self.w_in,self.b_in])
+		self.trainer = tf.train.RMSPropOptimizer(alpha)
+		self.clip_norm = clip_norm
+		self.updateModel = self.minimize(self.nextQ)
 
 		self.var_init()
 
+	def minimize(self, Q_target):
+		"""Return an operation minimising the squared error between Q_est and Q_target"""
+		loss = tf.reduce_sum(tf.square(Q_target - self.Q_est))
+		if self.clip_norm is not None:
+			grads = self.trainer.compute_gradients(loss,[self.W,self.w_in,self.b_in])
+			cap_grads = [(tf.clip_by_norm(grad, self.clip_norm), var) for grad, var in grads]
+			return self.trainer.apply_gradients(cap_grads)
+		else:
+			return self.trainer.minimize(loss,var_list=[self.W,self.w_in,self.b_in])
+
 	def update(self, S, Q):
 		"""Updates based on states and target action values"""
 		self.sess.run(self.updateModel,{self.s_input:S,self.nextQ:Q})
 
+	def build_train_step(self, target, gamma):
+		"""Build `trainStep`, computing targets with `target` and updating in one call"""
+		self.s_batch = self.s_input
+		self.s_next = tf.placeholder(shape=self.s_input.shape,dtype=tf.float32)
+		Q_target = self.Q_targets(tf.stop_gradient(self.Q_est),target.Q_graph(self.s_next),gamma,
+								  scale_td=True)
+		self.trainStep = self.minimize(Q_target)
+
 class ELMNet(SingleLayerNetwork):
 	"""
 	A Q-Network which uses ELM inspired updates
@@ -194,20 +323,42 @@ class ELMNet(SingleLayerNetwork):
 	Attributes
 	----------
 	k : int
-		Size of minibatches for updating
+		Default size of minibatches for updating, any number of rows can be fed
 	prep_state : tf.Tensor
 		Output of each neuron for use as a preprocessed state
 	H : tf.Tensor
-		Placeholder for minibatches of pre-processed states
+		Placeholder for minibatches of pre-processed states, shape [None, N_hid]
 	T : tf.Tensor
-		Placeholder for target action-values
+		Placeholder for target action-values, shape [None, action_size]
+	A_inv : tf.Variable
+		Inverse of the regularised hidden layer autocorrelation, shape NxN
+	A : tf.Variable or None
+		Regularised hidden layer autocorrelation, only tracked for refactorisation
 	initModel, updateModel : tuple of tf.Tensor
 		Assignment operations for initialising and updating the weights
+	initStep, trainStep : tuple of tf.Tensor or None
+		Fused Q-learning versions of initModel and updateModel built by `build_train_step`
+	refactorModel, symmetriseModel : tf.Tensor or None
+		Assignment operations for periodically correcting A_inv
+	S : tf.Variable or None
+		Sum of H^T H over all updates, only tracked for 'HR_step' regularization
+	hr_vecs : tf.Variable or None
+		Estimates of the eigenvectors of S for its largest, smallest and second
+		largest eigenvalues, shape Nx3, refined at each update
+	hr_krylov : int
+		Number of blocks in the Krylov basis used to refine hr_vecs
+	forgetting_factor : float
+		Fraction of the information along each newly sampled direction kept at each
+		update, 1 for no forgetting
 	first : bool
 		Used to indicate the first update to initialise weights
+	n_update : int
+		Number of updates since initialising the weights
 	"""
 	def __init__(self, state_size, action_size,
-				 gamma_reg=0.001, minibatch_size=5, regularization=None, **kwargs):
+				 gamma_reg=0.001, minibatch_size=5, regularization=None,
+				 update_mode='inverse', refactor_steps=None, symmetrise_steps=None,
+				 hr_krylov=3, forgetting_factor=1.0, **kwargs):
 		"""
 		Parameters
 		----------
@@ -217,29 +368,176 @@ class ELMNet(SingleLayerNetwork):
 			LS-IELM regularisation parameter
 		minibatch_size : int, optional
 			Size of minibatches for updating
+		regularization : {None, 'HR', 'HR_step'}, optional
+			Specifies which method of regularization to use, 'HR' regularises the initial
+			weights and 'HR_step' applies a rank-1 HR term at every update using
+			incrementally tracked eigenvalues of the hidden layer autocorrelation
+		update_mode : {'inverse', 'cholesky'}, optional
+			'inverse' uses explicit matrix inverses as in LS-IELM, 'cholesky' downdates
+			A_inv using a Cholesky factor of the kxk innovation matrix and triangular
+			solves, costing O(N^2 k) per update, default 'inverse'
+		refactor_steps : int, optional
+			Number of updates between recomputing A_inv from a Cholesky factor of the
+			tracked autocorrelation matrix, default never
+		symmetrise_steps : int, optional
+			Number of updates between re-symmetrising A_inv, default never
+		hr_krylov : int, optional
+			Number of blocks in the Krylov basis [V, S V, S^2 V, ...] used to refine the
+			eigenvectors at each update for 'HR_step', default 3
+		forgetting_factor : float, optional
+			Factor lam in (0, 1] for recursive least squares with directional forgetting,
+			so stale transitions stop dominating W after about 1/(1 - lam) updates along
+			the same directions. Only information along the rows of each minibatch is
+			discounted, A <- A - (1 - lam) H^T (H A_inv H^T)^-1 H + H^T H, which avoids
+			the windup of A_inv in unexcited directions under uniform exponential
+			forgetting. This is still a rank-k Woodbury update, applied through an
+			eigendecomposition of the kxk matrix H A_inv H^T, so it is only available
+			with update mode 'inverse', default 1
 		**kwargs
 			Additional keyword arguments passed to `SingleLayerNetwork`
+
+		Raises
+		------
+		ValueError
+			If an invalid update mode, regularization or forgetting factor is passed,
+			or a forgetting factor with update mode 'cholesky'
 		"""
 		super().__init__(state_size, action_size, **kwargs)
 		self.regularization = regularization
 		# print(3, self.regularization)
+		if update_mode not in ('inverse','cholesky'):
+			raise ValueError('Invalid update mode: \'{}\''.format(update_mode))
+		if regularization not in (None,'HR','HR_step'):
+			raise ValueError('Invalid regularization: \'{}\''.format(regularization))
+		if not 0.0 < forgetting_factor <= 1.0:
+			raise ValueError('Invalid forgetting factor: {}'.format(forgetting_factor))
+		if forgetting_factor != 1.0 and update_mode == 'cholesky':
+			raise ValueError('A forgetting factor requires update mode \'inverse\', not \'cholesky\'')
+		self.gamma_reg = gamma_reg
+		self.forgetting_factor = forgetting_factor
+		self.update_mode = update_mode
+		self.refactor_steps = refactor_steps
+		self.symmetrise_steps = symmetrise_steps
 
 		self.k = int(minibatch_size)
 		self.prep_state = self.act
-		self.H = tf.placeholder(shape=[self.k,self.N_hid],dtype=tf.float32)
-		self.T = tf.placeholder(shape=[self.k,action_size],dtype=tf.float32)
-		H_t = tf.transpose(self.H)
-		A_inv = tf.Variable(tf.random_uniform([self.N_hid,self.N_hid],0,1))
+		self.H = tf.placeholder(shape=[None,self.N_hid],dtype=tf.float32)
+		self.T = tf.placeholder(shape=[None,action_size],dtype=tf.float32)
+		self.A_inv = tf.Variable(tf.random_uniform([self.N_hid,self.N_hid],0,1))
+
+		# Track A = A0_inv^-1 + sum(H^T H) so that A_inv can be recomputed
+		self.A = None
+		self.refactorModel = None
+		if self.refactor_steps:
+			self.A = tf.Variable(tf.zeros([self.N_hid,self.N_hid]))
+			self.refactorModel = self.A_inv.assign(self.inv(self.A))
+		self.symmetriseModel = self.A_inv.assign(
+			tf.scalar_mul(0.5,tf.add(self.A_inv,tf.transpose(self.A_inv))))
+
+		self.S = None
+		self.hr_vecs = None
+		self.hr_krylov = int(hr_krylov)
+		if self.regularization == 'HR_step':
+			self.S = tf.Variable(tf.zeros([self.N_hid,self.N_hid]))
+			self.hr_vecs = tf.Variable(tf.random_uniform([self.N_hid,3],-1,1))
+
+		self.initModel, self.updateModel = self.update_ops(self.H, self.T)
+		self.initStep = None
+
+		self.first = True
+		self.n_update = 0
+		self.var_init()
+
+	def inv(self, M):
+		"""Inverse of a symmetric positive definite NxN tensor"""
+		if self.update_mode == 'cholesky':
+			return tf.linalg.cholesky_solve(tf.linalg.cholesky(M),tf.eye(self.N_hid))
+		return tf.matrix_inverse(M)
+
+	def hr_ops(self, S, A_inv, X):
+		"""
+		Build the 'HR_step' regularised product and the eigenvector assignments
+
+		The eigenpairs of S for its largest, smallest and second largest
+		eigenvalues, lambda_max, lambda_min and lambda_(n-1) of the HR formula,
+		are refined by Rayleigh-Ritz on the block Krylov basis
+		[V, S V, S^2 V, ...] of the previous estimates V, costing O(N^2) per
+		update instead of an O(N^3) eigendecomposition. With the rank-1 term
+		Rnn = mu*u*u^T on the leading eigenvector u and P = (A_inv^-1 + Rnn)^-1
+		from Sherman-Morrison, the HR inverse P(I + Rnn P) = P + mu*(P u)(P u)^T
+		is applied to X without forming it.
+
+		...
+
+		Parameters
+		----------
+		S : tf.Tensor
+			Sum of H^T H including the current minibatch, shape NxN
+		A_inv : tf.Tensor
+			Updated inverse of the regularised autocorrelation, shape NxN
+		X : tf.Tensor
+			Matrix to multiply by the HR inverse, shape NxA
+
+		Returns
+		-------
+		hr_X : tf.Tensor
+			X multiplied by the HR inverse
+		assign : tf.Tensor
+			Assignment storing the new eigenvector estimates
+		"""
+		K = [self.hr_vecs]
+		for _ in range(self.hr_krylov-1):
+			K.append(tf.matmul(S,K[-1]))
+		Q, _ = tf.linalg.qr(tf.concat(K,1))
+		lam, Y = tf.linalg.eigh(tf.matmul(Q,tf.matmul(S,Q),transpose_a=True)) # non-decreasing order
+		V = tf.matmul(Q,tf.gather(Y,[tf.shape(Y)[1]-1,0,tf.shape(Y)[1]-2],axis=1))
+		lam_max, lam_min, lam_n_1 = lam[-1], lam[0], lam[-2]
+		miu = tf.reduce_min([tf.sqrt(tf.abs(lam_min**2 + lam_min*lam_max)), lam_n_1]) # hr, k=1, opt
+		miu = tf.maximum(miu,0.0)
+
+		u = V[:,:1]
+		Au = tf.matmul(A_inv,u)
+		uAu = tf.reduce_sum(tf.multiply(u,Au))
+		c = miu/(1.0 + miu*uAu)
+		PX = tf.subtract(tf.matmul(A_inv,X),tf.scalar_mul(c,tf.matmul(Au,tf.matmul(Au,X,transpose_a=True))))
+		Pu = tf.scalar_mul(1.0 - c*uAu,Au)
+		hr_X = tf.add(PX,tf.scalar_mul(miu,tf.matmul(Pu,tf.matmul(Pu,X,transpose_a=True))))
+		return hr_X, self.hr_vecs.assign(V)
+
+	def update_ops(self, H, T):
+		"""
+		Build the LS-IELM assignment operations for preprocessed states and targets
 
-		A0 = tf.add(tf.scalar_mul(1.0/gamma_reg,tf.eye(self.N_hid)),tf.matmul(H_t,self.H))
-		A0_inv = tf.matrix_inverse(A0)
+		...
+
+		Parameters
+		----------
+		H : tf.Tensor
+			Minibatch of preprocessed states, shape kxN where k may vary between runs
+		T : tf.Tensor
+			Target action-values, shape kxA
+
+		Returns
+		-------
+		initModel, updateModel : tuple of tf.Tensor
+			Assignment operations for initialising and updating the weights
+		"""
+		inv = self.inv
+		gamma_reg = self.gamma_reg
+		A_inv = self.A_inv
+		lam = self.forgetting_factor
+		H_t = tf.transpose(H)
+		I_k = tf.eye(tf.shape(H)[0])
+
+		A0 = tf.add(tf.scalar_mul(1.0/gamma_reg,tf.eye(self.N_hid)),tf.matmul(H_t,H))
+		A0_inv = inv(A0)
 
 		# # High-order regularization, not oringinal
 		if self.regularization == 'HR':
-			H_dim = self.H.shape
-			H_tH = tf.matmul(H_t , self.H)
+			H_dim = H.shape
+			H_tH = tf.matmul(H_t , H)
 			vas, ves = tf.linalg.eigh(H_tH) # non-decreasing order
-			Rnn = tf.zeros_like(tf.matmul(H_t , self.H))
+			Rnn = tf.zeros_like(tf.matmul(H_t , H))
 			for i in range(H_dim[1]-1, H_dim[1], 1) :
 				miu= abs(vas[0]**2 + vas[0]* vas[H_dim[1]-1])**0.5
 				lamn_1 = vas[H_dim[1]-2]
@@ -253,28 +551,323 @@ class ELMNet(SingleLayerNetwork):
 			# correct_bias_w = True
 			# H_inv_a = hrm(H, Rnn, k, w, correct_bias_w) @ H_t # error
 			# # H_inv_a = tf.matrix_inverse(tf.add(H_tH, self.Rnn)) # sometimes not invertable, add a very small regularization parameters here.
-			H_inv_a = tf.matrix_inverse(tf.add(tf.scalar_mul(1.0/gamma_reg,tf.eye(self.N_hid)), tf.add(H_tH, Rnn)))
+			H_inv_a = inv(tf.add(tf.scalar_mul(1.0/gamma_reg,tf.eye(self.N_hid)), tf.add(H_tH, Rnn)))
 			A0_inv = tf.matmul(H_inv_a, tf.add(tf.eye(int(H_dim[1])), tf.matmul(Rnn , H_inv_a))) # HR, k=1
 			# A0_inv = tf.matmul(A0_inv, tf.matmul(tf.scalar_mul(1.0/gamma_reg,tf.eye(self.N_hid)), A0_inv)) # Using orignal but HR
 
-		W0 = tf.matmul(A0_inv,tf.matmul(H_t,self.T))
-		self.initModel = (self.W.assign(W0), A_inv.assign(A0_inv))
+		W0 = tf.matmul(A0_inv,tf.matmul(H_t,T))
+		initModel = (self.W.assign(W0), A_inv.assign(A0_inv))
+
+		dA = tf.matmul(H_t,H)
+		if lam != 1.0:
+			# Directional forgetting, A += H^T D H with D = I - (1-lam) M^-1 and M = H A_inv H^T.
+			# In the eigenbasis of M the Woodbury gains for A_inv and W are diagonal
+			AH_t = tf.matmul(A_inv,H_t)
+			m, U = tf.linalg.eigh(tf.matmul(H,AH_t))
+			excited = tf.greater(m,1e-6*tf.reduce_max(m)) # skips directions with no new information, e.g. repeated rows
+			m_ex = tf.where(excited,m,tf.ones_like(m))
+			c_A = tf.where(excited,(m_ex-1.0+lam)/(m_ex*(m_ex+lam)),tf.zeros_like(m))
+			d = tf.where(excited,1.0-(1.0-lam)/m_ex,tf.zeros_like(m))
+			V = tf.matmul(U,AH_t,transpose_a=True,transpose_b=True)
+			A_new = tf.subtract(A_inv,tf.matmul(V,tf.multiply(tf.expand_dims(c_A,1),V),transpose_a=True))
+			E = tf.matmul(U,tf.subtract(T,tf.matmul(H,self.W)),transpose_a=True)
+			W_new = tf.add(self.W,tf.matmul(V,tf.divide(E,tf.expand_dims(m+lam,1)),transpose_a=True))
+			HU = tf.matmul(H_t,U)
+			dA = tf.matmul(tf.multiply(HU,d),HU,transpose_b=True)
+		elif self.update_mode == 'cholesky':
+			AH_t = tf.matmul(A_inv,H_t)
+			L_k = tf.linalg.cholesky(tf.add(tf.matmul(H,AH_t),I_k))
+			V = tf.linalg.triangular_solve(L_k,tf.transpose(AH_t),lower=True)
+			E = tf.linalg.triangular_solve(L_k,tf.subtract(T,tf.matmul(H,self.W)),lower=True)
+			W_new = tf.add(self.W,tf.matmul(V,E,transpose_a=True))
+			A_new = tf.subtract(A_inv,tf.matmul(V,V,transpose_a=True))
+		else:
+			K1 = tf.add(tf.matmul(H,tf.matmul(A_inv,H_t)),I_k)
+			K_t = tf.subtract(tf.eye(self.N_hid),
+				tf.matmul(A_inv,tf.matmul(H_t,tf.matmul(tf.matrix_inverse(K1),H))))
+			W_new = tf.add(tf.matmul(K_t,self.W),
+				tf.matmul(tf.matmul(K_t,A_inv),tf.matmul(H_t,T)))
+			A_new = tf.matmul(K_t,A_inv)
+		if self.regularization == 'HR_step':
+			HT_0, hr_assign_0 = self.hr_ops(tf.matmul(H_t,H), A0_inv, tf.matmul(H_t,T))
+			initModel = (self.W.assign(HT_0), A_inv.assign(A0_inv),
+						 self.S.assign(tf.matmul(H_t,H)), hr_assign_0)
+			S_new = tf.add(self.S,dA)
+			HE, hr_assign = self.hr_ops(S_new, A_new,
+				tf.matmul(H_t,tf.subtract(T,tf.matmul(H,self.W))))
+			W_new = tf.add(self.W,HE)
+			with tf.control_dependencies([W_new, A_new, hr_assign]):
+				updateModel = (self.W.assign(W_new), A_inv.assign(A_new), self.S.assign(S_new))
+		else:
+			with tf.control_dependencies([W_new, A_new]):
+				updateModel = (self.W.assign(W_new), A_inv.assign(A_new))
+
+		if self.A is not None:
+			A0 = A0 if self.regularization != 'HR' else inv(A0_inv)
+			initModel += (self.A.assign(A0),)
+			updateModel += (self.A.assign_add(dA),)
+		return initModel, updateModel
+
+	def build_train_step(self, target, gamma):
+		"""Build `initStep` and `trainStep`, computing targets with `target` in the graph"""
+		self.s_batch = self.prep_state
+		self.s_next = tf.placeholder(shape=[None,self.N_hid],dtype=tf.float32)
+		Q_target = self.Q_targets(self.Q_est,tf.matmul(self.s_next,target.W),gamma)
+		# Weighted least squares: each row of H and T is scaled by sqrt(w)
+		w_sqrt = tf.expand_dims(tf.sqrt(self.w_batch),1)
+		self.initStep, self.trainStep = self.update_ops(tf.multiply(w_sqrt,self.prep_state),
+														tf.multiply(w_sqrt,Q_target))
+
+	def run_update(self, init_op, update_op, feed_dict):
+		"""Run init_op on the first update, otherwise update_op and any corrections"""
+		if self.first:
+			self.first = False
+			return self.sess.run(init_op,feed_dict=feed_dict)
+		out = self.sess.run(update_op,feed_dict=feed_dict)
+		self.n_update += 1
+		if self.refactor_steps and self.n_update%self.refactor_steps == 0:
+			self.sess.run(self.refactorModel)
+		elif self.symmetrise_steps and self.n_update%self.symmetrise_steps == 0:
+			self.sess.run(self.symmetriseModel)
+		return out
+
+	def update(self, H, T):
+		"""Updates based on preprocessed states and target action values"""
+		self.run_update(self.initModel,self.updateModel,{self.H:H,self.T:T})
+
+	def fit(self, H, T):
+		"""
+		Solve the output weights in one regularised least-squares pass over a dataset
+
+		Sets W = (I/gamma_reg + H^T H)^-1 H^T T and A_inv to the inverse used, as
+		the first update does for its minibatch, so later updates continue
+		recursively from the fitted weights.
+		"""
+		self.sess.run(self.initModel,feed_dict={self.H:H,self.T:T})
+		self.first = False
+		self.n_update = 0
+
+	def train_step(self, s, a, r, s_next, done, w=None):
+		"""Run the fused Q-learning update on a minibatch of preprocessed transitions, returning TD errors"""
+		return self.run_update((self.initStep,self.td_error),(self.trainStep,self.td_error),
+							   self.train_feed(s, a, r, s_next, done, w))[1]
+
+class EnsembleELMNet(ELMNet):
+	"""
+	An ensemble of ELMNet output heads sharing one random hidden layer
+
+	The hidden layer is evaluated once per state and all M heads, each with its
+	own output weights and A_inv, are updated by one batched LS-IELM operation.
+	Each head is updated on a bootstrap resample of every minibatch, keeping
+	each row with probability `bootstrap_p`, so the heads disagree where data
+	is scarce. `Q_est` is the mean over heads, or a single head if `head` is
+	set, e.g. a different head each episode for bootstrapped exploration.
 
-		K1 = tf.add(tf.matmul(self.H,tf.matmul(A_inv,H_t)),tf.eye(self.k))
-		K_t = tf.subtract(tf.eye(self.N_hid),
-			tf.matmul(A_inv,tf.matmul(H_t,tf.matmul(tf.matrix_inverse(K1),self.H))))
-		W_new = tf.add(tf.matmul(K_t,self.W),
-			tf.matmul(tf.matmul(K_t,A_inv),tf.matmul(H_t,self.T)))
-		A_new = tf.matmul(K_t,A_inv)
-		self.updateModel = (self.W.assign(W_new), A_inv.assign(A_new))
+	The fused update computes targets for each head from the matching head of
+	the target network; the separate update moves every head towards the same
+	targets. Regularization and forgetting are not supported.
+
+	...
+
+	Attributes
+	----------
+	n_heads : int
+		Number of output heads M
+	bootstrap_p : float
+		Probability each transition is used to update each head
+	W : tf.Variable
+		Output weights of every head, shape MxNxA
+	A_inv : tf.Variable
+		Inverse of the regularised hidden layer autocorrelation of every head, shape MxNxN
+	Q_heads : tf.Tensor
+		Estimated action values of every head, shape Mx?xA
+	head_weights : tf.Tensor
+		Placeholder for the weight of each head in `Q_est`, default 1/M
+	head : int or None
+		Head used by `Q_predict`, the mean over heads if None
+	"""
+	def __init__(self, state_size, action_size, n_heads=5, bootstrap_p=0.5,
+				 gamma_reg=0.001, minibatch_size=5, update_mode='inverse', symmetrise_steps=None,
+				 W_mag=0.1, **kwargs):
+		"""
+		Parameters
+		----------
+		state_size, action_size : int
+			Size of the environment state space and action space
+		n_heads : int, optional
+			Number of output heads, default 5
+		bootstrap_p : float, optional
+			Probability in (0, 1] of updating each head with each transition, default 0.5
+		gamma_reg : float, optional
+			LS-IELM regularisation parameter
+		minibatch_size : int, optional
+			Size of minibatches for updating
+		update_mode : {'inverse', 'cholesky'}, optional
+			Solve the kxk innovation system of each head directly or by its Cholesky
+			factor, default 'inverse'
+		symmetrise_steps : int, optional
+			Number of updates between re-symmetrising A_inv, default never
+		W_mag : float, optional
+			Initialisation magnitude of the output weights, default 0.1
+		**kwargs
+			Additional keyword arguments passed to `SingleLayerNetwork`
+
+		Raises
+		------
+		ValueError
+			If an invalid update mode or bootstrap probability is passed
+		"""
+		SingleLayerNetwork.__init__(self, state_size, action_size, W_mag=W_mag, **kwargs)
+		if update_mode not in ('inverse','cholesky'):
+			raise ValueError('Invalid update mode: \'{}\''.format(update_mode))
+		if not 0.0 < bootstrap_p <= 1.0:
+			raise ValueError('Invalid bootstrap probability: {}'.format(bootstrap_p))
+		self.n_heads = int(n_heads)
+		self.bootstrap_p = bootstrap_p
+		self.gamma_reg = gamma_reg
+		self.update_mode = update_mode
+		self.regularization = None
+		self.forgetting_factor = 1.0
+		self.refactor_steps = None
+		self.symmetrise_steps = symmetrise_steps
+		self.A = self.refactorModel = self.S = self.hr_vecs = None
+
+		# Each head has its own output weights in place of those of SingleLayerNetwork
+		M = self.n_heads
+		self.W = tf.Variable(tf.random_uniform([M,self.N_hid,action_size],0,W_mag))
+		self.head_weights = tf.placeholder_with_default(tf.fill([M],1.0/M),shape=[M])
+		self.Q_heads = self.heads_graph(self.act,self.W)
+		self.Q_est = tf.tensordot(self.head_weights,self.Q_heads,1)
+		self.params['W'] = self.W
+		self.new_params['W'] = tf.placeholder(shape=[None,None,None],dtype=tf.float32)
+		self.p_assign[0] = self.W.assign(self.new_params['W'])
+		self.head = None
+
+		self.k = int(minibatch_size)
+		self.prep_state = self.act
+		self.H = tf.placeholder(shape=[None,self.N_hid],dtype=tf.float32)
+		self.T = tf.placeholder(shape=[None,action_size],dtype=tf.float32)
+		self.A_inv = tf.Variable(tf.random_uniform([M,self.N_hid,self.N_hid],0,1))
+		self.symmetriseModel = self.A_inv.assign(
+			tf.scalar_mul(0.5,tf.add(self.A_inv,tf.linalg.matrix_transpose(self.A_inv))))
+
+		self.initModel, self.updateModel = self.update_ops(self.H, self.T)
+		self.initStep = None
 
 		self.first = True
+		self.n_update = 0
 		self.var_init()
 
-	def update(self, H, T):
-		"""Updates based on preprocessed states and target action values"""
-		if self.first:
-			self.sess.run(self.initModel,feed_dict={self.H:H,self.T:T})
-			self.first = False
+	@staticmethod
+	def heads_graph(act, W):
+		"""Return action-values of every head for hidden layer outputs `act`, shape Mx?xA"""
+		return tf.einsum('bn,mna->mba',act,W)
+
+	def Q_graph(self, s):
+		"""Return a tensor of action-values averaged over heads for states `s`"""
+		return tf.reduce_mean(self.heads_graph(self.act_fn(tf.add(tf.matmul(s,self.w_in),self.b_in)),self.W),0)
+
+	def inv(self, M):
+		"""Inverse of each symmetric positive definite NxN matrix in M"""
+		I_N = tf.eye(self.N_hid,batch_shape=[self.n_heads])
+		if self.update_mode == 'cholesky':
+			return tf.linalg.cholesky_solve(tf.linalg.cholesky(M),I_N)
+		return tf.linalg.solve(M,I_N)
+
+	def update_ops(self, H, T):
+		"""
+		Build batched LS-IELM assignment operations updating every head on a bootstrap resample
+
+		...
+
+		Parameters
+		----------
+		H : tf.Tensor
+			Minibatch of preprocessed states, shape kxN
+		T : tf.Tensor
+			Target action-values, shape kxA shared by all heads or MxkxA
+
+		Returns
+		-------
+		initModel, updateModel : tuple of tf.Tensor
+			Assignment operations for initialising and updating the weights
+		"""
+		M, N = self.n_heads, self.N_hid
+		k = tf.shape(H)[0]
+		# Rows left out of a head's resample are zeroed, which leaves that head unchanged by them
+		mask = tf.cast(tf.less(tf.random_uniform([M,k]),self.bootstrap_p),tf.float32)
+		H_m = tf.multiply(tf.expand_dims(mask,2),H)
+		T_m = tf.multiply(tf.expand_dims(mask,2),T)
+		H_t = tf.linalg.matrix_transpose(H_m)
+		A_inv = self.A_inv
+
+		A0 = tf.add(tf.scalar_mul(1.0/self.gamma_reg,tf.eye(N)),tf.matmul(H_t,H_m))
+		A0_inv = self.inv(A0)
+		initModel = (self.W.assign(tf.matmul(A0_inv,tf.matmul(H_t,T_m))), A_inv.assign(A0_inv))
+
+		AH_t = tf.matmul(A_inv,H_t)
+		K1 = tf.add(tf.matmul(H_m,AH_t),tf.eye(k,batch_shape=[M]))
+		E = tf.subtract(T_m,tf.matmul(H_m,self.W))
+		if self.update_mode == 'cholesky':
+			L_k = tf.linalg.cholesky(K1)
+			V = tf.linalg.triangular_solve(L_k,tf.linalg.matrix_transpose(AH_t),lower=True)
+			W_new = tf.add(self.W,tf.matmul(V,tf.linalg.triangular_solve(L_k,E,lower=True),transpose_a=True))
+			A_new = tf.subtract(A_inv,tf.matmul(V,V,transpose_a=True))
+		else:
+			W_new = tf.add(self.W,tf.matmul(AH_t,tf.linalg.solve(K1,E)))
+			A_new = tf.subtract(A_inv,tf.matmul(AH_t,tf.linalg.solve(K1,tf.linalg.matrix_transpose(AH_t))))
+		with tf.control_dependencies([W_new, A_new]):
+			updateModel = (self.W.assign(W_new), A_inv.assign(A_new))
+		return initModel, updateModel
+
+	def build_train_step(self, target, gamma):
+		"""Build `initStep` and `trainStep`, computing targets for each head with the same head of `target`"""
+		self.s_batch = self.prep_state
+		self.s_next = tf.placeholder(shape=[None,self.N_hid],dtype=tf.float32)
+		Q_target = self.Q_targets(self.Q_heads,self.heads_graph(self.s_next,target.W),gamma)
+		self.td_error = tf.reduce_mean(self.td_error,0)
+		w_sqrt = tf.expand_dims(tf.sqrt(self.w_batch),1)
+		self.initStep, self.trainStep = self.update_ops(tf.multiply(w_sqrt,self.prep_state),
+														tf.multiply(w_sqrt,Q_target))
+
+	def sample_head(self, rand_state=np.random):
+		"""Select a random head to be used by `Q_predict`, e.g. at the start of each episode"""
+		self.head = rand_state.randint(self.n_heads)
+
+	def feed_heads(self, feed_dict):
+		"""Add the weights selecting `head` to feed_dict if a single head is used"""
+		if self.head is not None:
+			feed_dict[self.head_weights] = np.eye(self.n_heads,dtype=np.float32)[self.head]
+		return feed_dict
+
+	def Q_predict(self, s=None, s_prep=None):
+		"""Return predicted action-values for the state from `head`, or the mean over heads"""
+		if s is not None:
+			return self.sess.run(self.Q_est,feed_dict=self.feed_heads({self.s_input:s}))
+		elif s_prep is not None:
+			return self.sess.run(self.Q_est,feed_dict=self.feed_heads({self.prep_state:s_prep}))
 		else:
-			self.sess.run(self.updateModel,feed_dict={self.H:H,self.T:T})
+			return []
+
+	def vote(self, s=None, s_prep=None):
+		"""
+		Return the action chosen by the most heads for each state, ties going to the lowest action
+
+		...
+
+		Parameters
+		----------
+		s : array-like, optional
+			States in their `normal` form
+		s_prep : array_like, optional
+			States in a preprocessed form defined by `prep_state`
+
+		Returns
+		-------
+		np.ndarray of int
+			Action with the most votes for each state
+		"""
+		feed_dict = {self.s_input:s} if s is not None else {self.prep_state:s_prep}
+		Q_heads = self.sess.run(self.Q_heads,feed_dict=feed_dict)
+		votes = np.apply_along_axis(np.bincount,0,np.argmax(Q_heads,2),minlength=self.action_size)
+		return np.argmax(votes,0)
@@ -0,0 +1,458 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/. */
+# ------ Copyright (C) 2020 University of Strathclyde and Author ------
+# ---------------------- Author: Callum Wilson ------------------------
+# --------------- e-mail: callum.j.wilson@strath.ac.uk ----------------
+"""Classes containing numpy implementations of Q-Networks"""
+
+import numpy as np
+import numpy.random as rand
+
+# scipy.linalg is imported on constructing the first NumpyELMNet
+cho_factor = cho_solve = solve_triangular = None
+
+def _import_linalg():
+	"""Import the scipy.linalg functions used by NumpyELMNet"""
+	global cho_factor, cho_solve, solve_triangular
+	if solve_triangular is None:
+		from scipy.linalg import cho_factor, cho_solve, solve_triangular
+
+
+_activations = {'tanh': np.tanh,
+			   'sigmoid': lambda x: 1.0/(1.0+np.exp(-x)),
+			   'relu': lambda x: np.maximum(x,0.0),
+			   'linear': lambda x: x}
+
+
+class NumpySingleLayerNetwork(object):
+	"""
+	A Q-Network with a single hidden layer, implemented in numpy
+
+	Mirrors `networks.SingleLayerNetwork` but holds all parameters as float64
+	arrays, avoiding the overhead of a tensorflow session call for each
+	prediction and update.
+
+	...
+
+	Attributes
+	----------
+	N_hid : int
+		Number of hidden nodes
+	w_in : np.ndarray
+		Input weights, shape SxN
+	b_in : np.ndarray
+		Neuron biases, shape 1xN
+	W : np.ndarray
+		Output weights, shape NxA
+	act_fn : function
+		Neuron activation function
+	prep_state : function or None
+		If states are 'preprocessed' in memory, this computes the preprocessed state
+	target : bool
+		Indicates if network is a target network
+	rand_state : np.random.RandomState
+		Random state for initialising parameters
+	source : NumpySingleLayerNetwork or None
+		Network whose parameters are copied by `sync`
+	tau : float or None
+		Soft update rate used by `sync`
+	"""
+	def __init__(self, state_size, action_size,
+				N_hid=None, activation_function='tanh',
+				w_mag=0.1, b_mag=0.0, W_mag=0.1,
+				is_target=False, seed=None, **kwargs):
+		"""
+		Parameters
+		----------
+		state_size, action_size : int
+			Size of the environment state space and action space
+		N_hid : int, optional
+			Number of hidden nodes, default N_hid = 2*action_size
+		activation_function : str, optional
+			Neuron activation function, default tanh
+		w_mag, b_mag, W_mag : float, optional
+			Initialisation magnitude for each set of parameters, default 0.1, 0.0, 0.1
+		is_target : bool, optional
+			Whether the network is a target network which does not update, default False
+		seed : int, optional
+			Seed for initialising parameters, default None
+
+		Raises
+		------
+		ValueError
+			If an invalid activation function is passed
+		"""
+		try:
+			self.act_fn = _activations[activation_function]
+		except KeyError:
+			raise ValueError('Invalid activation function: \'{}\''.format(activation_function))
+		self.N_hid = 2*action_size if N_hid is None else N_hid
+		self.rand_state = rand.RandomState(seed)
+		self.w_in = self.rand_state.uniform(0,w_mag,(state_size,self.N_hid))
+		self.b_in = self.rand_state.uniform(0,b_mag,(1,self.N_hid))
+		self.W = self.rand_state.uniform(0,W_mag,(self.N_hid,action_size))
+		self.prep_state = None
+		self.target = is_target
+		self.source = None
+		self.tau = None
+
+	def var_init(self):
+		"""Parameters are initialised on construction, kept for compatibility"""
+		pass
+
+	def assign_params(self,p_new):
+		"""Assign new values to updatable parameters"""
+		self.W[...] = p_new['W']
+		self.w_in[...] = p_new['w']
+		self.b_in[...] = p_new['b']
+
+	def get_params(self):
+		"""Return current values of updatable parameters"""
+		return {'W':self.W.copy(), 'w':self.w_in.copy(), 'b':self.b_in.copy()}
+
+	def build_sync(self, source, tau=None):
+		"""Set the network whose parameters are copied by `sync`"""
+		self.source = source
+		self.tau = tau
+
+	def sync(self, soft=False):
+		"""Copy parameters from the source network in place, softly if `soft`"""
+		for p, p_s in ((self.W,self.source.W),(self.w_in,self.source.w_in),(self.b_in,self.source.b_in)):
+			if soft:
+				p *= 1.0-self.tau
+				p += self.tau*p_s
+			else:
+				np.copyto(p,p_s)
+
+	def preprocess(self, s):
+		"""Return the output of each neuron for states `s`"""
+		return self.act_fn(np.dot(s,self.w_in)+self.b_in)
+
+	def Q_predict(self, s=None, s_prep=None):
+		"""
+		Return predicted action-values for the state
+
+		...
+
+		Parameters
+		----------
+		s : array-like, optional
+			State in its `normal` form
+		s_prep : array_like, optional
+			State in a preprocessed form defined by `prep_state`
+
+		Returns
+		-------
+		array-like
+			Predicted action values for the state, empty if `s` and `s_prep` are `None`
+		"""
+		if s is not None:
+			return np.dot(self.preprocess(s),self.W)
+		elif s_prep is not None:
+			return np.dot(s_prep,self.W)
+		else:
+			return []
+
+	def update(self, *args):
+		"""Method for updating network parameters"""
+		pass
+
+	def close(self):
+		"""No session to close, kept for compatibility"""
+		pass
+
+class NumpyELMNet(NumpySingleLayerNetwork):
+	"""
+	A Q-Network which uses ELM inspired updates, implemented in numpy
+
+	Takes the same arguments as `networks.ELMNet`. The LS-IELM update is
+	applied as a rank-k Woodbury update performed in place on preallocated
+	buffers, so no arrays of size NxN are allocated after construction.
+
+	...
+
+	Attributes
+	----------
+	k : int
+		Default size of minibatches for updating, any number of rows can be passed
+	gamma_reg : float
+		LS-IELM regularisation parameter
+	regularization : {None, 'HR', 'HR_step'}
+		Method of regularisation used for the initial weights or at every update
+	A_inv : np.ndarray
+		Inverse of the regularised hidden layer autocorrelation, shape NxN
+	A : np.ndarray or None
+		Regularised hidden layer autocorrelation, only tracked for refactorisation
+	S : np.ndarray or None
+		Sum of H^T H over all updates, only tracked for 'HR_step' regularization
+	hr_vecs : np.ndarray
+		Estimates of the eigenvectors of S for its largest, smallest and second
+		largest eigenvalues, shape 3xN
+	forgetting_factor : float
+		Fraction of the information along each newly sampled direction kept at each
+		update, 1 for no forgetting
+	first : bool
+		Used to indicate the first update to initialise weights
+	n_update : int
+		Number of updates since initialising the weights
+	"""
+	def __init__(self, state_size, action_size,
+				 gamma_reg=0.001, minibatch_size=5, regularization=None,
+				 update_mode='inverse', refactor_steps=None, symmetrise_steps=None,
+				 hr_krylov=3, forgetting_factor=1.0, **kwargs):
+		"""
+		Parameters
+		----------
+		state_size, action_size : int
+			Size of the environment state space and action space
+		gamma_reg : float, optional
+			LS-IELM regularisation parameter
+		minibatch_size : int, optional
+			Size of minibatches for updating
+		regularization : {None, 'HR', 'HR_step'}, optional
+			Specifies which method of regularization to use
+		update_mode : {'inverse', 'cholesky'}, optional
+			'inverse' solves the kxk innovation system directly, 'cholesky' downdates
+			A_inv using its Cholesky factor and triangular solves, default 'inverse'
+		refactor_steps : int, optional
+			Number of updates between recomputing A_inv from a Cholesky factor of the
+			tracked autocorrelation matrix, default never
+		symmetrise_steps : int, optional
+			Number of updates between re-symmetrising A_inv, default never
+		hr_krylov : int, optional
+			Number of blocks in the Krylov basis [V, S V, S^2 V, ...] used to refine the
+			eigenvectors at each update for 'HR_step', default 3
+		forgetting_factor : float, optional
+			Factor in (0, 1] for recursive least squares with directional forgetting,
+			only with update mode 'inverse', default 1
+		**kwargs
+			Additional keyword arguments passed to `NumpySingleLayerNetwork`
+
+		Raises
+		------
+		ValueError
+			If an invalid update mode, regularization or forgetting factor is passed,
+			or a forgetting factor with update mode 'cholesky'
+		"""
+		super().__init__(state_size, action_size, **kwargs)
+		_import_linalg()
+		if update_mode not in ('inverse','cholesky'):
+			raise ValueError('Invalid update mode: \'{}\''.format(update_mode))
+		if regularization not in (None,'HR','HR_step'):
+			raise ValueError('Invalid regularization: \'{}\''.format(regularization))
+		if not 0.0 < forgetting_factor <= 1.0:
+			raise ValueError('Invalid forgetting factor: {}'.format(forgetting_factor))
+		if forgetting_factor != 1.0 and update_mode == 'cholesky':
+			raise ValueError('A forgetting factor requires update mode \'inverse\', not \'cholesky\'')
+		self.regularization = regularization
+		self.forgetting_factor = forgetting_factor
+		self.gamma_reg = gamma_reg
+		self.update_mode = update_mode
+		self.refactor_steps = refactor_steps
+		self.symmetrise_steps = symmetrise_steps
+		self.hr_krylov = int(hr_krylov)
+		self.k = int(minibatch_size)
+		self.prep_state = self.preprocess
+		self.first = True
+		self.n_update = 0
+		self.A = None
+		self.S = None
+		if self.target:
+			return
+
+		N, A = self.N_hid, action_size
+		self.A_inv = np.zeros((N,N))
+		self._eye_N = np.eye(N)
+		self._batch_buffers = {}
+		self._batch_buffer(self.k)
+		self._dA = np.empty((N,N))
+		self._dW = np.empty((N,A))
+		if self.refactor_steps:
+			self.A = np.zeros((N,N))
+		if self.regularization == 'HR_step':
+			self.S = np.zeros((N,N))
+			self.hr_vecs = self.rand_state.uniform(-1,1,(3,N))
+			self.hr_vecs /= np.linalg.norm(self.hr_vecs,axis=1,keepdims=True)
+
+	def _batch_buffer(self, k):
+		"""Buffers (AH_t, K1, G, E) for updating with k rows, cached for each size"""
+		try:
+			return self._batch_buffers[k]
+		except KeyError:
+			N, A = self.W.shape
+			buffers = (np.empty((N,k)), np.empty((k,k)), np.empty((N,k)), np.empty((k,A)))
+			self._batch_buffers[k] = buffers
+			return buffers
+
+	def _inv(self, M):
+		"""Inverse of a symmetric positive definite matrix"""
+		if self.update_mode == 'cholesky':
+			return cho_solve(cho_factor(M,lower=True),self._eye_N)
+		return np.linalg.inv(M)
+
+	def hr_product(self, X):
+		"""
+		Multiply X by the 'HR_step' regularised inverse, updating the eigenvector estimates
+
+		Same as `networks.ELMNet.hr_ops`: the eigenpairs of S for its largest,
+		smallest and second largest eigenvalues are refined by
+		Rayleigh-Ritz on the block Krylov basis [V, S V, ...] of the previous
+		estimates V, then with Rnn = mu*u*u^T on the leading eigenvector u and
+		P = (A_inv^-1 + Rnn)^-1, returns (P + mu*(P u)(P u)^T) X in O(N^2) operations.
+		"""
+		S = self.S
+		K = [self.hr_vecs.T]
+		for _ in range(self.hr_krylov-1):
+			K.append(np.dot(S,K[-1]))
+		Q = np.linalg.qr(np.hstack(K))[0]
+		lam, Y = np.linalg.eigh(np.dot(Q.T,np.dot(S,Q)))
+		self.hr_vecs[...] = np.dot(Q,Y[:,[-1,0,-2]]).T
+		u = self.hr_vecs[0]
+		lam_max, lam_min, lam_n_1 = lam[-1], lam[0], lam[-2]
+		miu = max(min(np.sqrt(abs(lam_min**2 + lam_min*lam_max)), lam_n_1), 0.0) # hr, k=1, opt
+
+		Au = np.dot(self.A_inv,u)
+		uAu = np.dot(u,Au)
+		c = miu/(1.0 + miu*uAu)
+		Pu = (1.0 - c*uAu)*Au
+		return np.dot(self.A_inv,X) - c*np.outer(Au,np.dot(Au,X)) + miu*np.outer(Pu,np.dot(Pu,X))
+
+	def initModel(self, H, T):
+		"""Initialise the weights and A_inv from the first minibatch"""
+		H_tH = np.dot(H.T,H)
+		A0 = H_tH + self._eye_N/self.gamma_reg
+		if self.regularization == 'HR':
+			Rnn = np.linalg.eigvalsh(H_tH)[-1]*self._eye_N # largest lamda I
+			H_inv_a = self._inv(A0 + Rnn)
+			self.A_inv[...] = np.dot(H_inv_a, self._eye_N + np.dot(Rnn,H_inv_a))
+			if self.A is not None:
+				self.A[...] = self._inv(self.A_inv)
+		else:
+			self.A_inv[...] = self._inv(A0)
+			if self.A is not None:
+				self.A[...] = A0
+		if self.regularization == 'HR_step':
+			self.S[...] = H_tH
+			self.W[...] = self.hr_product(np.dot(H.T,T))
+			return
+		np.dot(self.A_inv, np.dot(H.T,T), out=self.W)
+
+	def updateModel(self, H, T):
+		"""
+		Rank-k Woodbury update of A_inv and the output weights
+
+		Equivalent to the update in `networks.ELMNet`, rearranged as
+		G = A_inv H^T (H A_inv H^T + I)^-1, A_inv -= G H A_inv,
+		W += G (T - H W), for any number of rows k in H and T
+		"""
+		k = len(H)
+		AH_t, K1, G, E = self._batch_buffer(k)
+		np.dot(self.A_inv, H.T, out=AH_t)
+		np.dot(H, AH_t, out=K1)
+		K1[np.diag_indices(k)] += 1.0
+		np.dot(H, self.W, out=E)
+		np.subtract(T, E, out=E)
+		dA = None
+		if self.forgetting_factor != 1.0:
+			dA = self.forgetting_update(H, AH_t, K1, E)
+		elif self.update_mode == 'cholesky':
+			# With K1 = L L^T and V = L^-1 H A_inv, A_inv -= V^T V stays symmetric
+			L_k = np.linalg.cholesky(K1)
+			V = solve_triangular(L_k, AH_t.T, lower=True)
+			np.dot(V.T, V, out=self._dA)
+			np.dot(V.T, solve_triangular(L_k, E, lower=True), out=self._dW)
+		else:
+			G[...] = np.linalg.solve(K1, AH_t.T).T
+			np.dot(G, AH_t.T, out=self._dA)
+			np.dot(G, E, out=self._dW)
+		self.A_inv -= self._dA
+		if dA is None and (self.S is not None or self.A is not None):
+			dA = np.dot(H.T,H)
+		if self.S is not None:
+			self.S += dA
+			self.W += self.hr_product(np.dot(H.T,E))
+		else:
+			self.W += self._dW
+		if self.A is not None:
+			self.A += dA
+
+	def forgetting_update(self, H, AH_t, K1, E):
+		"""
+		Set the changes in A_inv and W for a rank-k update with directional forgetting
+
+		Same as `networks.ELMNet`: A += H^T D H with D = I - (1-lam) M^-1 and
+		M = H A_inv H^T, so only information along the rows of H is discounted.
+		With M = U diag(m) U^T, the Woodbury gains are diagonal in U, giving
+		A_inv -= V^T diag((m-1+lam)/(m(m+lam))) V and W += V^T diag(1/(m+lam)) U^T E
+		with V = U^T H A_inv.
+
+		...
+
+		Parameters
+		----------
+		H : np.ndarray
+			Minibatch of preprocessed states, shape kxN
+		AH_t : np.ndarray
+			A_inv H^T, shape Nxk
+		K1 : np.ndarray
+			H A_inv H^T + I, shape kxk
+		E : np.ndarray
+			Errors T - H W, shape kxA
+
+		Returns
+		-------
+		np.ndarray
+			Change in the autocorrelation, H^T D H
+		"""
+		lam = self.forgetting_factor
+		m, U = np.linalg.eigh(K1)
+		m -= 1.0
+		excited = m > 1e-10*m.max() # skips directions with no new information, e.g. repeated rows
+		m_ex = np.where(excited, m, 1.0)
+		c_A = np.where(excited, (m_ex-1.0+lam)/(m_ex*(m_ex+lam)), 0.0)
+		d = np.where(excited, 1.0-(1.0-lam)/m_ex, 0.0)
+		V = np.dot(U.T, AH_t.T)
+		np.dot(V.T, c_A[:,np.newaxis]*V, out=self._dA)
+		np.dot(V.T, np.dot(U.T,E)/(m+lam)[:,np.newaxis], out=self._dW)
+		HU = np.dot(H.T, U)
+		return np.dot(HU, d[:,np.newaxis]*HU.T)
+
+	def refactorModel(self):
+		"""Recompute A_inv from a Cholesky factor of the tracked autocorrelation"""
+		self.A_inv[...] = cho_solve(cho_factor(self.A,lower=True),self._eye_N)
+
+	def symmetriseModel(self):
+		"""Remove any asymmetry in A_inv accumulated through round-off"""
+		self.A_inv += self.A_inv.T
+		self.A_inv *= 0.5
+
+	def update(self, H, T):
+		"""Updates based on preprocessed states and target action values"""
+		if self.target:
+			return
+		H = np.asarray(H, dtype=np.float64)
+		T = np.asarray(T, dtype=np.float64)
+		if self.first:
+			self.initModel(H, T)
+			self.first = False
+			return
+		self.updateModel(H, T)
+		self.n_update += 1
+		if self.refactor_steps and self.n_update%self.refactor_steps == 0:
+			self.refactorModel()
+		elif self.symmetrise_steps and self.n_update%self.symmetrise_steps == 0:
+			self.symmetriseModel()
+
+	def fit(self, H, T):
+		"""
+		Solve the output weights in one regularised least-squares pass over a dataset
+
+		Same as `networks.ELMNet.fit`: W and A_inv are set as by the first update
+		for a minibatch of every row.
+		"""
+		if self.target:
+			return
+		self.initModel(np.asarray(H, dtype=np.float64), np.asarray(T, dtype=np.float64))
+		self.first = False
+		self.n_update = 0
@@ -0,0 +1,156 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/. */
+# ------ Copyright (C) 2020 University of Strathclyde and Author ------
+# ---------------------- Author: Callum Wilson ------------------------
+# --------------- e-mail: callum.j.wilson@strath.ac.uk ----------------
+"""Frozen numpy policies exported from trained Q-Networks, with no tensorflow dependency"""
+
+import numpy as np
+
+
+_activations = {'tanh': lambda x: np.tanh(x, out=x),
+				'sigmoid': lambda x: np.divide(1.0, np.add(1.0, np.exp(np.negative(x, out=x), out=x), out=x), out=x),
+				'relu': lambda x: np.maximum(x, 0.0, out=x),
+				'linear': lambda x: x}
+
+
+class NumpyPolicy(object):
+	"""
+	Greedy policy of a trained Q-Network evaluated with numpy only
+
+	Weights are held as contiguous float32 arrays and each evaluation is a
+	chain of matmul, bias and in-place activation followed by the output
+	matmul and argmax. Single states reuse preallocated buffers, batches
+	are evaluated in chunks of `chunk_size` rows.
+
+	Provides `action_select` and `action_test` so it can be passed to the
+	demo functions in place of an agent.
+
+	...
+
+	Attributes
+	----------
+	w : list of np.ndarray
+		Input weights to each hidden layer
+	b : list of np.ndarray
+		Biases of each hidden layer, shape 1xN
+	W : np.ndarray
+		Output weights
+	activation_function : str
+		Name of the hidden layer activation function
+	act_fn : function
+		Applies the activation function in place
+	chunk_size : int
+		Maximum number of states evaluated together by the batch methods
+	"""
+	def __init__(self, w, b, W, activation_function='tanh', chunk_size=4096):
+		"""
+		Parameters
+		----------
+		w, b : list of array-like
+			Input weights and biases of each hidden layer
+		W : array-like
+			Output weights
+		activation_function : str, optional
+			Hidden layer activation function, default tanh
+		chunk_size : int, optional
+			Maximum number of states evaluated together, default 4096
+
+		Raises
+		------
+		ValueError
+			If an invalid activation function is passed
+		"""
+		try:
+			self.act_fn = _activations[activation_function]
+		except KeyError:
+			raise ValueError('Invalid activation function: \'{}\''.format(activation_function))
+		self.activation_function = activation_function
+		self.w = [np.ascontiguousarray(w_i, dtype=np.float32) for w_i in w]
+		self.b = [np.ascontiguousarray(np.reshape(b_i,(1,-1)), dtype=np.float32) for b_i in b]
+		self.W = np.ascontiguousarray(W, dtype=np.float32)
+		self.chunk_size = int(chunk_size)
+		self._h = [np.empty((1,w_i.shape[1]), dtype=np.float32) for w_i in self.w]
+		self._q = np.empty((1,self.W.shape[1]), dtype=np.float32)
+
+	def _q_single(self, s):
+		"""Action-values for a single state in the preallocated buffer, overwritten by the next call"""
+		x = np.asarray(s, dtype=np.float32).reshape(1,-1)
+		for w_i, b_i, h in zip(self.w, self.b, self._h):
+			np.dot(x, w_i, out=h)
+			h += b_i
+			x = self.act_fn(h)
+		return np.dot(x, self.W, out=self._q)
+
+	def Q_predict(self, s):
+		"""Return action-values for a single state"""
+		return self._q_single(s).copy()
+
+	def action_select(self, s):
+		"""Return the greedy action for a single state"""
+		return int(np.argmax(self._q_single(s)))
+
+	action_test = action_select
+
+	def Q_batch(self, S):
+		"""Return action-values for a batch of states, one row per state"""
+		S = np.asarray(S, dtype=np.float32)
+		Q = np.empty((len(S),self.W.shape[1]), dtype=np.float32)
+		for i in range(0, len(S), self.chunk_size):
+			x = S[i:i+self.chunk_size]
+			for w_i, b_i in zip(self.w, self.b):
+				h = np.dot(x, w_i)
+				h += b_i
+				x = self.act_fn(h)
+			np.dot(x, self.W, out=Q[i:i+self.chunk_size])
+		return Q
+
+	def action_batch(self, S):
+		"""Return greedy actions for a batch of states"""
+		return np.argmax(self.Q_batch(S), 1)
+
+	def save(self, fname):
+		"""Save the policy to a .npz file which can be read with `load_policy`"""
+		arrays = {'W':self.W, 'activation_function':np.array(self.activation_function)}
+		for i, (w_i, b_i) in enumerate(zip(self.w, self.b)):
+			arrays['w_{}'.format(i)] = w_i
+			arrays['b_{}'.format(i)] = b_i
+		np.savez(fname, **arrays)
+
+def export_policy(params, activation_function='tanh', **kwargs):
+	"""
+	Create a `NumpyPolicy` from the parameters of a trained network
+
+	...
+
+	Parameters
+	----------
+	params : dict
+		Output of `get_params()` with keys 'w', 'b' and 'W', where 'w' and 'b' are
+		arrays for a single hidden layer or lists of arrays for several, and 'W'
+		of an ensemble has one NxA matrix per head, which are averaged
+	activation_function : str, optional
+		Hidden layer activation function used by the network, default tanh
+	**kwargs
+		Additional keyword arguments passed to `NumpyPolicy`
+
+	Returns
+	-------
+	NumpyPolicy
+		Greedy policy of the network
+	"""
+	w, b, W = params['w'], params['b'], np.asarray(params['W'])
+	if not isinstance(w, (list,tuple)):
+		w, b = [w], [b]
+	if W.ndim == 3: # the mean of the heads' action-values is linear in their weights
+		W = W.mean(0)
+	return NumpyPolicy(w, b, W, activation_function, **kwargs)
+
+def load_policy(fname, **kwargs):
+	"""Load a `NumpyPolicy` saved with `NumpyPolicy.save`"""
+	with np.load(fname) as data:
+		n_layer = sum(key.startswith('w_') for key in data.files)
+		w = [data['w_{}'.format(i)] for i in range(n_layer)]
+		b = [data['b_{}'.format(i)] for i in range(n_layer)]
+		return NumpyPolicy(w, b, data['W'], str(data['activation_function']), **kwargs)
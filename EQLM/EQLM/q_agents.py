@@ -6,25 +6,360 @@
 # --------------- e-mail: callum.j.wilson@strath.ac.uk ----------------
 """An agent class which uses Q-Learning to solve problems"""
 
-from . import networks
-from random import sample as _sample
+from . import networks, numpy_networks
+from contextlib import nullcontext
+from time import perf_counter
 import numpy as np
 import numpy.random as rand
 import pdb
 
 
-class ReplayMemory(list):
-	"""A type of list with methods for limiting size and sampling"""
-	def __init__(self,memory_size=None,**kwargs):
-		list.__init__(self,[])
+class _Phase(object):
+	"""Accumulated wall-time and number of calls of one phase, timed as a context manager"""
+	__slots__ = ('time','count','t0')
+
+	def __init__(self):
+		self.time = 0.0
+		self.count = 0
+
+	def __enter__(self):
+		self.t0 = perf_counter()
+
+	def __exit__(self, *exc):
+		self.time += perf_counter() - self.t0
+		self.count += 1
+
+_no_phase = nullcontext()
+
+class PhaseTimer(object):
+	"""
+	Opt-in profiler accumulating wall-time and call counts for each phase of training
+
+	Code is instrumented with `with timer.phase(name):` blocks which must not
+	be nested. While disabled, `phase` returns a shared no-op context so the
+	instrumentation costs one method call per block. Time spent while enabled
+	but outside every phase is reported as 'other'.
+
+	...
+
+	Attributes
+	----------
+	phases : tuple of str
+		Phases timed by `QAgent` and `train_agent`, in reporting order
+	enabled : bool
+		Whether phases are currently timed
+	wall : float
+		Wall-time in s spent enabled, up to the last call to `disable`
+	"""
+	phases = ('env_step','prep_state','Q_predict','memory_add','sample','update','target_sync')
+
+	def __init__(self, enabled=False):
+		self.enabled = False
+		self.reset()
+		if enabled:
+			self.enable()
+
+	def reset(self):
+		"""Clear all accumulated times and counts"""
+		self._phases = {name:_Phase() for name in self.phases}
+		self.wall = 0.0
+		self._t_enable = self._t_lap = perf_counter()
+		self._lap_times = {}
+
+	def enable(self):
+		"""Start timing phases"""
+		if not self.enabled:
+			self.enabled = True
+			self._t_enable = self._t_lap = perf_counter()
+
+	def disable(self):
+		"""Stop timing phases"""
+		if self.enabled:
+			self.enabled = False
+			self.wall += perf_counter() - self._t_enable
+
+	def phase(self, name):
+		"""Return a context manager timing the enclosed block as phase `name`"""
+		if not self.enabled:
+			return _no_phase
+		try:
+			return self._phases[name]
+		except KeyError:
+			self._phases[name] = _Phase()
+			return self._phases[name]
+
+	def total(self):
+		"""Wall-time in s spent enabled"""
+		return self.wall + (perf_counter() - self._t_enable if self.enabled else 0.0)
+
+	def lap(self):
+		"""
+		Return the time in s spent in each phase, and 'other', since the previous lap
+
+		...
+
+		Returns
+		-------
+		dict
+			Time in each phase keyed by name, and the remaining time as 'other'
+		"""
+		t = perf_counter()
+		times = {name:p.time for name, p in self._phases.items()}
+		lap = {name:time-self._lap_times.get(name,0.0) for name, time in times.items()}
+		lap['other'] = t - self._t_lap - sum(lap.values())
+		self._lap_times, self._t_lap = times, t
+		return lap
+
+	def summary(self):
+		"""
+		Return the accumulated times and counts of every phase
+
+		...
+
+		Returns
+		-------
+		dict
+			'phases' dict with the 'time', 'count', 'mean' time per call and
+			'fraction' of the total for each phase, the 'total' wall-time and
+			the 'other' time outside every phase
+		"""
+		total = self.total()
+		phases = {name:{'time':p.time, 'count':p.count, 'mean':p.time/p.count if p.count else 0.0,
+						'fraction':p.time/total if total else 0.0}
+				  for name, p in self._phases.items()}
+		return {'phases':phases, 'total':total,
+				'other':total - sum(p.time for p in self._phases.values())}
+
+class SumTree(object):
+	"""
+	Array-based binary tree in which each node holds the sum of its children
+
+	Leaf i holds the priority of memory slot i, so setting priorities and
+	sampling a slot in proportion to its priority are both O(log n).
+
+	...
+
+	Attributes
+	----------
+	capacity : int
+		Number of leaves, the requested capacity rounded up to a power of 2
+	depth : int
+		Number of levels below the root
+	tree : np.ndarray
+		Node sums with the root at index 1 and leaf i at index capacity+i
+	"""
+	def __init__(self, capacity):
+		self.depth = max(int(capacity)-1,0).bit_length()
+		self.capacity = 1 << self.depth
+		self.tree = np.zeros(2*self.capacity)
+
+	def total(self):
+		"""Sum of all priorities"""
+		return self.tree[1]
+
+	def set(self, i, p):
+		"""Set the priority of leaf `i` to `p`"""
+		i += self.capacity
+		self.tree[i] = p
+		for _ in range(self.depth):
+			i //= 2
+			self.tree[i] = self.tree[2*i] + self.tree[2*i+1]
+
+	def update(self, idx, p):
+		"""Set the priorities of leaves `idx` to `p`, updating each level once for the batch"""
+		idx = np.asarray(idx) + self.capacity
+		self.tree[idx] = p
+		for _ in range(self.depth):
+			idx //= 2
+			self.tree[idx] = self.tree[2*idx] + self.tree[2*idx+1]
+
+	def find(self, u):
+		"""Return the leaves at which the cumulative priority first exceeds each value of `u`"""
+		idx = np.ones(len(u), dtype=np.int64)
+		u = np.array(u, dtype=np.float64)
+		for _ in range(self.depth):
+			idx *= 2
+			p_left = self.tree[idx]
+			right = u >= p_left
+			u -= p_left*right
+			idx += right
+		return idx - self.capacity
+
+	def sample(self, n, rand_state):
+		"""Sample `n` leaves in proportion to their priority, one from each of n equal segments"""
+		u = (np.arange(n) + rand_state.random(n))*(self.total()/n)
+		return self.find(u)
+
+class ReplayMemory(object):
+	"""
+	Circular buffer of state transitions with methods for sampling
+
+	Transitions are stored in preallocated arrays, allocated on the first call
+	to `add` once the state shape is known. If `memory_size` is None the
+	buffer doubles in size whenever it is full, otherwise the oldest
+	transitions are overwritten.
+
+	If `priority_alpha` is given, transitions are sampled in proportion to
+	their priority (|TD error| + priority_eps)^priority_alpha stored in a
+	`SumTree`, new transitions are given the highest priority seen so far,
+	and `sample_weights` holds importance sampling weights for each sample.
+
+	...
+
+	Attributes
+	----------
+	max_len : int or None
+		Maximum number of stored transitions
+	demo_memory : ReplayMemory or None
+		Separate memory of demonstration transitions
+	n_demo : int
+		Number of demonstration transitions in each sampled minibatch
+	rand_state : np.random.Generator
+		Random number generator used for sampling
+	s, s_next : np.ndarray of float32
+		States before and after each transition
+	a : np.ndarray of int
+		Actions
+	r : np.ndarray of float
+		Rewards
+	done : np.ndarray of bool
+		Indicates if the state after the transition is terminal
+	priority_alpha : float or None
+		Priority exponent, None for uniform sampling
+	priority_beta : float
+		Importance sampling exponent
+	priority_eps : float
+		Added to absolute TD errors so no transition has zero priority
+	priorities : SumTree or None
+		Priority of each transition in prioritised mode
+	max_priority : float
+		Priority given to new transitions
+	sample_idx : np.ndarray or None
+		Memory slots of the most recent sample, excluding demonstrations
+	sample_weights : np.ndarray or None
+		Importance sampling weights of the most recent sample, None if uniform
+	"""
+	def __init__(self,memory_size=None,demo_memory=None,n_demo=None,seed=None,
+				 priority_alpha=None,priority_beta=0.4,priority_eps=1e-3,**kwargs):
+		"""
+		Parameters
+		----------
+		memory_size : int, optional
+			Maximum number of stored transitions, default unbounded
+		demo_memory : ReplayMemory, optional
+			Separate memory of demonstration transitions
+		n_demo : int, optional
+			Number of demonstration transitions in each sampled minibatch
+		seed : int, optional
+			Seed for sampling, default None
+		priority_alpha : float, optional
+			If given, sample transitions in proportion to their TD error raised to
+			this power, default uniform sampling
+		priority_beta : float, optional
+			Importance sampling exponent, 0 for no correction, default 0.4
+		priority_eps : float, optional
+			Added to absolute TD errors when setting priorities, default 1e-3
+
+		Raises
+		------
+		ValueError
+			If prioritised sampling is requested without a memory size
+		"""
 		self.max_len = memory_size
+		self.demo_memory = demo_memory
+		self.n_demo = int(n_demo) if n_demo is not None else 0
+		self.rand_state = np.random.default_rng(seed)
+		self.s = None
+		self.size = 0
+		self.pos = 0
+		self.priority_alpha = priority_alpha
+		self.priority_beta = priority_beta
+		self.priority_eps = priority_eps
+		self.priorities = None
+		self.max_priority = 1.0
+		self.sample_idx = None
+		self.sample_weights = None
+		if priority_alpha is not None:
+			if not memory_size:
+				raise ValueError('Prioritised replay requires a memory_size')
+			self.priorities = SumTree(memory_size)
+
+	def __len__(self):
+		return self.size
+
+	def _allocate(self, state_shape, capacity):
+		"""Allocate arrays for `capacity` transitions, keeping any stored ones"""
+		old = (self.s, self.a, self.r, self.s_next, self.done) if self.s is not None else None
+		self.s = np.zeros((capacity,)+state_shape, dtype=np.float32)
+		self.a = np.zeros(capacity, dtype=np.int64)
+		self.r = np.zeros(capacity, dtype=np.float64)
+		self.s_next = np.zeros((capacity,)+state_shape, dtype=np.float32)
+		self.done = np.zeros(capacity, dtype=bool)
+		if old is not None:
+			for new_arr, old_arr in zip((self.s, self.a, self.r, self.s_next, self.done), old):
+				new_arr[:self.size] = old_arr[:self.size]
+
 	def add(self, list_add):
-		self.append(list_add)
-		if self.max_len:
-			while len(self)>self.max_len:
-				self.remove(self[0])
+		"""Add a transition [s, a, r, s_next, done], overwriting the oldest if full"""
+		s, a, r, s_next, done = list_add
+		if self.s is None:
+			self._allocate(np.shape(s), self.max_len or 1024)
+		elif self.size == len(self.s) and not self.max_len:
+			self._allocate(self.s.shape[1:], 2*len(self.s))
+			self.pos = self.size
+		i = self.pos
+		self.s[i] = s
+		self.a[i] = a
+		self.r[i] = r
+		self.s_next[i] = s_next
+		self.done[i] = done
+		if self.priorities is not None:
+			self.priorities.set(i, self.max_priority)
+		self.pos = (i+1)%len(self.s)
+		self.size = min(self.size+1, len(self.s))
+
+	def add_batch(self, s, a, r, s_next, done):
+		"""Add a batch of transitions given as arrays with one row per transition"""
+		n = len(a)
+		if self.s is None:
+			self._allocate(np.shape(s)[1:], self.max_len or max(1024,n))
+		elif self.size+n > len(self.s) and not self.max_len:
+			self._allocate(self.s.shape[1:], max(2*len(self.s),self.size+n))
+			self.pos = self.size
+		idx = (self.pos+np.arange(n))%len(self.s)
+		self.s[idx] = s
+		self.a[idx] = a
+		self.r[idx] = r
+		self.s_next[idx] = s_next
+		self.done[idx] = done
+		if self.priorities is not None:
+			self.priorities.update(idx, self.max_priority)
+		self.pos = (self.pos+n)%len(self.s)
+		self.size = min(self.size+n, len(self.s))
+
 	def sample(self, n):
-		return _sample(self,n)
+		"""Return a minibatch of n transitions as arrays (s, a, r, s_next, done)"""
+		if self.priorities is None:
+			idx = self.rand_state.choice(self.size, n-self.n_demo, replace=False)
+		else:
+			idx = np.minimum(self.priorities.sample(n-self.n_demo, self.rand_state), self.size-1)
+			P = self.priorities.tree[idx+self.priorities.capacity]/self.priorities.total()
+			w = (self.size*P)**-self.priority_beta
+			self.sample_weights = np.concatenate([w/np.max(w), np.ones(self.n_demo)])
+		self.sample_idx = idx
+		batch = (self.s[idx], self.a[idx], self.r[idx], self.s_next[idx], self.done[idx])
+		if self.n_demo>0:
+			demo = self.demo_memory.sample(self.n_demo)
+			batch = tuple(np.concatenate(b) for b in zip(batch, demo))
+		return batch
+
+	def update_priorities(self, td_error):
+		"""Set priorities of the most recent sample from its TD errors, ignoring demonstrations"""
+		if self.priorities is None:
+			return
+		p = (np.abs(td_error[:len(self.sample_idx)])+self.priority_eps)**self.priority_alpha
+		self.priorities.update(self.sample_idx, p)
+		self.max_priority = max(self.max_priority, np.max(p))
 
 
 class QAgent(object):
@@ -43,6 +378,8 @@ class QAgent(object):
 		Neural network used to approximate Q-function
 	nn_target : network
 		Target network for stabilising Q-Network updates
+	sess : tf.Session or None
+		Session with its own graph holding nn and nn_target, None for numpy networks
 	gamma : float
 		Discount factor used for Q-learning 
 	epsilon : float
@@ -57,12 +394,28 @@ class QAgent(object):
 		Number of episodes where f_heur is used
 	target_steps : int
 		Number of steps between target network updates
+	target_tau : float or None
+		If given, the target network is softly updated at every step with this rate
+	fused_update : bool
+		Whether network updates use the network's fused `train_step`
+	sample_head : function or None
+		Selects a random head of an ensemble network, called at the end of each episode
 	memory : ReplayMemory
 		Stores state transitions for experience replay
 	prev_s, prev_a : list
 		Placeholder for storing states/actions to add to memory
+	prev_s_prep : array-like or None
+		Preprocessed form of prev_s if the network uses `prep_state`
+	s_cache, s_prep_cache : array-like or None
+		Most recent state passed to `update` and its preprocessed form, reused by
+		the following `action_select` so each state is preprocessed only once
 	ep_count, step_count : int
 		Counts the number of episodes/update steps
+	prep_count : int
+		Counts the number of forward passes through the network input layer
+		made to preprocess states
+	profiler : PhaseTimer
+		Times the phases of each update, disabled unless `profile` is True
 
 	Methods
 	-------
@@ -70,16 +423,28 @@ class QAgent(object):
 		Returns an action based on the state using an epsilon-greedy policy
 	update(state,reward,done)
 		Updates the agent's policy and network based on observed info
+	action_select_batch(states)
+		Returns actions for a batch of states from parallel environments
+	update_batch(states,rewards,dones)
+		Updates the agent based on observed info from parallel environments
+	network_update(n=None)
+		Updates the network using a minibatch of n transitions sampled from memory
+	pretrain(memory, n_iter=20, weight=1.0)
+		Fits the network to a memory of demonstrations by fitted Q-iteration
+	close()
+		Closes the agent's tensorflow session
 	"""
 	def __init__(self,env, net_type='ELMNet', regularization=None, f_heur=None,n_heur=0,
-				 gamma=0.6,eps_i=0.9,eps_f=0.0,n_eps=400,target_steps=50,**kwargs):
+				 gamma=0.6,eps_i=0.9,eps_f=0.0,n_eps=400,target_steps=50,target_tau=None,fused_update=True,seed=None,
+				 profile=False,**kwargs):
 		"""
 		Parameters
 		----------
 		env : Environment
 			The environment with which the agent interacts
-		net_type : {'ELMNet', 'QNet'}, optional
-			Specifies which type of Q-Network to use
+		net_type : {'ELMNet', 'QNet', 'NumpyELMNet', 'EnsembleELMNet'}, optional
+			Specifies which type of Q-Network to use. With 'EnsembleELMNet' a random head
+			selects actions in each episode, set `nn.head = None` to use the mean over heads
 		f_heur : function, optional
 			Heuristic for action selection; takes the state as input and returns an action
 		n_heur : int, optional
@@ -94,9 +459,20 @@ class QAgent(object):
 			Number of episodes for annealing epsilon
 		target_steps : int, optional
 			Number of steps between target network updates
+		target_tau : float, optional
+			Rate for soft (Polyak) target network updates at every step, by default the
+			target network is copied every `target_steps` steps
+		fused_update : bool, optional
+			If True and the network supports it, compute Q-learning targets and update
+			the network in a single session call, otherwise use separate calls for
+			prediction and updating, default True
+		seed : int, optional
+			Seed for the network initialisation and replay memory sampling, default None
+		profile : bool, optional
+			Enables `profiler` to time each phase of action selection and updating, default False
 		**kwargs
 			Additional keyword arguments passed to the nn module and `ReplayMemory`
-		regularization : {None, 'HR'}, optinal
+		regularization : {None, 'HR', 'HR_step'}, optinal
 			Specifies which method of regularization to use
 
 		Raises
@@ -109,19 +485,20 @@ class QAgent(object):
 		self.regularization = regularization
 		# print(1,self.regularization) # from params_EQLM.regularization
 
-		try:
-			net_module = getattr(networks,net_type)
-		except AttributeError:
+		net_module = getattr(networks,net_type,None) or getattr(numpy_networks,net_type,None)
+		if net_module is None:
 			raise ValueError('Invalid network type: \'{}\''.format(net_type))
 
-		if net_type == 'ELMNet' and self.regularization != None:
-			self.nn = net_module(self.state_size, self.action_size, regularization=self.regularization, **kwargs)
-			self.nn_target = net_module(self.state_size, self.action_size, regularization=self.regularization, is_target=True, **kwargs)
+		# Tensorflow networks are built in a graph and session owned by this agent
+		if issubclass(net_module,networks.SingleLayerNetwork):
+			self.sess = networks.new_session()
+			self.sess.graph.seed = seed
+			graph_context = self.sess.graph.as_default()
 		else:
-			self.nn = net_module(self.state_size, self.action_size, **kwargs)
-			self.nn_target = net_module(self.state_size, self.action_size, is_target=True, **kwargs)
-
-		self.nn_target.assign_params(self.nn.get_params())
+			self.sess = None
+			graph_context = nullcontext()
+		if net_type in ('ELMNet','NumpyELMNet') and self.regularization != None:
+			kwargs['regularization'] = self.regularization
 
 		self.gamma = gamma
 		self.epsilon = eps_i
@@ -130,12 +507,38 @@ class QAgent(object):
 		self.f_heur = f_heur
 		self.n_heur = n_heur
 		self.target_steps = target_steps
+		self.target_tau = target_tau
 
-		self.memory = ReplayMemory(**kwargs)
+		with graph_context:
+			self.nn = net_module(self.state_size, self.action_size, sess=self.sess, seed=seed, **kwargs)
+			self.nn_target = net_module(self.state_size, self.action_size, is_target=True,
+										sess=self.sess, seed=seed, **kwargs)
+			self.nn_target.build_sync(self.nn, tau=target_tau)
+			self.nn_target.sync()
+
+			self.fused_update = fused_update and hasattr(self.nn,'build_train_step')
+			if self.fused_update:
+				self.nn.build_train_step(self.nn_target, self.gamma)
+		self.sample_head = getattr(self.nn,'sample_head',None)
+		if self.sample_head:
+			self.sample_head()
+
+		self.memory = ReplayMemory(seed=seed, **kwargs)
 		self.prev_s = []
 		self.prev_a = []
+		self.prev_s_prep = None
+		self.s_cache = None
+		self.s_prep_cache = None
 		self.ep_count = 0
 		self.step_count = 0
+		self.prep_count = 0
+		self.profiler = PhaseTimer(profile)
+
+	def preprocess(self,state):
+		"""Return the preprocessed form of state and count the forward pass"""
+		self.prep_count += 1
+		with self.profiler.phase('prep_state'):
+			return self.nn.preprocess(state)
 
 	def action_select(self,state):
 		"""Returns an action based on the state using an epsilon-greedy policy
@@ -150,12 +553,22 @@ class QAgent(object):
 		action : int
 			Action selected by the policy
 		"""
+		if self.nn.prep_state is not None:
+			if state is self.s_cache:
+				self.prev_s_prep = self.s_prep_cache
+			else:
+				self.prev_s_prep = self.preprocess(state)
 		if self.ep_count<self.n_heur and self.f_heur is not None:
 			action = self.f_heur(state)
 		elif rand.random(1)<self.epsilon:
 			action=rand.randint(self.action_size)
+		elif self.nn.prep_state is not None:
+			with self.profiler.phase('Q_predict'):
+				q_s=self.nn.Q_predict(s_prep=self.prev_s_prep)
+			action=np.argmax(q_s)
 		else:
-			q_s=self.nn.Q_predict(state)
+			with self.profiler.phase('Q_predict'):
+				q_s=self.nn.Q_predict(state)
 			action=np.argmax(q_s)
 		self.prev_s=state
 		self.prev_a=action
@@ -172,39 +585,206 @@ class QAgent(object):
 			Observed reward
 		done : bool
 			Indicates a terminal state
+
+		Returns
+		-------
+		np.ndarray or None
+			TD errors of the sampled minibatch, None if the network was not updated
 		"""
 		if done:
 			self.ep_count += 1
 			self.epsilon = np.max([self.epsilon-self.d_eps,self.eps_f])
+			if self.sample_head:
+				self.sample_head()
 
 		if self.nn.prep_state is not None:
-			s_prep = self.nn.sess.run(self.nn.prep_state,
-										   feed_dict={self.nn.s_input:np.concatenate([self.prev_s,state])})
-			self.memory.add([s_prep[0],self.prev_a,reward,s_prep[1],done])
+			s_prep = self.preprocess(state)
+			with self.profiler.phase('memory_add'):
+				self.memory.add([self.prev_s_prep[0],self.prev_a,reward,s_prep[0],done])
+			self.s_cache, self.s_prep_cache = state, s_prep
 		else:
-			self.memory.add([self.prev_s.reshape(-1),self.prev_a,reward,state.reshape(-1),done])
+			with self.profiler.phase('memory_add'):
+				self.memory.add([self.prev_s.reshape(-1),self.prev_a,reward,state.reshape(-1),done])
 
-		if len(self.memory)<self.nn.k:
+		if len(self.memory)+self.memory.n_demo<self.nn.k:
 			return
+		return self.network_update()
+
+	def action_select_batch(self,states):
+		"""Returns actions for a batch of states using an epsilon-greedy policy
+
+		All states are evaluated with a single Q-network forward pass
+
+		Parameters
+		----------
+		states : array-like
+			Environment states at the current timestep, one row per environment
 
-		D_update = self.memory.sample(self.nn.k)
-		s, a, r, Sd, St = (np.stack([d[0] for d in D_update]),
-						   np.array([d[1] for d in D_update]),
-						   np.array([d[2] for d in D_update]),
-						   np.stack([d[3] for d in D_update]),
-						   np.invert(np.array([d[4] for d in D_update])))
-		indt = np.where(St)[0]
+		Returns
+		-------
+		actions : np.ndarray of int
+			Action selected by the policy for each environment
+		"""
+		n_env = len(states)
 		if self.nn.prep_state is not None:
-			Q = self.nn.Q_predict(s_prep=s)
-			Qd = self.nn_target.Q_predict(s_prep=Sd[St])
+			if states is self.s_cache:
+				self.prev_s_prep = self.s_prep_cache
+			else:
+				self.prev_s_prep = self.preprocess(states)
+		if self.ep_count<self.n_heur and self.f_heur is not None:
+			actions = np.array([self.f_heur(s) for s in states])
+		else:
+			with self.profiler.phase('Q_predict'):
+				if self.nn.prep_state is not None:
+					q_s = self.nn.Q_predict(s_prep=self.prev_s_prep)
+				else:
+					q_s = self.nn.Q_predict(states)
+			actions = np.argmax(q_s,1)
+			explore = rand.random(n_env)<self.epsilon
+			actions[explore] = rand.randint(self.action_size,size=np.count_nonzero(explore))
+		self.prev_s = states
+		self.prev_a = actions
+		return actions
+
+	def update_batch(self,states,rewards,dones):
+		"""Updates the agent's memory with a batch of transitions and updates the Q network
+
+		Parameters
+		----------
+		states : array-like
+			Most recent observed states, one row per environment
+		rewards : array-like
+			Observed rewards
+		dones : array-like of bool
+			Indicates terminal states
+
+		Returns
+		-------
+		np.ndarray or None
+			TD errors of the sampled minibatch, None if the network was not updated
+		"""
+		n_done = np.count_nonzero(dones)
+		if n_done:
+			self.ep_count += n_done
+			self.epsilon = np.max([self.epsilon-n_done*self.d_eps,self.eps_f])
+			if self.sample_head:
+				self.sample_head()
+
+		if self.nn.prep_state is not None:
+			s_prep = self.preprocess(states)
+			with self.profiler.phase('memory_add'):
+				self.memory.add_batch(self.prev_s_prep,self.prev_a,rewards,s_prep,dones)
+			self.s_cache, self.s_prep_cache = states, s_prep
+		else:
+			with self.profiler.phase('memory_add'):
+				self.memory.add_batch(self.prev_s,self.prev_a,rewards,states,dones)
+
+		if len(self.memory)+self.memory.n_demo<self.nn.k:
+			return
+		return self.network_update()
+
+	def network_update(self, n=None):
+		"""
+		Update nn weights using a minibatch from memory and periodically update nn_target
+
+		The minibatch has `n` transitions, default `nn.k`; least-squares networks
+		accept any size so updates can be amortised over larger batches.
+
+		With prioritised replay, importance sampling weights scale the rows of
+		a least-squares update or the TD errors of a gradient update, and the
+		priorities of the minibatch are updated from the returned TD errors.
+		"""
+		phase = self.profiler.phase
+		with phase('sample'):
+			s, a, r, Sd, Sdone = self.memory.sample(n or self.nn.k)
+			w = self.memory.sample_weights
+		if self.fused_update:
+			with phase('update'):
+				td_error = self.nn.train_step(s,a,r,Sd,Sdone,w)
 		else:
-			Q = self.nn.Q_predict(s=s)
-			Qd = self.nn_target.Q_predict(s=Sd[St])
-		Q[range(Q.shape[0]),a] = r
-		Q[indt,a[indt]] += self.gamma*np.max(Qd,1)
-		self.nn.update(s,Q)
+			St = np.invert(Sdone)
+			indt = np.where(St)[0]
+			ind = np.arange(len(a))
+			with phase('Q_predict'):
+				if self.nn.prep_state is not None:
+					Q = self.nn.Q_predict(s_prep=s)
+					Qd = self.nn_target.Q_predict(s_prep=Sd[St])
+				else:
+					Q = self.nn.Q_predict(s=s)
+					Qd = self.nn_target.Q_predict(s=Sd[St])
+			Q_a = Q[ind,a]
+			Q[ind,a] = r
+			Q[indt,a[indt]] += self.gamma*np.max(Qd,1)
+			td_error = Q[ind,a] - Q_a
+			with phase('update'):
+				if w is None:
+					self.nn.update(s,Q)
+				elif self.nn.prep_state is not None:
+					w_sqrt = np.sqrt(w)[:,np.newaxis]
+					self.nn.update(w_sqrt*s,w_sqrt*Q)
+				else:
+					Q[ind,a] = Q_a + w*td_error
+					self.nn.update(s,Q)
+		with phase('sample'):
+			self.memory.update_priorities(td_error)
 
 		self.step_count += 1
-		if self.step_count >= self.target_steps:
-			self.nn_target.assign_params(self.nn.get_params())
+		if self.target_tau is not None:
+			with phase('target_sync'):
+				self.nn_target.sync(soft=True)
+		elif self.step_count >= self.target_steps:
+			with phase('target_sync'):
+				self.nn_target.sync()
 			self.step_count = 0
+		return td_error
+
+	def pretrain(self, memory, n_iter=20, weight=1.0):
+		"""
+		Fit the Q-Network to a memory of demonstrations before training
+
+		Runs fitted Q-iteration: targets r + gamma*max Q_target(s_next) for the
+		demonstrated actions, and the current predictions for other actions, are
+		fitted with one least-squares solve over every transition using the
+		network's `fit`, then the target network is synced. Each demonstration
+		counts as `weight` transitions in the autocorrelation of the fitted
+		network, so a weight below 1 lets later updates move away from the
+		demonstrated policy sooner.
+
+		...
+
+		Parameters
+		----------
+		memory : ReplayMemory
+			Demonstration transitions with states in their normal form, e.g. from
+			`heuristic_memory_demo`
+		n_iter : int, optional
+			Number of fitted Q-iterations, default 20
+		weight : float, optional
+			Weight of each demonstration relative to a transition used in an
+			update, default 1
+
+		Raises
+		------
+		ValueError
+			If the network cannot be fitted to a dataset
+		"""
+		if not hasattr(self.nn,'fit'):
+			raise ValueError('Network cannot be fitted to a dataset: \'{}\''.format(type(self.nn).__name__))
+		n = len(memory)
+		s = self.nn.preprocess(memory.s[:n])
+		s_next = self.nn.preprocess(memory.s_next[:n])
+		a, r = memory.a[:n], memory.r[:n]
+		not_done = np.invert(memory.done[:n])
+		ind = np.arange(n)
+		w_sqrt = np.sqrt(weight)
+		for _ in range(n_iter):
+			Q = self.nn.Q_predict(s_prep=s)
+			Q[ind,a] = r + self.gamma*not_done*np.max(self.nn_target.Q_predict(s_prep=s_next),1)
+			self.nn.fit(w_sqrt*s,w_sqrt*Q)
+			self.nn_target.sync()
+		self.step_count = 0
+
+	def close(self):
+		"""Close the agent's tensorflow session, releasing its graph"""
+		if self.sess is not None:
+			self.sess.close()
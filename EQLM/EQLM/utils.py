@@ -7,12 +7,19 @@
 """Methods for training, testing, and visualising agents"""
 
 import numpy as np
-from tqdm.notebook import trange
 from .q_agents import ReplayMemory, QAgent
 import pickle
 
 
-def train_agent(agent, env, N_ep, save_name=None, show_progress=False):
+def progress_range(n, show_progress=False, **kwargs):
+	"""range(n), or a tqdm notebook progress bar over it if show_progress, importing tqdm only then"""
+	if not show_progress:
+		return range(n)
+	from tqdm.notebook import trange
+	return trange(n, **kwargs)
+
+def train_agent(agent, env, N_ep, save_name=None, show_progress=False, snapshot_steps=None,
+				profile=False):
 	"""
 	Train an agent for a given number of episodes in a given environment
 	...
@@ -26,9 +33,16 @@ def train_agent(agent, env, N_ep, save_name=None, show_progress=False):
 	N_ep : int
 		Number of episodes
 	save_name : str, optional
-		Name of file to save results, by default does not save
+		Name of file to log results to with `EpisodeLog`, by default does not save
 	show_progress : bool, optional
 		Displays a tqdm notebook progress bar
+	snapshot_steps : int, optional
+		Number of episodes between weight snapshots in the log, by default the
+		weights are saved on improvement and at the end of training
+	profile : bool, optional
+		Enables the agent's profiler during training; the time of each environment
+		step is included and per-episode phase timings are logged with `save_name`.
+		The accumulated times are given by `agent.profiler.summary()`
 		
 	Returns
 	-------
@@ -41,23 +55,29 @@ def train_agent(agent, env, N_ep, save_name=None, show_progress=False):
 	"""
 	R_ep = []
 	steps=[]
-	if show_progress:
-		t = trange(N_ep, desc='bar_desc', leave=True)
-	else:
-		t = range(N_ep)
+	profiler = agent.profiler
+	was_enabled = profiler.enabled
+	if profile:
+		profiler.enable()
+	timing_phases = profiler.phases+('other',) if profiler.enabled else None
+	log = EpisodeLog(save_name, snapshot_steps, timing_phases=timing_phases) if save_name else None
+	t = progress_range(N_ep, show_progress, desc='bar_desc', leave=True)
 	for ep_no in t:
-		s = env.reset()
+		with profiler.phase('env_step'):
+			s = env.reset()
 		done = False
 		Rt = 0
 		n_step = 0
 		while not done:
 			a = agent.action_select(s)
-			s, r, done, _ = env.step(a)
+			with profiler.phase('env_step'):
+				s, r, done, _ = env.step(a)
 			agent.update(s,r,done)
 			Rt += r
 			n_step +=1
 		R_ep.append(Rt)
 		steps.append(n_step)
+		timing = profiler.lap() if profiler.enabled else None
 		if show_progress:
 			if ep_no>10:
 				t.set_description('R: {} Step: {}'.format(np.mean(R_ep[-10:]).round(1),n_step))
@@ -65,14 +85,58 @@ def train_agent(agent, env, N_ep, save_name=None, show_progress=False):
 			else:
 				t.set_description('R: {} Step: {}'.format(np.mean(R_ep).round(1),n_step))
 				t.refresh()
-		if save_name:
-			data = {'params':agent.nn.get_params(),'R':R_ep,'step':steps}
-			pickle.dump(data, open(save_name,'wb'))
+		if log:
+			log.append(Rt, n_step, agent.nn.get_params, timing)
+	if log:
+		log.close(agent.nn.get_params())
+	if not was_enabled:
+		profiler.disable()
 	return R_ep, steps, agent
 
+def train_agent_batch(agent, env, N_ep):
+	"""
+	Train an agent on a batch of environments until N_ep episodes are completed
+	...
+
+	Parameters
+	----------
+	agent : EQLM.QAgent
+		QLearning agent
+	env : EQLM.VecCartPole
+		Batch of environments which reset automatically at the end of each episode
+	N_ep : int
+		Number of episodes
+
+	Returns
+	-------
+	R_ep : list
+		Cumulative reward for each episode, in order of completion
+	steps : list
+		Number of environment steps in each episode
+	agent : EQLM.QAgent
+		The trained agent
+	"""
+	R_ep = []
+	steps = []
+	s = env.reset()
+	Rt = np.zeros(env.n_env)
+	n_step = np.zeros(env.n_env, dtype=int)
+	while len(R_ep) < N_ep:
+		a = agent.action_select_batch(s)
+		with agent.profiler.phase('env_step'):
+			s, r, done, _ = env.step(a)
+		agent.update_batch(s,r,done)
+		Rt += r
+		n_step += 1
+		R_ep.extend(Rt[done])
+		steps.extend(n_step[done])
+		Rt[done] = 0
+		n_step[done] = 0
+	return R_ep[:N_ep], steps[:N_ep], agent
+
 def agent_demo(agent, env, N_ep, render=False):
 	"""Demonstrate a learned agent policy"""
-	R_ep = Reward()
+	R_ep = []
 	steps=[]
 	for ep_no in range(N_ep):
 		s = env.reset()
@@ -88,11 +152,11 @@ def agent_demo(agent, env, N_ep, render=False):
 		steps.append(n_step)
 	return R_ep, steps
 
-def heuristic_demo(H, env, N_ep, render=False):
+def heuristic_demo(H, env, N_ep, render=False, show_progress=True):
 	"""Demonstrate a heuristic where a=H(s)"""
-	R_ep = Reward()
+	R_ep = []
 	steps=[]
-	for ep_no in trange(N_ep):
+	for ep_no in progress_range(N_ep, show_progress):
 		s = env.reset()
 		done = False
 		Rt = 0
@@ -106,6 +170,70 @@ def heuristic_demo(H, env, N_ep, render=False):
 		steps.append(n_step)
 	return R_ep, steps
 
+def heuristic_memory_demo(H, env, N_ep, fname=None, memory_size=None, show_progress=False,
+						  batch_heuristic=False):
+	"""
+	Create a memory of demonstration transitions using a heuristic where a=H(s)
+	...
+
+	Parameters
+	----------
+	H : function
+		Heuristic which takes a single state and returns an action
+	env : EQLM.VecCartPole or EQLM.Environment
+		Environment, where a batch of environments is stepped together and each
+		step's transitions are added to memory as one batch
+	N_ep : int
+		Number of episodes, with a batch of environments the transitions of
+		episodes still running when the last one finishes are also kept
+	fname : str, optional
+		File the memory is pickled to, by default it is not saved
+	memory_size : int, optional
+		Maximum number of stored transitions, default unbounded
+	show_progress : bool, optional
+		Displays a tqdm notebook progress bar over episodes
+	batch_heuristic : bool, optional
+		With a batch of environments, H takes their states, one row each, and
+		returns their actions, default False
+
+	Returns
+	-------
+	ReplayMemory
+		Demonstration transitions with states in their normal form, for `QAgent.pretrain`
+	"""
+	mem = ReplayMemory(memory_size)
+	if hasattr(env,'n_env'):
+		t = progress_range(N_ep, show_progress)
+		bar = getattr(t,'update',None)
+		n_done = 0
+		s = env.reset()
+		while n_done < N_ep:
+			a = np.asarray(H(s)) if batch_heuristic else np.array([H(s_i) for s_i in s])
+			s_next, r, done, info = env.step(a)
+			s_end = s_next.copy()
+			s_end[done] = info['terminal_state']
+			mem.add_batch(s, a, r, s_end, done)
+			n_new = min(np.count_nonzero(done), N_ep-n_done)
+			n_done += n_new
+			if bar and n_new:
+				bar(n_new)
+			s = s_next
+		if bar:
+			t.close()
+	else:
+		for ep_no in progress_range(N_ep, show_progress):
+			s = env.reset()
+			done = False
+			while not done:
+				prev_s = s
+				a = H(s[0])
+				s, r, done, _ = env.step(a)
+				mem.add([prev_s.reshape(-1),a,r,s.reshape(-1),done])
+	if fname is not None:
+		with open(fname,'wb') as f:
+			pickle.dump(mem,f)
+	return mem
+
 def save_results(fname, R, agent, hyper_params=None):
 	"""Save results to a file"""
 	try:
@@ -116,6 +244,219 @@ def save_results(fname, R, agent, hyper_params=None):
 	results['agents'].append(agent.nn.get_params())
 	pickle.dump(results, open(fname,'wb'))
 
+_episode_dtype = np.dtype([('R','<f8'),('step','<i8')])
+
+class EpisodeLog(object):
+	"""
+	Append-only log of training episodes with occasional weight snapshots
+
+	Each episode is appended to `fname` as one fixed-size (reward, steps)
+	record, and network parameters are appended to `fname + '.params'` only
+	every `snapshot_steps` episodes, on a new best reward, and on closing,
+	so the cost of logging an episode does not grow with the run length.
+	A partial record left by an interrupted write is dropped when reading,
+	and removed from the files when resuming.
+
+	If `timing_phases` are given, the time spent in each phase during an
+	episode is appended to `fname + '.timing'`, which starts with a line of
+	comma-separated phase names followed by one float64 record per episode.
+	Episodes logged before resuming without these phases have records of nan.
+
+	...
+
+	Attributes
+	----------
+	fname : str
+		Name of the episode file
+	snapshot_steps : int or None
+		Number of episodes between weight snapshots
+	save_best : bool
+		Whether to snapshot weights whenever the episode reward improves
+	ep_count : int
+		Number of episodes in the log
+	best_R : float
+		Highest episode reward in the log
+	timing_phases : tuple of str or None
+		Phases with per-episode timings in the log
+	"""
+	def __init__(self, fname, snapshot_steps=None, save_best=True, resume=False, timing_phases=None):
+		"""
+		Parameters
+		----------
+		fname : str
+			Name of the episode file, snapshots are saved to `fname + '.params'`
+		snapshot_steps : int, optional
+			Number of episodes between weight snapshots, default only on improvement and closing
+		save_best : bool, optional
+			Snapshot weights whenever the episode reward improves, default True
+		resume : bool, optional
+			Append to an existing log instead of starting a new one, default False
+		timing_phases : tuple of str, optional
+			Phases to log the time of in each episode, by default no timings are logged
+		"""
+		self.fname = fname
+		self.snapshot_steps = snapshot_steps
+		self.save_best = save_best
+		self.ep_count = 0
+		self.best_R = -np.inf
+		if resume:
+			results = load_results(fname)
+			self.ep_count = len(results['R'])
+			self.best_R = max(results['R'], default=-np.inf)
+			with open(fname,'ab') as f:
+				f.truncate(self.ep_count*_episode_dtype.itemsize)
+			_, offset = _read_snapshots(fname+'.params', self.ep_count)
+			with open(fname+'.params','ab') as f:
+				f.truncate(offset)
+			self.f_ep = open(fname,'ab')
+			self.f_params = open(fname+'.params','ab')
+		else:
+			self.f_ep = open(fname,'wb')
+			self.f_params = open(fname+'.params','wb')
+		self.last_snapshot = self.ep_count
+		self.timing_phases = tuple(timing_phases) if timing_phases else None
+		self.f_timing = None
+		if self.timing_phases:
+			header = (','.join(self.timing_phases)+'\n').encode()
+			timing = results['timing'] if resume else None
+			if timing is not None and tuple(timing) == self.timing_phases:
+				n_timed = len(timing[self.timing_phases[0]])
+				with open(fname+'.timing','ab') as f:
+					f.truncate(len(header)+n_timed*8*len(self.timing_phases))
+				self.f_timing = open(fname+'.timing','ab')
+			else:
+				n_timed = 0
+				self.f_timing = open(fname+'.timing','wb')
+				self.f_timing.write(header)
+			# episodes logged without these phases get nan rows, so that each row stays with its episode
+			self.f_timing.write(np.full((self.ep_count-n_timed,len(self.timing_phases)),np.nan).tobytes())
+			self.f_timing.flush()
+
+	def append(self, R, n_step, get_params, timing=None):
+		"""
+		Log an episode, snapshotting the weights if required
+
+		...
+
+		Parameters
+		----------
+		R : float
+			Cumulative reward for the episode
+		n_step : int
+			Number of environment steps in the episode
+		get_params : function
+			Returns the current network parameters, only called for a snapshot
+		timing : dict, optional
+			Time spent in each phase during the episode, logged if the log has `timing_phases`
+		"""
+		if self.f_timing:
+			timing = timing or {}
+			self.f_timing.write(np.array([timing.get(name,0.0) for name in self.timing_phases]).tobytes())
+			self.f_timing.flush()
+		self.f_ep.write(np.array((R,n_step),dtype=_episode_dtype).tobytes())
+		self.f_ep.flush()
+		self.ep_count += 1
+		improved = R > self.best_R
+		self.best_R = max(R, self.best_R)
+		if (self.save_best and improved) or \
+				(self.snapshot_steps and self.ep_count%self.snapshot_steps == 0):
+			self.snapshot(R, get_params())
+
+	def snapshot(self, R, params):
+		"""Append network parameters after the current episode"""
+		pickle.dump({'ep':self.ep_count,'R':R,'params':params}, self.f_params)
+		self.f_params.flush()
+		self.last_snapshot = self.ep_count
+
+	def close(self, params=None):
+		"""Close the log, snapshotting `params` if the last episode has no snapshot"""
+		if params is not None and self.last_snapshot != self.ep_count:
+			self.snapshot(np.nan, params)
+		self.f_ep.close()
+		self.f_params.close()
+		if self.f_timing:
+			self.f_timing.close()
+
+def _read_snapshots(fname, n_ep):
+	"""
+	Read the snapshots of the first `n_ep` episodes from a params file
+
+	Snapshots are written in episode order, so reading stops at the first
+	snapshot after episode `n_ep` or at a snapshot cut short by an
+	interrupted write.
+
+	...
+
+	Parameters
+	----------
+	fname : str
+		Name of the params file
+	n_ep : int
+		Number of complete episodes in the log
+
+	Returns
+	-------
+	snapshots : list of dict
+		Snapshots of the first `n_ep` episodes
+	offset : int
+		Size in bytes of these snapshots at the start of the file
+	"""
+	snapshots = []
+	offset = 0
+	try:
+		f = open(fname,'rb')
+	except FileNotFoundError:
+		return snapshots, offset
+	with f:
+		while True:
+			try:
+				snapshot = pickle.load(f)
+			except Exception: # end of file or a truncated snapshot
+				break
+			if snapshot['ep'] > n_ep:
+				break
+			snapshots.append(snapshot)
+			offset = f.tell()
+	return snapshots, offset
+
+def load_results(fname):
+	"""
+	Load a log written by `EpisodeLog`, ignoring any partially written tail
+
+	...
+
+	Parameters
+	----------
+	fname : str
+		Name of the episode file
+
+	Returns
+	-------
+	dict
+		'R' and 'step' lists for each episode, 'snapshots' list of dicts with the
+		episode number, reward and parameters, 'params' from the last snapshot, and
+		'timing' dict of per-episode time lists for each phase, None if not logged
+	"""
+	try:
+		with open(fname,'rb') as f:
+			data = f.read()
+	except FileNotFoundError:
+		data = b''
+	n_ep = len(data)//_episode_dtype.itemsize
+	episodes = np.frombuffer(data[:n_ep*_episode_dtype.itemsize], dtype=_episode_dtype)
+	snapshots, _ = _read_snapshots(fname+'.params', n_ep)
+	timing = None
+	try:
+		with open(fname+'.timing','rb') as f:
+			phases = f.readline().decode().strip().split(',')
+			times = np.frombuffer(f.read(8*len(phases)*n_ep), dtype=np.float64)
+		times = times[:len(times)//len(phases)*len(phases)].reshape(-1,len(phases))
+		timing = {name:times[:,i].tolist() for i, name in enumerate(phases)}
+	except FileNotFoundError:
+		pass
+	return {'R':episodes['R'].tolist(), 'step':episodes['step'].tolist(), 'snapshots':snapshots,
+			'params':snapshots[-1]['params'] if snapshots else None, 'timing':timing}
+
 def data_smooth(data,n_avg):
 	"""For plotting learning curves"""
 	x_vec = np.arange(0,len(data)+1,n_avg)
@@ -0,0 +1,995 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/. */
+# ------ Copyright (C) 2020 University of Strathclyde and Author ------
+# ---------------------- Author: Callum Wilson ------------------------
+# --------------- e-mail: callum.j.wilson@strath.ac.uk ----------------
+"""
+Benchmarks for the EQLM module
+
+Run from this folder, e.g. `python benchmarks.py elm_update`
+"""
+
+import argparse
+import gc
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import EQLM
+
+
+def bench_elm_update(net_types=('ELMNet','NumpyELMNet'), update_modes=('inverse','cholesky'),
+					 N_hid=(25,100,400), minibatch_size=2, n_update=2000, state_size=4, action_size=2,
+					 regularization=None):
+	"""
+	Measure LS-IELM updates per second for each network type
+
+	...
+
+	Parameters
+	----------
+	net_types : tuple of str, optional
+		Names of the network classes to compare
+	update_modes : tuple of str, optional
+		LS-IELM update modes to compare
+	N_hid : tuple of int, optional
+		Numbers of hidden nodes to test
+	minibatch_size : int, optional
+		Size of minibatches for updating
+	n_update : int, optional
+		Number of timed updates for each configuration
+	regularization : {None, 'HR', 'HR_step'}, optional
+		Regularization used by each network
+
+	Returns
+	-------
+	results : dict
+		Updates per second keyed by (net_type, update_mode, N_hid)
+	"""
+	results = {}
+	rand_state = np.random.RandomState(0)
+	for n in N_hid:
+		H = rand_state.uniform(-1,1,(n_update+1,minibatch_size,n)).astype(np.float32)
+		T = rand_state.uniform(-1,1,(n_update+1,minibatch_size,action_size)).astype(np.float32)
+		for net_type in net_types:
+			for mode in update_modes:
+				nn = getattr(EQLM,net_type)(state_size, action_size, N_hid=n, minibatch_size=minibatch_size,
+											update_mode=mode, regularization=regularization)
+				nn.update(H[0],T[0])
+				t0 = time.perf_counter()
+				for i in range(1,n_update+1):
+					nn.update(H[i],T[i])
+				results[(net_type,mode,n)] = n_update/(time.perf_counter()-t0)
+				print('{:>12} {:>8} N_hid={:<4} {:>10.1f} updates/s'.format(
+					net_type,mode,n,results[(net_type,mode,n)]))
+	return results
+
+
+def bench_elm_batch_size(net_types=('ELMNet','NumpyELMNet'), batch_sizes=(1,2,8,32,128), N_hid=100,
+						 n_row=20000, state_size=4, action_size=2):
+	"""
+	Measure LS-IELM throughput in rows per second when one network is fed minibatches of varying size
+
+	...
+
+	Parameters
+	----------
+	net_types : tuple of str, optional
+		Names of the network classes to compare
+	batch_sizes : tuple of int, optional
+		Numbers of rows in each update, all fed to the same network
+	N_hid : int, optional
+		Number of hidden nodes
+	n_row : int, optional
+		Approximate number of timed rows for each batch size
+
+	Returns
+	-------
+	results : dict
+		Rows per second keyed by (net_type, batch_size)
+	"""
+	results = {}
+	rand_state = np.random.RandomState(0)
+	for net_type in net_types:
+		nn = getattr(EQLM,net_type)(state_size, action_size, N_hid=N_hid, minibatch_size=batch_sizes[0])
+		nn.update(rand_state.uniform(-1,1,(N_hid,N_hid)),rand_state.uniform(-1,1,(N_hid,action_size)))
+		for k in batch_sizes:
+			n_update = max(n_row//k,1)
+			H = rand_state.uniform(-1,1,(n_update,k,N_hid)).astype(np.float32)
+			T = rand_state.uniform(-1,1,(n_update,k,action_size)).astype(np.float32)
+			t0 = time.perf_counter()
+			for i in range(n_update):
+				nn.update(H[i],T[i])
+			results[(net_type,k)] = n_update*k/(time.perf_counter()-t0)
+			print('{:>12} k={:<4} {:>10.1f} rows/s'.format(net_type,k,results[(net_type,k)]))
+	return results
+
+
+def bench_hr_step(net_types=('ELMNet','NumpyELMNet'), N_hid=(25,100,400), n_update=500):
+	"""
+	Compare LS-IELM update rates without regularization and with 'HR_step'
+
+	Also times the full eigendecomposition of an NxN matrix which per-step HR
+	would otherwise need at every update.
+
+	...
+
+	Parameters
+	----------
+	net_types : tuple of str, optional
+		Names of the network classes to compare
+	N_hid : tuple of int, optional
+		Numbers of hidden nodes to test
+	n_update : int, optional
+		Number of timed updates for each configuration
+
+	Returns
+	-------
+	results : dict
+		Updates per second keyed by (regularization, net_type, update_mode, N_hid), and
+		eigendecompositions per second keyed by ('eigh', N_hid)
+	"""
+	results = {}
+	for regularization in (None,'HR_step'):
+		print('regularization={}'.format(regularization))
+		rates = bench_elm_update(net_types, ('inverse',), N_hid, n_update=n_update,
+								 regularization=regularization)
+		results.update({(regularization,)+key:rate for key, rate in rates.items()})
+	rand_state = np.random.RandomState(0)
+	for n in N_hid:
+		H = rand_state.uniform(-1,1,(n,n))
+		S = np.dot(H.T,H)
+		n_eigh = max(n_update//10,1)
+		t0 = time.perf_counter()
+		for i in range(n_eigh):
+			np.linalg.eigh(S)
+		results[('eigh',n)] = n_eigh/(time.perf_counter()-t0)
+		print('{:>12} N_hid={:<4} {:>10.1f} eigh/s'.format('numpy',n,results[('eigh',n)]))
+	return results
+
+
+def bench_hr_tracking(net_types=('ELMNet','NumpyELMNet'), N_hid=25, n_update=300, minibatch_size=2,
+					  action_size=2, rtol=1e-2):
+	"""
+	Check that 'HR_step' tracks the eigenvalues used by the HR formula
+
+	After `n_update` updates on hidden layer outputs with a decaying spectrum,
+	the Rayleigh quotients of the tracked eigenvectors of S are compared with
+	lambda_min, lambda_(n-1) (the second largest) and lambda_max from
+	`np.linalg.eigh`.
+
+	...
+
+	Parameters
+	----------
+	net_types : tuple of str, optional
+		Names of the network classes to check
+	N_hid : int, optional
+		Number of hidden nodes
+	n_update : int, optional
+		Number of updates before comparing
+	minibatch_size : int, optional
+		Number of rows in each update
+	action_size : int, optional
+		Number of outputs
+	rtol : float, optional
+		Relative tolerance on each eigenvalue
+
+	Returns
+	-------
+	results : dict
+		Largest relative error of the tracked eigenvalues keyed by net_type
+	"""
+	results = {}
+	rand_state = np.random.RandomState(0)
+	scales = np.geomspace(1.0, 0.05, N_hid)
+	H = (rand_state.randn(n_update+1,minibatch_size,N_hid)*scales).astype(np.float32)
+	T = rand_state.uniform(-1,1,(n_update+1,minibatch_size,action_size)).astype(np.float32)
+	for net_type in net_types:
+		nn = getattr(EQLM,net_type)(4, action_size, N_hid=N_hid, minibatch_size=minibatch_size,
+									regularization='HR_step')
+		for i in range(n_update+1):
+			nn.update(H[i],T[i])
+		if hasattr(nn,'sess'):
+			S, V = nn.sess.run([nn.S,nn.hr_vecs])
+			V = V.T
+		else:
+			S, V = nn.S, nn.hr_vecs
+		nn.close()
+		tracked = np.array([np.dot(v,np.dot(S,v))/np.dot(v,v) for v in V]) # lambda_max, lambda_min, lambda_(n-1)
+		lam = np.linalg.eigh(S)[0]
+		exact = np.array([lam[-1], lam[0], lam[-2]])
+		results[net_type] = np.max(np.abs(tracked-exact)/np.abs(exact))
+		print('{:>12} tracked (min, n-1, max) ({:.4g}, {:.4g}, {:.4g}) eigh ({:.4g}, {:.4g}, {:.4g}) '
+			  'max relative error {:.1e} {}'.format(net_type, tracked[1], tracked[2], tracked[0],
+			  exact[1], exact[2], exact[0], results[net_type], 'ok' if results[net_type] <= rtol else 'FAILED'))
+	return results
+
+
+def bench_agent_update(net_types=('ELMNet','QNet'), n_step=2000, **agent_kwargs):
+	"""
+	Measure QAgent steps per second with fused and separate network update calls
+
+	...
+
+	Parameters
+	----------
+	net_types : tuple of str, optional
+		Names of the network classes to compare
+	n_step : int, optional
+		Number of timed agent steps for each configuration
+	**agent_kwargs
+		Additional keyword arguments passed to `QAgent`
+
+	Returns
+	-------
+	results : dict
+		Agent steps per second keyed by (net_type, fused_update)
+	"""
+	results = {}
+	env = EQLM.Environment()
+	kwargs = {'N_hid':25, 'minibatch_size':2, 'memory_size':10000, 'eps_i':0.0}
+	kwargs.update(agent_kwargs)
+	rand_state = np.random.RandomState(0)
+	S = rand_state.uniform(-1,1,(n_step+1,1,env.state_size))
+	for net_type in net_types:
+		for fused in (False,True):
+			agent = EQLM.QAgent(env, net_type=net_type, fused_update=fused, **kwargs)
+			for i in range(kwargs['minibatch_size']):
+				agent.action_select(S[i])
+				agent.update(S[i+1],1.0,False)
+			t0 = time.perf_counter()
+			for i in range(n_step):
+				agent.action_select(S[i])
+				agent.update(S[i+1],1.0,False)
+			results[(net_type,fused)] = n_step/(time.perf_counter()-t0)
+			print('{:>8} fused={!s:<5} {:>10.1f} steps/s'.format(net_type,fused,results[(net_type,fused)]))
+	return results
+
+
+def rss_mb():
+	"""Resident memory of this process in MB, None where /proc is unavailable"""
+	try:
+		with open('/proc/self/statm') as f:
+			return int(f.read().split()[1])*4096/2**20
+	except (OSError, IndexError, ValueError):
+		return None
+
+def bench_agent_construction(net_type='ELMNet', n_agent=200, n_window=20, **agent_kwargs):
+	"""
+	Measure construction time and memory over many consecutive agents
+
+	Each agent owns its graph and session and is closed before the next is
+	created, so both should stay flat rather than growing with the number
+	of agents created.
+
+	...
+
+	Parameters
+	----------
+	net_type : str, optional
+		Name of the network class used by each agent
+	n_agent : int, optional
+		Number of consecutive agents to construct
+	n_window : int, optional
+		Number of agents averaged over at the start and end of the run
+	**agent_kwargs
+		Additional keyword arguments passed to `QAgent`
+
+	Returns
+	-------
+	t_build : list
+		Construction time of each agent in seconds
+	rss : list
+		Resident memory in MB after closing each agent
+	"""
+	env = EQLM.Environment()
+	kwargs = {'N_hid':25, 'minibatch_size':2, 'memory_size':10000}
+	kwargs.update(agent_kwargs)
+	t_build = []
+	rss = []
+	for i in range(n_agent):
+		t0 = time.perf_counter()
+		agent = EQLM.QAgent(env, net_type=net_type, **kwargs)
+		t_build.append(time.perf_counter()-t0)
+		agent.close()
+		del agent
+		gc.collect()
+		rss.append(rss_mb())
+	print('agents {:>4}-{:<4} {:>8.2f} ms/agent  RSS {} MB'.format(
+		1, n_window, 1e3*np.mean(t_build[:n_window]), rss[n_window-1]))
+	print('agents {:>4}-{:<4} {:>8.2f} ms/agent  RSS {} MB'.format(
+		n_agent-n_window+1, n_agent, 1e3*np.mean(t_build[-n_window:]), rss[-1]))
+	return t_build, rss
+
+
+def bench_vec_env(net_type='ELMNet', n_envs=(1,64), n_transition=20000, **agent_kwargs):
+	"""
+	Measure training throughput in environment steps per second on VecCartPole
+
+	...
+
+	Parameters
+	----------
+	net_type : str, optional
+		Name of the network class used by the agent
+	n_envs : tuple of int, optional
+		Numbers of environments stepped together
+	n_transition : int, optional
+		Approximate number of timed environment steps for each batch size
+	**agent_kwargs
+		Additional keyword arguments passed to `QAgent`
+
+	Returns
+	-------
+	results : dict
+		Environment steps per second keyed by number of environments
+	"""
+	kwargs = {'N_hid':25, 'minibatch_size':2, 'memory_size':10000}
+	kwargs.update(agent_kwargs)
+	results = {}
+	for n_env in n_envs:
+		env = EQLM.VecCartPole(n_env=n_env, seed=0)
+		agent = EQLM.QAgent(env, net_type=net_type, **kwargs)
+		s = env.reset()
+		n_iter = max(n_transition//n_env,1)
+		t0 = time.perf_counter()
+		for i in range(n_iter):
+			a = agent.action_select_batch(s)
+			s, r, done, _ = env.step(a)
+			agent.update_batch(s,r,done)
+		results[n_env] = n_iter*n_env/(time.perf_counter()-t0)
+		agent.close()
+		print('{:>12} B={:<4} {:>10.1f} env steps/s'.format(net_type,n_env,results[n_env]))
+	return results
+
+
+def bench_replay_sample(capacities=(10**4,10**5,10**6), minibatch_size=32, n_sample=2000, N_hid=25):
+	"""
+	Measure ReplayMemory.sample latency with uniform and prioritised sampling
+
+	Prioritised timings include setting the priorities of each minibatch, as
+	done after every network update.
+
+	...
+
+	Parameters
+	----------
+	capacities : tuple of int, optional
+		Memory sizes to test, each filled before timing
+	minibatch_size : int, optional
+		Number of transitions in each sample
+	n_sample : int, optional
+		Number of timed samples for each configuration
+	N_hid : int, optional
+		Size of the stored (preprocessed) states
+
+	Returns
+	-------
+	results : dict
+		Microseconds per sample keyed by (capacity, priority_alpha)
+	"""
+	results = {}
+	rand_state = np.random.RandomState(0)
+	for capacity in capacities:
+		s = rand_state.uniform(-1,1,(capacity,N_hid)).astype(np.float32)
+		a = rand_state.randint(2,size=capacity)
+		r = rand_state.uniform(size=capacity)
+		done = rand_state.uniform(size=capacity) < 0.05
+		for alpha in (None,0.6):
+			memory = EQLM.ReplayMemory(memory_size=capacity, seed=0, priority_alpha=alpha)
+			memory.add_batch(s,a,r,s,done)
+			td_error = rand_state.uniform(-1,1,(n_sample,minibatch_size))
+			t0 = time.perf_counter()
+			for i in range(n_sample):
+				memory.sample(minibatch_size)
+				memory.update_priorities(td_error[i])
+			results[(capacity,alpha)] = 1e6*(time.perf_counter()-t0)/n_sample
+			print('capacity={:<8} priority_alpha={!s:<5} {:>8.1f} us/sample'.format(
+				capacity,alpha,results[(capacity,alpha)]))
+	return results
+
+
+def bench_policy(net_types=('ELMNet','QNet'), N_hid=25, n_call=5000, batch_size=4096):
+	"""
+	Compare greedy action latency of a tensorflow network and its exported NumpyPolicy
+
+	...
+
+	Parameters
+	----------
+	net_types : tuple of str, optional
+		Names of the network classes to export
+	N_hid : int, optional
+		Number of hidden nodes
+	n_call : int, optional
+		Number of timed single state evaluations
+	batch_size : int, optional
+		Number of states in the timed batch evaluation
+
+	Returns
+	-------
+	results : dict
+		Microseconds per single state action keyed by (net_type, 'tf' or 'numpy'), and
+		states per second of the batch API keyed by (net_type, 'batch')
+	"""
+	results = {}
+	rand_state = np.random.RandomState(0)
+	S = rand_state.uniform(-1,1,(batch_size,4)).astype(np.float32)
+	for net_type in net_types:
+		sess = EQLM.new_session()
+		with sess.graph.as_default():
+			nn = getattr(EQLM,net_type)(4, 2, N_hid=N_hid, sess=sess)
+		policy = EQLM.export_policy(nn.get_params())
+		for name, f in (('tf',lambda s: np.argmax(nn.Q_predict(s))), ('numpy',policy.action_select)):
+			t0 = time.perf_counter()
+			for i in range(n_call):
+				f(S[i%batch_size:i%batch_size+1])
+			results[(net_type,name)] = 1e6*(time.perf_counter()-t0)/n_call
+			print('{:>8} {:>6} {:>10.2f} us/action'.format(net_type,name,results[(net_type,name)]))
+		t0 = time.perf_counter()
+		policy.action_batch(S)
+		results[(net_type,'batch')] = batch_size/(time.perf_counter()-t0)
+		print('{:>8} {:>6} {:>10.0f} states/s'.format(net_type,'batch',results[(net_type,'batch')]))
+		nn.close()
+	return results
+
+
+def bench_profiler(net_type='NumpyELMNet', n_step=3000, n_phase=10**6, **agent_kwargs):
+	"""
+	Measure the overhead of the agent profiler and report the time in each phase
+
+	...
+
+	Parameters
+	----------
+	net_type : str, optional
+		Name of the network class used by the agent
+	n_step : int, optional
+		Number of timed update steps with the profiler disabled and enabled
+	n_phase : int, optional
+		Number of timed empty phase blocks
+	**agent_kwargs
+		Additional keyword arguments passed to `QAgent`
+
+	Returns
+	-------
+	results : dict
+		Microseconds per empty phase block and per agent step keyed by 'disabled'
+		and 'enabled', and the profiler summary keyed by 'summary'
+	"""
+	results = {}
+	env = EQLM.VecCartPole(1)
+	agent_kwargs = {'N_hid':25, 'k':32, 'memory_size':10000, **agent_kwargs}
+	agent = EQLM.QAgent(env, net_type=net_type, seed=0, **agent_kwargs)
+	s = env.reset()
+	for _ in range(n_step): # fill the memory so both timed runs update every step
+		a = agent.action_select_batch(s)
+		s, r, done, _ = env.step(a)
+		agent.update_batch(s,r,done)
+	for enabled in (False, True):
+		if enabled:
+			agent.profiler.enable()
+		phase = agent.profiler.phase
+		t0 = time.perf_counter()
+		for _ in range(n_phase):
+			with phase('update'):
+				pass
+		t_phase = 1e6*(time.perf_counter()-t0)/n_phase
+		agent.profiler.reset()
+		t0 = time.perf_counter()
+		for _ in range(n_step):
+			a = agent.action_select_batch(s)
+			with phase('env_step'):
+				s, r, done, _ = env.step(a)
+			agent.update_batch(s,r,done)
+		t_step = 1e6*(time.perf_counter()-t0)/n_step
+		name = 'enabled' if enabled else 'disabled'
+		results[name] = {'phase':t_phase, 'step':t_step}
+		print('{:>9} {:>8.3f} us/phase {:>10.1f} us/step'.format(name,t_phase,t_step))
+	results['summary'] = agent.profiler.summary()
+	for name, p in results['summary']['phases'].items():
+		print('{:>12} {:>8} calls {:>10.1f} us/call {:>6.1%}'.format(name,p['count'],1e6*p['mean'],p['fraction']))
+	print('{:>12} {:>35.1%}'.format('other',results['summary']['other']/results['summary']['total']))
+	agent.close()
+	return results
+
+
+class AlternatingHeuristic(object):
+	"""Heuristic for the initial CartPole episodes which alternates left and right, as in the notebook"""
+	def __init__(self):
+		self.step_no = 0
+
+	def action(self, *args):
+		self.step_no += 1
+		return self.step_no%2
+
+def bench_forgetting(forgetting_factors=(1.0,0.99,0.95), net_type='NumpyELMNet', seeds=tuple(range(6)),
+					 N_ep=600, R_solve=195.0, n_avg=10, **agent_kwargs):
+	"""
+	Compare episodes and wall-clock time to solve CartPole with and without a forgetting factor
+
+	A run is solved when the mean reward over the last `n_avg` episodes reaches
+	`R_solve`. Agents use the notebook EQLM hyper-parameters and heuristic.
+
+	...
+
+	Parameters
+	----------
+	forgetting_factors : tuple of float, optional
+		Forgetting factors of the LS-IELM update, 1 being the standard update
+	net_type : str, optional
+		Name of the network class used by the agent
+	seeds : tuple of int, optional
+		Seeds of the runs for each forgetting factor
+	N_ep : int, optional
+		Maximum number of episodes in each run
+	R_solve : float, optional
+		Mean reward at which the environment is solved
+	n_avg : int, optional
+		Number of episodes the reward is averaged over
+	**agent_kwargs
+		Additional keyword arguments passed to `QAgent`
+
+	Returns
+	-------
+	results : dict
+		Lists of episodes and seconds to solve each run, None for unsolved runs,
+		keyed by (forgetting_factor, 'episodes') and (forgetting_factor, 'time')
+	"""
+	results = {}
+	agent_kwargs = {'gamma_reg':1.827e-5, 'N_hid':25, 'eps_i':0.559, 'n_eps':360, 'gamma':0.93,
+					'minibatch_size':2, 'memory_size':10000, 'n_heur':5, **agent_kwargs}
+	for forgetting_factor in forgetting_factors:
+		episodes, times = [], []
+		for seed in seeds:
+			np.random.seed(seed)
+			env = EQLM.Environment('CartPole-v0')
+			env.reset(seed=seed)
+			env.action_space.seed(seed)
+			agent = EQLM.QAgent(env, net_type=net_type, seed=seed, forgetting_factor=forgetting_factor,
+								f_heur=AlternatingHeuristic().action, **agent_kwargs)
+			R_ep = []
+			ep_solve = t_solve = None
+			t0 = time.perf_counter()
+			for ep_no in range(N_ep):
+				R_ep.extend(EQLM.train_agent(agent, env, 1)[0])
+				if len(R_ep) >= n_avg and np.mean(R_ep[-n_avg:]) >= R_solve:
+					ep_solve, t_solve = ep_no+1, time.perf_counter()-t0
+					break
+			episodes.append(ep_solve)
+			times.append(t_solve)
+			agent.close()
+			env.close()
+		results[(forgetting_factor,'episodes')] = episodes
+		results[(forgetting_factor,'time')] = times
+		solved = [i for i, ep in enumerate(episodes) if ep is not None]
+		print('{:>6} solved {}/{} median {:>6} episodes {:>8} s'.format(
+			forgetting_factor, len(solved), len(seeds),
+			np.median([episodes[i] for i in solved]) if solved else '-',
+			'{:.1f}'.format(np.median([times[i] for i in solved])) if solved else '-'))
+	return results
+
+
+def bench_ensemble(n_heads=(1,5,10), N_hid=25, minibatch_size=8, n_step=500):
+	"""
+	Compare an EnsembleELMNet with M heads to M separate ELMNets updated on the same transitions
+
+	Each step evaluates one state and runs one fused update on a minibatch.
+
+	...
+
+	Parameters
+	----------
+	n_heads : tuple of int, optional
+		Numbers of heads M
+	N_hid : int, optional
+		Number of hidden nodes
+	minibatch_size : int, optional
+		Number of transitions in each update
+	n_step : int, optional
+		Number of timed steps
+
+	Returns
+	-------
+	results : dict
+		Microseconds per step keyed by (M, 'separate') and (M, 'ensemble')
+	"""
+	results = {}
+	rand_state = np.random.RandomState(0)
+	k = minibatch_size
+	s = rand_state.uniform(-1,1,(1,4)).astype(np.float32)
+	batch = (rand_state.randn(k,N_hid), rand_state.randint(2,size=k), rand_state.randn(k),
+			 rand_state.randn(k,N_hid), np.zeros(k,dtype=bool))
+	def build(net_type, **kwargs):
+		sess = EQLM.new_session()
+		with sess.graph.as_default():
+			nn = getattr(EQLM,net_type)(4, 2, N_hid=N_hid, minibatch_size=k, sess=sess, **kwargs)
+			nn_target = getattr(EQLM,net_type)(4, 2, N_hid=N_hid, is_target=True, sess=sess, **kwargs)
+			nn_target.build_sync(nn)
+			nn.build_train_step(nn_target, 0.9)
+		nn_target.sync()
+		return nn
+	for M in n_heads:
+		for name, nets in (('separate',[build('ELMNet') for _ in range(M)]),
+						   ('ensemble',[build('EnsembleELMNet',n_heads=M)])):
+			for nn in nets:
+				nn.Q_predict(s)
+				nn.train_step(*batch)
+			t0 = time.perf_counter()
+			for _ in range(n_step):
+				for nn in nets:
+					nn.Q_predict(s)
+					nn.train_step(*batch)
+			results[(M,name)] = 1e6*(time.perf_counter()-t0)/n_step
+			print('{:>3} heads {:>9} {:>10.1f} us/step'.format(M,name,results[(M,name)]))
+			for nn in nets:
+				nn.close()
+	return results
+
+
+def pole_heuristic(s):
+	"""CartPole heuristic pushing the cart towards the side the pole is falling"""
+	return int(s[2] + 0.5*s[3] > 0)
+
+def pole_heuristic_batch(s):
+	"""`pole_heuristic` for the states of a batch of environments, one row each"""
+	return (s[:,2] + 0.5*s[:,3] > 0).astype(int)
+
+def bench_qlearn_demo(N_demo=500, n_envs=(1,64), n_repeat=3):
+	"""
+	Measure demonstration transitions per second of QLearn's `heuristic_memory_demo`
+
+	Demonstrations of `pole_heuristic` are generated with QLearn's
+	`VecCartPole` for each number of environments, calling the heuristic
+	once per state, and with `pole_heuristic_batch` called once per step of
+	the batch. One environment steps one episode at a time, as the
+	sequential generation does.
+
+	...
+
+	Parameters
+	----------
+	N_demo : int, optional
+		Number of demonstration episodes
+	n_envs : tuple of int, optional
+		Numbers of environments stepped together
+	n_repeat : int, optional
+		Number of timed generations, the fastest is kept
+
+	Returns
+	-------
+	results : dict
+		Transitions per second keyed by (n_env, 'single') for per-state
+		heuristic calls and (n_env, 'batch') for batch heuristic calls
+	"""
+	sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+	import QLearn
+	results = {}
+	for n_env in n_envs:
+		for name, H, batch_heuristic in (('single',pole_heuristic,False), ('batch',pole_heuristic_batch,True)):
+			t_best = np.inf
+			for _ in range(n_repeat):
+				env = QLearn.VecCartPole(n_env, seed=0)
+				t0 = time.perf_counter()
+				demos = QLearn.heuristic_memory_demo(H, env, N_demo, show_progress=False,
+													 batch_heuristic=batch_heuristic)
+				t_best = min(t_best, time.perf_counter()-t0)
+			results[(n_env,name)] = len(demos)/t_best
+			print('{:>3} envs {:>6} heuristic {:>7} transitions {:>9.0f} transitions/s'.format(
+				n_env, name, len(demos), results[(n_env,name)]))
+	return results
+
+def bench_demo_pretrain(net_type='NumpyELMNet', N_demo=100, n_env=64, n_iter=30, weights=(1.0,0.1),
+						seeds=tuple(range(6)), N_ep=600, R_solve=195.0, n_avg=10, **agent_kwargs):
+	"""
+	Time generating demonstrations and compare training with and without pretraining on them
+
+	Demonstrations of `pole_heuristic` are generated one episode at a time and
+	with a `VecCartPole`. Agents with the notebook EQLM hyper-parameters are
+	trained either with the notebook heuristic for the first episodes, or
+	after `QAgent.pretrain` on the demonstrations with each weight, and a run
+	is solved when the mean reward over the last `n_avg` episodes reaches
+	`R_solve`.
+
+	...
+
+	Parameters
+	----------
+	net_type : str, optional
+		Name of the network class used by the agent
+	N_demo : int, optional
+		Number of demonstration episodes
+	n_env : int, optional
+		Number of environments in the `VecCartPole`
+	n_iter : int, optional
+		Number of fitted Q-iterations when pretraining
+	weights : tuple of float, optional
+		Weights of the demonstrations when pretraining
+	seeds : tuple of int, optional
+		Seeds of the runs for each method
+	N_ep : int, optional
+		Maximum number of episodes in each run
+	R_solve : float, optional
+		Mean reward at which the environment is solved
+	n_avg : int, optional
+		Number of episodes the reward is averaged over
+	**agent_kwargs
+		Additional keyword arguments passed to `QAgent`
+
+	Returns
+	-------
+	results : dict
+		Seconds to generate the demonstrations keyed by ('demo', 'single') and
+		('demo', 'batch'), and lists of episodes to solve each run, None for
+		unsolved runs, keyed by 'heuristic' or the pretraining weight
+	"""
+	results = {}
+	env = EQLM.Environment('CartPole-v0')
+	env.reset(seed=0)
+	for name, demo_env in (('single',env), ('batch',EQLM.VecCartPole(n_env, seed=0))):
+		t0 = time.perf_counter()
+		demos = EQLM.heuristic_memory_demo(pole_heuristic, demo_env, N_demo)
+		results[('demo',name)] = time.perf_counter()-t0
+		print('demos {:>6} {:>8} transitions {:>8.3f} s'.format(name, len(demos), results[('demo',name)]))
+	env.close()
+
+	agent_kwargs = {'gamma_reg':1.827e-5, 'N_hid':25, 'eps_i':0.559, 'n_eps':360, 'gamma':0.93,
+					'minibatch_size':2, 'memory_size':10000, **agent_kwargs}
+	for method in ('heuristic',)+tuple(weights):
+		episodes = []
+		for seed in seeds:
+			np.random.seed(seed)
+			env = EQLM.Environment('CartPole-v0')
+			env.reset(seed=seed)
+			env.action_space.seed(seed)
+			if method == 'heuristic':
+				agent = EQLM.QAgent(env, net_type=net_type, seed=seed, n_heur=5,
+									f_heur=AlternatingHeuristic().action, **agent_kwargs)
+			else:
+				agent = EQLM.QAgent(env, net_type=net_type, seed=seed, **agent_kwargs)
+				agent.pretrain(demos, n_iter=n_iter, weight=method)
+			R_ep = []
+			ep_solve = None
+			for ep_no in range(N_ep):
+				R_ep.extend(EQLM.train_agent(agent, env, 1)[0])
+				if len(R_ep) >= n_avg and np.mean(R_ep[-n_avg:]) >= R_solve:
+					ep_solve = ep_no+1
+					break
+			episodes.append(ep_solve)
+			agent.close()
+			env.close()
+		results[method] = episodes
+		solved = [ep for ep in episodes if ep is not None]
+		print('{:>9} solved {}/{} median {:>6} episodes'.format(
+			method, len(solved), len(seeds), np.median(solved) if solved else '-'))
+	return results
+
+
+def import_time(module, cwd=None):
+	"""
+	Measure the cumulative import time of a module in a fresh interpreter with `-X importtime`
+
+	...
+
+	Parameters
+	----------
+	module : str
+		Name of the module to import
+	cwd : str, optional
+		Directory the interpreter is run from, default the current directory
+
+	Returns
+	-------
+	t_import : float
+		Cumulative import time of the module in ms
+	loaded : list of str
+		Heavy backends (tensorflow, gym, tqdm, scipy) imported as a side effect
+	"""
+	backends = ('tensorflow','gym','tqdm','scipy')
+	code = 'import sys, {0}; print(*[m for m in {1} if m in sys.modules])'.format(module, backends)
+	out = subprocess.run([sys.executable,'-X','importtime','-c',code], cwd=cwd,
+						 capture_output=True, text=True, check=True)
+	for line in out.stderr.splitlines():
+		fields = line.split('|')
+		if len(fields) == 3 and fields[2].strip() == module:
+			t_import = int(fields[1])/1e3
+	return t_import, out.stdout.split()
+
+def bench_import_time(modules=('EQLM.utils','EQLM','QLearn'), budget_ms=1000, n_repeat=3):
+	"""
+	Check importing the packages and the results utilities stays within a time budget
+
+	Neither package should import tensorflow, gym, tqdm or scipy until a
+	network, environment or progress bar is first used.
+
+	...
+
+	Parameters
+	----------
+	modules : tuple of str, optional
+		Modules to import, QLearn is imported from the parent folder
+	budget_ms : float, optional
+		Maximum cumulative import time of each module in ms
+	n_repeat : int, optional
+		Number of fresh interpreters per module, the fastest is reported
+
+	Returns
+	-------
+	results : dict
+		Import time in ms keyed by module
+
+	Raises
+	------
+	RuntimeError
+		If a module exceeds the budget or imports a heavy backend
+	"""
+	results = {}
+	failures = []
+	root = os.path.dirname(os.path.abspath(__file__))
+	for module in modules:
+		cwd = os.path.dirname(root) if module.startswith('QLearn') else root
+		times, loaded = zip(*[import_time(module, cwd) for _ in range(n_repeat)])
+		results[module] = min(times)
+		print('{:>12} {:>8.1f} ms  backends imported: {}'.format(module, results[module], loaded[0] or 'none'))
+		if results[module] > budget_ms or loaded[0]:
+			failures.append(module)
+	if failures:
+		raise RuntimeError('Import budget of {} ms without backends exceeded by {}'.format(budget_ms, failures))
+	return results
+
+
+def mlp_steps(net_type, batch_sizes, n_step, fname, fused=False, n_parity=20, gamma=0.9):
+	"""
+	Time Q-learning steps of a QLearn network in this interpreter, run by `bench_mlp_compiled`
+
+	Each step predicts action-values for a minibatch with the network and
+	for the next states with its target network, then updates on the
+	targets, or calls the network's `train_step` if `fused`. Networks start
+	from the same parameters in every interpreter.
+	The parameters after `n_parity` steps on the first minibatch size are
+	kept to check that the update rules match.
+
+	...
+
+	Parameters
+	----------
+	net_type : str
+		Name of the QLearn network class
+	batch_sizes : tuple of int
+		Minibatch sizes
+	n_step : int
+		Number of timed steps for each minibatch size
+	fname : str
+		File the results are pickled to
+	fused : bool, optional
+		Use the network's fused `train_step`
+	n_parity : int, optional
+		Number of steps before the parameters are kept
+	gamma : float, optional
+		Discount factor of the targets
+	"""
+	sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+	from QLearn import networks
+	net_module = getattr(networks, net_type)
+	rand_state = np.random.RandomState(0)
+	p0 = {'w':[rand_state.uniform(0,0.1,(4,20)), rand_state.uniform(0,0.1,(20,10))],
+		  'b':[np.zeros((1,20)), np.zeros((1,10))], 'W':rand_state.uniform(0,0.1,(10,2))}
+	results = {'steps':{}, 'params':None}
+	for k in batch_sizes:
+		nn = net_module(4, 2, minibatch_size=k)
+		nn_target = net_module(4, 2, is_target=True, sess=nn.sess)
+		nn_target.build_sync(nn)
+		nn.assign_params(p0)
+		nn_target.sync()
+		if fused:
+			nn.build_train_step(nn_target, gamma)
+		batches = [(rand_state.randn(k,4), rand_state.randint(2,size=k), rand_state.randn(k),
+					rand_state.randn(k,4)) for _ in range(16)]
+		ind = np.arange(k)
+		done = np.zeros(k, dtype=bool)
+		def step(i):
+			s, a, r, s_next = batches[i%len(batches)]
+			if fused:
+				nn.train_step(s, a, r, s_next, done)
+				return
+			Q = nn.Q_predict(s)
+			Q[ind,a] = r + gamma*np.max(nn_target.Q_predict(s_next),1)
+			nn.update(s, Q)
+		for i in range(n_parity):
+			step(i)
+		if results['params'] is None:
+			results['params'] = nn.get_params()
+		t0 = time.perf_counter()
+		for i in range(n_step):
+			step(i)
+		results['steps'][k] = n_step/(time.perf_counter()-t0)
+	with open(fname,'wb') as f:
+		pickle.dump(results, f)
+
+def bench_mlp_compiled(variants=(('MLPQNet',False),('CompiledMLPQNet',False),('CompiledMLPQNet',True)),
+					   batch_sizes=(10,64,256), n_step=1000):
+	"""
+	Compare steps per second of QLearn's session MLPQNet and XLA compiled CompiledMLPQNet
+
+	Each variant runs in a fresh interpreter with `mlp_steps`, since the
+	session path disables the eager execution needed by the compiled path.
+	Compilation happens in the untimed steps before the parameters are
+	compared.
+
+	...
+
+	Parameters
+	----------
+	variants : tuple of (str, bool), optional
+		Names of the QLearn network classes and whether the fused `train_step` is
+		used, the first is the reference for parity
+	batch_sizes : tuple of int, optional
+		Minibatch sizes
+	n_step : int, optional
+		Number of timed steps for each minibatch size
+
+	Returns
+	-------
+	results : dict
+		Steps per second keyed by (name, batch_size), and the largest absolute
+		difference from the reference parameters keyed by (name, 'parity'), where
+		name is the class name with ' fused' appended for fused variants
+	"""
+	results = {}
+	root = os.path.dirname(os.path.abspath(__file__))
+	params = {}
+	with tempfile.TemporaryDirectory() as tmp:
+		for net_type, fused in variants:
+			name = net_type + (' fused' if fused else '')
+			fname = os.path.join(tmp, name)
+			code = 'import benchmarks; benchmarks.mlp_steps({!r}, {!r}, {}, {!r}, {})'.format(
+				net_type, tuple(batch_sizes), n_step, fname, fused)
+			subprocess.run([sys.executable,'-c',code], cwd=root, capture_output=True, check=True)
+			with open(fname,'rb') as f:
+				out = pickle.load(f)
+			params[name] = out['params']
+			for k in batch_sizes:
+				results[(name,k)] = out['steps'][k]
+	ref = params[variants[0][0] + (' fused' if variants[0][1] else '')]
+	for name, p in params.items():
+		results[(name,'parity')] = max(np.max(np.abs(np.asarray(x)-np.asarray(y)))
+			for x, y in zip([p['W']]+p['w']+p['b'], [ref['W']]+ref['w']+ref['b']))
+		print('{:>22} {}  max parameter difference {:.1e}'.format(name, '  '.join(
+			'k={} {:>7.0f} steps/s'.format(k, results[(name,k)]) for k in batch_sizes),
+			results[(name,'parity')]))
+	return results
+
+
+benchmarks = {'elm_update':bench_elm_update,
+			  'agent_update':bench_agent_update,
+			  'agent_construction':bench_agent_construction,
+			  'vec_env':bench_vec_env,
+			  'replay_sample':bench_replay_sample,
+			  'hr_step':bench_hr_step,
+			  'hr_tracking':bench_hr_tracking,
+			  'elm_batch_size':bench_elm_batch_size,
+			  'policy':bench_policy,
+			  'import_time':bench_import_time,
+			  'profiler':bench_profiler,
+			  'forgetting':bench_forgetting,
+			  'ensemble':bench_ensemble,
+			  'demo_pretrain':bench_demo_pretrain,
+			  'qlearn_demo':bench_qlearn_demo,
+			  'mlp_compiled':bench_mlp_compiled}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('names', nargs='*', default=sorted(benchmarks),
+						help='Benchmarks to run from {}, default all'.format(sorted(benchmarks)))
+	names = parser.parse_args().names
+	for name in names:
+		if name not in benchmarks:
+			parser.error('Invalid benchmark: \'{}\''.format(name))
+	for name in names:
+		print('---- ' + name)
+		benchmarks[name]()
@@ -36,6 +36,7 @@ sys.path.append(nnfun_path)
 import numpy as np
 import random
 from deap import gp
+from GP.GP_Algorithms.GP_CompileCache import compile_cache
 from scipy.integrate import simps
 import time
 from sklearn import preprocessing
@@ -541,8 +542,8 @@ def evaluate_ascent(individual, pset, **k):
     """This function is used to evalute the fitness function of the GP individuals for an ascent mission"""
 
     penalty = []
-    falfa = gp.compile(individual[0], pset=pset)
-    fdelta = gp.compile(individual[1], pset=pset)
+    falfa = compile_cache(individual[0], pset)
+    fdelta = compile_cache(individual[1], pset)
 
     cl = k['kwargs']['cl']
     cd = k['kwargs']['cd']
@@ -812,11 +813,11 @@ def sys2GP_NN(t, x, expr1, expr2, height_start, deltaH, v_wind, Control, model,
         input = preprocessing.normalize(np.array([[t, v, chi, gamma, theta, lam, h, ev, echi, egamma, etheta, elam, eh]]))
         prediction = model.predict(input)[0]
         ex1, ex2 = optiutils.update_eqs([expr1, expr2], prediction)
-        fAlpha = gp.compile(ex1, pset=pset)
+        fAlpha = gp.compile(ex1, pset=pset)  # retuned at every call, not worth caching
         fDelta = gp.compile(ex2, pset=pset)
     else:
-        fAlpha = gp.compile(expr1, pset=pset)
-        fDelta = gp.compile(expr2, pset=pset)
+        fAlpha = compile_cache(expr1, pset)
+        fDelta = compile_cache(expr2, pset)
 
     alfa = alphafun(t) + fAlpha(ev, echi, egamma, eh)
     delta = deltafun(t) + fDelta(ev, echi, egamma, eh)
@@ -1055,8 +1056,8 @@ def evaluate_reentry(individual, pset, **k):
     """This function is used to evalute the fitness function of the GP individuals"""
     penalty = []
 
-    falfa = gp.compile(individual[0], pset=pset)
-    fsigma = gp.compile(individual[1], pset=pset)
+    falfa = compile_cache(individual[0], pset)
+    fsigma = compile_cache(individual[1], pset)
 
     obj = k['kwargs']['obj']
     vfun = k['kwargs']['vfun']
@@ -49,6 +49,7 @@ import GP.GP_Algorithms.IGP.IGP_Functions as funs
 import GP.GPBased_ControlSchemes.Intelligent_nonIntelligent_GPControl.FESTIP.FESTIP_Models.models_FESTIP as mods
 import scipy.io as sio
 import GP.GP_Algorithms.GP_PrimitiveSet as gpprim
+from GP.GP_Algorithms.GP_CompileCache import compile_cache
 import GP.GP_Algorithms.IGP.Recombination_operators as rop
 
 matplotlib.rcParams.update({'font.size': 22})
@@ -221,7 +222,7 @@ toolbox.register("legs", tools.initCycle, list, [toolbox.leg, toolbox.leg], n=1)
 toolbox.register("individual", tools.initIterate, creator.Individual, toolbox.legs)
 toolbox.register("population", tools.initRepeat, list, toolbox.individual)
 toolbox.register("popx", tools.initIterate, list, initPOP1)
-toolbox.register("compile", gp.compile, pset=pset)
+toolbox.register("compile", compile_cache, pset=pset)
 toolbox.register("evaluate", mods.evaluate_reentry)
 toolbox.register("select", funs.InclusiveTournamentV2, selected_individuals=1, fitness_size=2, parsimony_size=1.6, creator=creator)
 toolbox.register("mate", rop.xmate)
@@ -27,7 +27,7 @@
 
 import numpy as np
 from scipy.integrate import solve_ivp, simps
-from deap import gp
+from GP.GP_Algorithms.GP_CompileCache import compile_cache
 
 
 def evaluate(individual, pset, **k):
@@ -49,8 +49,8 @@ def evaluate(individual, pset, **k):
     """
     penalty = []
 
-    fTr = gp.compile(expr=individual[0], pset=pset[0])
-    fTt = gp.compile(expr=individual[1], pset=pset[1])
+    fTr = compile_cache(individual[0], pset[0])
+    fTt = compile_cache(individual[1], pset[1])
 
     Rfun = k['kwargs']['Rfun']
     Thetafun = k['kwargs']['Thetafun']
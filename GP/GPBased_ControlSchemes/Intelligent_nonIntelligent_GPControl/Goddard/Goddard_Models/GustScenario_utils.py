@@ -25,7 +25,7 @@
 '''Functions used by the propagators in the MAIN_GustScenario.py file'''
 
 import numpy as np
-from deap import gp
+from GP.GP_Algorithms.GP_CompileCache import compile_cache
 from scipy.integrate import solve_ivp, simps
 
 def evaluate(individual, pset, **k):
@@ -47,8 +47,8 @@ def evaluate(individual, pset, **k):
     """
     penalty = []
 
-    fTr = gp.compile(expr=individual[0], pset=pset[0])
-    fTt = gp.compile(expr=individual[1], pset=pset[1])
+    fTr = compile_cache(individual[0], pset[0])
+    fTt = compile_cache(individual[1], pset[1])
 
     Rfun = k['kwargs']['Rfun']
     Thetafun = k['kwargs']['Thetafun']
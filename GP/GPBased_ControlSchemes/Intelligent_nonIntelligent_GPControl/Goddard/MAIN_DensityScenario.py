@@ -50,6 +50,7 @@ sys.path.append(gpfun_path)
 import GP.GPBased_ControlSchemes.Intelligent_nonIntelligent_GPControl.Goddard.Goddard_Models.DensityScenario_utils as utils
 import GP.GP_Algorithms.IGP.IGP_Functions as funs
 import GP.GP_Algorithms.GP_PrimitiveSet as gpprim
+from GP.GP_Algorithms.GP_CompileCache import compile_cache
 import GP.GP_Algorithms.IGP.Recombination_operators as rops
 import GP.GPBased_ControlSchemes.Intelligent_nonIntelligent_GPControl.Goddard.Goddard_Models.rocket as vehicle
 
@@ -253,8 +254,8 @@ toolbox.register("legs", tools.initCycle, list, [toolbox.legR, toolbox.legT], n=
 toolbox.register("individual", tools.initIterate, creator.Individual, toolbox.legs)
 toolbox.register("population", tools.initRepeat, list, toolbox.individual)
 toolbox.register("popx", tools.initIterate, list, initPOP1)
-toolbox.register("compileR", gp.compile, pset=psetR)
-toolbox.register("compileT", gp.compile, pset=psetT)
+toolbox.register("compileR", compile_cache, pset=psetR)
+toolbox.register("compileT", compile_cache, pset=psetT)
 toolbox.register("evaluate", utils.evaluate)
 toolbox.register("select", funs.InclusiveTournament, selected_individuals=1, parsimony_size=1.6, creator=creator, greed_prevention=True)
 toolbox.register("mate", rops.xmate)
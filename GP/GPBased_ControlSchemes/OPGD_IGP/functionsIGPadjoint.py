@@ -38,6 +38,7 @@ sys.path.append(os.path.abspath(os.path.join(dirname, '..')))
 sys.path.append(os.path.abspath(os.path.join(dirname, '..', '..', 'test_cases')))
 import numpy as np
 import GP.GP_Algorithms.IGP.IGP_Functions_V2 as gpfuns
+from GP.GP_Algorithms.GP_CompileCache import compile_cache
 from scipy.integrate import simps
 from copy import deepcopy, copy
 from deap import gp, creator, base, tools
@@ -149,9 +150,8 @@ def evaluate_individualIGP_adjoint(GPind, **k):
     verbose = k['kwargs']['verbose_adam']
     dynamics = k['kwargs']['dynamics']
     symbols = k['kwargs']['symbols']
-    pset.addTerminal('w')
-    pset.terminals[pset.ret][-1].value = 1  # set initial value of weights to 1
-    weight = deepcopy(pset.terminals[pset.ret][-1])  # store weight terminal
+    weight = gp.Terminal('w', False, pset.ret)  # weight terminal, not added to the shared primitive set
+    weight.value = 1  # set initial value of weights to 1
 
 
     if opt_steps == 0:
@@ -196,10 +196,8 @@ def evaluate_individualIGP_adjoint(GPind, **k):
         opt_params, failure, fit = Adam(obj.alfa, obj.b1, obj.b2, obj.eps, opt_vars, opt_steps, obj, updated_ind, pset,
                                         A_list, B_list, PSI_list, PHI_list, verbose, dynamics)
         if failure is True:
-            del pset.terminals[pset.ret][-1]
             return [1e6, 0]
         else:
-            del pset.terminals[pset.ret][-1]
             return [fit, 0]
 
 
@@ -523,7 +521,7 @@ def propagate_forward(obj, GPind, pset, dynamics):
     u = np.zeros(obj.Npoints)
 
     x[0, :] = obj.x0
-    ufuns = gp.compile(GPind, pset=pset)
+    ufuns = compile_cache(GPind, pset)
     vv = x[0,:]-obj.xf
     u[0] = ufuns(*vv)
     failure = False
@@ -907,7 +905,7 @@ def define_GP_model_pendulum(limit_height, limit_size, obj):
     toolbox.register("expr", gp.genHalfAndHalf, pset=pset, min_=1, max_=4)
     toolbox.register("individual", tools.initIterate, creator.Individual, toolbox.expr)
     toolbox.register("population", tools.initRepeat, list, toolbox.individual)
-    toolbox.register("compile", gp.compile, pset=pset)
+    toolbox.register("compile", compile_cache, pset=pset)
     toolbox.register("evaluate", evaluate_individualIGP_adjoint)
     toolbox.register("select", gpfuns.InclusiveTournament, selected_individuals=1, fitness_size=2, parsimony_size=1.6,
                      creator=creator)
@@ -960,7 +958,7 @@ def define_GP_model_oscillator(limit_height, limit_size, obj):
     toolbox.register("expr", gp.genHalfAndHalf, pset=pset, min_=1, max_=4)
     toolbox.register("individual", tools.initIterate, creator.Individual, toolbox.expr)
     toolbox.register("population", tools.initRepeat, list, toolbox.individual)
-    toolbox.register("compile", gp.compile, pset=pset)
+    toolbox.register("compile", compile_cache, pset=pset)
     toolbox.register("evaluate", evaluate_individualIGP_adjoint)
     toolbox.register("select", gpfuns.InclusiveTournament, selected_individuals=1, fitness_size=2, parsimony_size=1.6,
                      creator=creator)
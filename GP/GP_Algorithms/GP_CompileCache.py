@@ -0,0 +1,91 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+# ------ Copyright (C) 2020 University of Strathclyde and Author ------
+# ---------------- Author: Francesco Marchetti ------------------------
+# ----------- e-mail: francesco.marchetti@strath.ac.uk ----------------
+
+# Alternatively, the contents of this file may be used under the terms
+# of the GNU General Public License Version 3.0, as described below:
+
+# This file is free software: you may copy, redistribute and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3.0 of the License, or (at your
+# option) any later version.
+
+# This file is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/.
+
+"""Process-local cache of the compiled GP individuals, used in place of gp.compile by the evaluation functions"""
+
+from collections import OrderedDict
+from deap import gp
+
+
+class CompileCache(object):
+    """
+    Least recently used cache from the canonical prefix string of a tree to its compiled function.
+
+    gp.compile writes the source code of the tree and calls eval at every evaluation, while elites and clones survive
+    unchanged across generations. The string of a tree includes the values of the ephemeral constants and of the
+    weights, so two trees with the same string compile to the same function. The primitive set is identified by its
+    name, its arguments and the names of its primitives and terminals, so that the copies of the same primitive set
+    received by the worker processes share the cached functions.
+
+    Attributes:
+        maxsize : int
+            maximum number of compiled functions stored
+        hits : int
+            number of calls that found the compiled function in the cache
+        misses : int
+            number of calls that compiled the tree
+        cache : OrderedDict
+            compiled functions, from the least to the most recently used
+    Methods:
+        __call__(expr, pset):
+            return the compiled expression, same as gp.compile(expr, pset)
+        hit_rate():
+            fraction of the calls that found the compiled function in the cache
+        clear():
+            remove the compiled functions and reset the counters
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.cache = OrderedDict()
+
+    def __call__(self, expr, pset):
+        code = str(expr)
+        key = (pset.name, tuple(pset.arguments), tuple(pset.mapping), code)
+        try:
+            func = self.cache[key]
+        except KeyError:
+            self.misses += 1
+            func = gp.compile(code, pset)
+            self.cache[key] = func
+            if len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+            return func
+        self.hits += 1
+        self.cache.move_to_end(key)
+        return func
+
+    def hit_rate(self):
+        calls = self.hits + self.misses
+        return self.hits / calls if calls > 0 else float('nan')
+
+    def clear(self):
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+compile_cache = CompileCache()  # shared by the evaluation functions of the current process
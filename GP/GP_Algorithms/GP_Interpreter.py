@@ -0,0 +1,226 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+# ------ Copyright (C) 2020 University of Strathclyde and Author ------
+# ---------------- Author: Francesco Marchetti ------------------------
+# ----------- e-mail: francesco.marchetti@strath.ac.uk ----------------
+
+# Alternatively, the contents of this file may be used under the terms
+# of the GNU General Public License Version 3.0, as described below:
+
+# This file is free software: you may copy, redistribute and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3.0 of the License, or (at your
+# option) any later version.
+
+# This file is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Vectorised NumPy interpreter evaluating a whole GP population over a dataset in one pass, used in place of gp.compile
+for the symbolic regression benchmarks
+"""
+
+import operator
+import numpy as np
+import GP.GP_Algorithms.GP_PrimitiveSet as gpprim
+
+# functions writing the result of the primitives in the out buffer, with the same values on arrays
+_ufuncs = {operator.add: np.add, operator.sub: np.subtract, operator.mul: np.multiply, operator.neg: np.negative,
+           gpprim.Mul: gpprim.Mul, gpprim.Div: gpprim.Div, gpprim.ModSqrt: gpprim.ModSqrt, gpprim.ModLog: gpprim.ModLog,
+           gpprim.ModExp: gpprim.ModExp, gpprim.Square: gpprim.Square}
+
+
+class PopulationInterpreter(object):
+    """
+    Stack machine evaluating the trees of a whole population over a fixed dataset.
+
+    The prefix arrays of the individuals are read by a stack machine which merges identical subtrees, within the same
+    individual and across individuals, in a single node. The unique nodes are sorted by depth and primitive so that
+    all the nodes of the same primitive at the same depth are computed with a single call over a block of contiguous
+    rows of the scratch buffer. The dataset is processed in chunks of chunk_size points, with the inputs padded to a
+    multiple of chunk_size, so that the scratch buffers keep the same contiguous shape and are reused between chunks
+    and calls.
+
+    Attributes:
+        pset : class
+            primitive set of the individuals
+        inputs : array
+            padded inputs, one row per argument of the primitive set
+        n_points : int
+            number of points of the dataset
+        chunk_size : int
+            number of points evaluated together
+        n_nodes : int
+            number of unique nodes evaluated by the last call to run
+    Methods:
+        run(individuals, fun):
+            evaluate the individuals, calling fun on the outputs of each chunk
+        predict(individuals):
+            return the outputs of the individuals, one row per individual
+    """
+
+    def __init__(self, pset, inputs, chunk_size=1024):
+        inputs = np.atleast_2d(np.asarray(inputs, dtype=float))
+        if inputs.shape[0] != len(pset.arguments):
+            raise ValueError('Inputs have {} rows but the primitive set has {} arguments'.format(inputs.shape[0],
+                                                                                              len(pset.arguments)))
+        self.pset = pset
+        self.n_points = inputs.shape[1]
+        self.chunk_size = min(chunk_size, self.n_points)
+        n_chunks = -(-self.n_points // self.chunk_size)
+        self.inputs = np.pad(inputs, ((0, 0), (0, n_chunks * self.chunk_size - self.n_points)), mode='edge')
+        self.n_nodes = 0
+        self._arguments = {name: i for i, name in enumerate(pset.arguments)}
+        self._buffer = np.empty((0, self.chunk_size))
+        self._scratch = []
+
+    def __getstate__(self):
+        # the scratch buffers are not part of the state, so that the pickled interpreter does not change between calls
+        state = dict(self.__dict__)
+        state['_buffer'] = np.empty((0, self.chunk_size))
+        state['_scratch'] = []
+        return state
+
+    def _scratch_rows(self, j, m):
+        while len(self._scratch) <= j:
+            self._scratch.append(np.empty((0, self.chunk_size)))
+        if self._scratch[j].shape[0] < m:
+            self._scratch[j] = np.empty((max(m, int(1.5 * self._scratch[j].shape[0])), self.chunk_size))
+        return self._scratch[j][:m]
+
+    def _build(self, individuals):
+        """Merge the trees in a graph of unique nodes and return the evaluation plan"""
+        n_args = len(self.pset.arguments)
+        ids = {}
+        nodes = []  # (level, name, function, children) of each unique non argument node
+        constants = []
+        roots = []
+        for ind in individuals:
+            stack = []
+            for node in reversed(ind):
+                if node.arity == 0:
+                    if isinstance(node.value, str) and node.value in self._arguments:
+                        stack.append((self._arguments[node.value], 0))
+                        continue
+                    value = self.pset.context[node.value] if isinstance(node.value, str) else node.value
+                    key = ('const', float(value))
+                    if key not in ids:
+                        ids[key] = len(nodes)
+                        nodes.append((0, None, None, ()))
+                        constants.append((ids[key], float(value)))
+                    stack.append((n_args + ids[key], 0))
+                else:
+                    children = tuple(stack.pop() for _ in range(node.arity))
+                    key = (node.name, tuple(child for child, _ in children))
+                    if key not in ids:
+                        ids[key] = len(nodes)
+                        nodes.append((1 + max(level for _, level in children), node.name,
+                                      self.pset.context[node.name], key[1]))
+                    stack.append((n_args + ids[key], nodes[ids[key]][0]))
+            roots.append(stack.pop()[0])
+
+        # rows of the scratch buffer: arguments, constants, then the nodes sorted by level and primitive
+        order = sorted(range(len(nodes)), key=lambda i: (nodes[i][0], nodes[i][1] or ''))
+        row = np.arange(n_args + len(nodes))
+        row[n_args + np.array(order, dtype=int)] = n_args + np.arange(len(nodes))
+        groups = []
+        start = n_args + len(constants)
+        k = len(constants)
+        while k < len(order):
+            level, name, function, _ = nodes[order[k]]
+            end = k
+            while end < len(order) and nodes[order[end]][:2] == (level, name):
+                end += 1
+            children = row[np.array([nodes[i][3] for i in order[k:end]])]
+            ufunc = function if isinstance(function, np.ufunc) else _ufuncs.get(function)
+            groups.append((start, start + end - k, function, ufunc, children.T.copy()))
+            start += end - k
+            k = end
+        const_rows = row[n_args + np.array([i for i, _ in constants], dtype=int)]
+        const_values = np.array([v for _, v in constants])[:, None]
+        self.n_nodes = len(nodes)
+        return row[np.array(roots, dtype=int)], const_rows, const_values, groups
+
+    def run(self, individuals, fun):
+        """
+        Evaluate the individuals chunk by chunk, calling fun(outputs, first, last) with the outputs of the individuals
+        on the points first to last - 1, one row per individual. The outputs are a scratch buffer overwritten at the
+        next chunk.
+        """
+        n_args = len(self.pset.arguments)
+        roots, const_rows, const_values, groups = self._build(individuals)
+        n_rows = n_args + self.n_nodes
+        if self._buffer.shape[0] < n_rows:
+            self._buffer = np.empty((max(n_rows, int(1.5 * self._buffer.shape[0])), self.chunk_size))
+        buf = self._buffer
+        out = self._scratch_rows(0, len(roots))
+        with np.errstate(all='ignore'):
+            for first in range(0, self.n_points, self.chunk_size):
+                buf[:n_args] = self.inputs[:, first:first + self.chunk_size]
+                buf[const_rows] = const_values
+                for start, end, function, ufunc, children in groups:
+                    # scratch 0 holds the outputs, the arguments of the primitives are gathered from scratch 1
+                    args = [np.take(buf, idx, axis=0, out=self._scratch_rows(j + 1, end - start), mode='clip')
+                            for j, idx in enumerate(children)]
+                    if ufunc is not None:
+                        ufunc(*args, out=buf[start:end])
+                    else:
+                        buf[start:end] = function(*args)
+                np.take(buf, roots, axis=0, out=out, mode='clip')
+                fun(out, first, min(first + self.chunk_size, self.n_points))
+
+    def predict(self, individuals):
+        outputs = np.empty((len(individuals), self.n_points))
+
+        def store(out, first, last):
+            outputs[:, first:last] = out[:, :last - first]
+
+        self.run(individuals, store)
+        return outputs
+
+
+class RMSEEvaluator(object):
+    """
+    Evaluation function of the symbolic regression benchmarks, returning [RMSE, 0.0] for each individual.
+
+    It can be registered as toolbox.evaluate: calling it evaluates one individual, while the eaMuPlusLambdaTol_* loops
+    call evaluate_population to evaluate all the individuals of a generation with a single PopulationInterpreter pass.
+
+    Attributes:
+        interpreter : PopulationInterpreter
+            interpreter holding the inputs of the dataset
+        outputs : array
+            padded target outputs
+    Methods:
+        evaluate_population(individuals):
+            return the fitnesses of the individuals
+    """
+
+    def __init__(self, pset, inputs, outputs, chunk_size=1024):
+        self.interpreter = PopulationInterpreter(pset, inputs, chunk_size)
+        outputs = np.asarray(outputs, dtype=float)
+        self.outputs = np.pad(outputs, (0, self.interpreter.inputs.shape[1] - len(outputs)), mode='edge')
+
+    def evaluate_population(self, individuals):
+        individuals = list(individuals)
+        sse = np.zeros(len(individuals))
+
+        def accumulate(out, first, last):
+            np.subtract(out, self.outputs[first:first + out.shape[1]], out=out)
+            np.square(out, out=out)
+            sse[:] += out[:, :last - first].sum(1)
+
+        with np.errstate(all='ignore'):
+            self.interpreter.run(individuals, accumulate)
+            rmse = np.sqrt(sse / self.interpreter.n_points)
+        return [[fit, 0.0] for fit in rmse]
+
+    def __call__(self, individual, pset=None, **kwargs):
+        return self.evaluate_population([individual])[0]
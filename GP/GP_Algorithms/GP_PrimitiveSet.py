@@ -48,75 +48,26 @@ def Neg(x): return -x
 
 def Abs(x): return abs(x)
 
-def Div(x, y):
-    try:
-        return x / y
-    except ZeroDivisionError:
-        return 0
-
-def Mul(left, right):
-    try:
-        return left * right
-    except (RuntimeError, RuntimeWarning, TypeError, ArithmeticError, BufferError, BaseException, NameError, ValueError,
-            FloatingPointError, OverflowError):
-        return left
-
-def ModSqrt(x):
-    if type(x) == int:
-        x = float(x)
-    if type(x) != float and type(x) != np.float64:
-        id = np.where(x < 0)
-        x[id] = 0
-        return np.sqrt(x)
-    else:
-        if x > 0:
-            return np.sqrt(x)
-        else:
-            return 0
-
-def ModLog(x):
-    if type(x) == int:
-        x = float(x)
-    if type(x) != float and type(x) != np.float64:
-        id = np.where(x <= 0)
-        x[id] = 1e-300
-        return np.log(x)
-    else:
-        if x>0:
-            return np.log(x)
-        else:
-            return np.log(1e-300)
-
-
-def ModExp(x):
-    if type(x) == int:
-        x = float(x)
-    if type(x) != float and type(x) != np.float64:
-        id1 = np.where(x>100)
-        x[id1] = 100
-        id2 = np.where(x<-100)
-        x[id2] = -100
-        return np.exp(x)
-    else:
-        if -100<=x<=100:
-            return np.exp(x)
-        else:
-            if x>0:
-                return np.exp(100)
-            else:
-                return np.exp(-100)
-
-def Square(x):
-    if type(x) == int:
-        x = float(x)
-    if type(x) != float and type(x) != np.float64 and type(x) != int:
-        id1 = np.where(x>1e150)
-        x[id1] = 1e150
-        id2 = np.where(x<-1e150)
-        x[id2] = -1e150
-        return x ** 2
-    else:
-        if -1e150<=x<=1e150:
-            return x ** 2
-        else:
-            return 1e150 ** 2
\ No newline at end of file
+# The protected functions below clamp or mask their input with numpy ufuncs instead of checking its type or catching
+# exceptions, so they behave the same on scalars and arrays, never modify their input and can write the result in a
+# preallocated out array. The values are those of the previous implementations, except that a nan scalar now gives nan
+# as a nan array element did, and that Div gives 0 for a zero divisor in an array as it did for a scalar.
+
+def Div(x, y, out=None):
+    # the zero divisors are replaced by 1 and their quotients by 0; [()] returns a scalar for scalars
+    zero = np.equal(y, 0)
+    out = np.asarray(np.divide(x, np.add(y, zero), out=out))
+    np.copyto(out, 0.0, where=zero)
+    return out[()]
+
+def Mul(left, right, out=None): return np.multiply(left, right, out=out)
+
+def ModSqrt(x, out=None): return np.sqrt(np.maximum(x, 0.0, out=out), out=out)
+
+def ModLog(x, out=None):
+    # the non positive values become 0 + 1e-300, the positive ones are kept exactly as x + 0
+    return np.log(np.add(np.maximum(x, 0.0, out=out), np.less_equal(x, 0.0) * 1e-300, out=out), out=out)
+
+def ModExp(x, out=None): return np.exp(np.minimum(np.maximum(x, -100.0, out=out), 100.0, out=out), out=out)
+
+def Square(x, out=None): return np.square(np.minimum(np.maximum(x, -1e150, out=out), 1e150, out=out), out=out)
@@ -44,6 +44,8 @@ from time import time
 import matplotlib
 import GP.GP_Algorithms.IGP.IGP_Functions as funs
 import GP.GP_Algorithms.GP_PrimitiveSet as gpprim
+from GP.GP_Algorithms.GP_CompileCache import compile_cache
+from GP.GP_Algorithms.GP_Interpreter import RMSEEvaluator
 import GP.GP_Algorithms.IGP.Recombination_operators as rops
 import Benchmarks
 
@@ -55,6 +57,7 @@ inclusive_mutation = True  # True to use inclusive mutation
 inclusive_reproduction = True  # True to use inclusive 1:1 reproduction
 elite_reproduction = True
 save = False
+vectorised = True  # True to evaluate the whole population with the NumPy interpreter of GP_Interpreter
 terminals, npoints = Benchmarks.out_terminals(bench)
 
 nEph = 1  # number of ephemeral constants
@@ -115,7 +118,7 @@ def main():
 
 
 def evaluate(individual, pset, **kwargs):
-    f_ind = gp.compile(individual, pset=pset)
+    f_ind = compile_cache(individual, pset)
     if len(input_true.shape) == 1:
         out = f_ind(*np.array([input_true]))
     else:
@@ -175,7 +178,7 @@ toolbox = base.Toolbox()
 toolbox.register("expr", gp.genHalfAndHalf, pset=pset, min_=1, max_=4)
 toolbox.register("individual", tools.initIterate, creator.Individual, toolbox.expr)
 toolbox.register("population", tools.initRepeat, list, toolbox.individual)
-toolbox.register("compile", gp.compile, pset=pset)
+toolbox.register("compile", compile_cache, pset=pset)
 toolbox.register("evaluate", evaluate)
 toolbox.register("select", funs.InclusiveTournament, selected_individuals=1, parsimony_size=1.6, creator=creator, greed_prevention=False)
 toolbox.register("mate", gp.cxOnePoint)
@@ -201,6 +204,10 @@ if __name__ == '__main__':
         to_save = np.array(['t_evaluate', 'RMSE_train', 'RMSE_test'])
     while n < ntot:
         f, input_true, output_true, input_test, output_test = Benchmarks.select_testcase(bench)
+        if vectorised is True:
+            toolbox.register("evaluate", RMSEEvaluator(pset, input_true, output_true))
+        else:
+            toolbox.register("evaluate", evaluate)
         print("----------------------- Iteration {} ---------------------------".format(n))
         start = time()
         pop, log, hof, pop_statistics, ind_lengths = main()
@@ -45,12 +45,15 @@ import matplotlib
 from GP.GP_Algorithms.SGP import SGP_Functions as funs
 import GP.GP_Algorithms.IGP.IGP_Functions as ifuns
 import GP.GP_Algorithms.GP_PrimitiveSet as gpprim
+from GP.GP_Algorithms.GP_CompileCache import compile_cache
+from GP.GP_Algorithms.GP_Interpreter import RMSEEvaluator
 import GP.GP_Algorithms.IGP.Recombination_operators as rops
 import Benchmarks
 
 
 bench = 'koza1'  # select benchmark to run from [koza1, korns11, S1, S2, UB, ENC, ENH, CCS, ASN]
 save = False
+vectorised = True  # True to evaluate the whole population with the NumPy interpreter of GP_Interpreter
 mod_hof = False  # True to use modified version of hall of fame. False to use standard DEAP hof
 terminals, npoints = Benchmarks.out_terminals(bench)
 
@@ -115,7 +118,7 @@ def main():
 
 
 def evaluate(individual, pset, **kwargs):
-    f_ind = gp.compile(individual, pset=pset)
+    f_ind = compile_cache(individual, pset)
     if len(input_true.shape) == 1:
         out = f_ind(*np.array([input_true]))
     else:
@@ -176,7 +179,7 @@ toolbox = base.Toolbox()
 toolbox.register("expr", gp.genHalfAndHalf, pset=pset, min_=1, max_=4)  ### NEW ###
 toolbox.register("individual", tools.initIterate, creator.Individual, toolbox.expr)  ### NEW ###
 toolbox.register("population", tools.initRepeat, list, toolbox.individual)
-toolbox.register("compile", gp.compile, pset=pset)
+toolbox.register("compile", compile_cache, pset=pset)
 toolbox.register("evaluate", evaluate)
 toolbox.register("select", tools.selDoubleTournament, fitness_size=2, parsimony_size=1.2, fitness_first=True)
 toolbox.register("mate", gp.cxOnePoint)
@@ -202,6 +205,10 @@ if __name__ == '__main__':
         to_save = np.array(['t_evaluate', 'RMSE_train', 'RMSE_test'])
     while n < ntot:
         f, input_true, output_true, input_test, output_test = Benchmarks.select_testcase(bench)
+        if vectorised is True:
+            toolbox.register("evaluate", RMSEEvaluator(pset, input_true, output_true))
+        else:
+            toolbox.register("evaluate", evaluate)
         print("----------------------- Iteration {} ---------------------------".format(n))
         start = time()
         pop, log, hof, pop_statistics, ind_lengths = main()
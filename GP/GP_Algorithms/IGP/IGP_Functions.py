@@ -34,12 +34,18 @@ to Real-World Applications, 23-32. 1995
 import numpy as np
 from copy import deepcopy, copy
 import random
+import numbers
+import hashlib
+from collections import OrderedDict
 from functools import partial, wraps
-from deap import tools
+from deap import tools, gp
 from operator import eq
 import GP.GPBased_ControlSchemes.Intelligent_nonIntelligent_GPControl.FESTIP.FESTIP_Models.models_FESTIP as mods
 import multiprocess
+import os
+from time import perf_counter, process_time
 import _pickle as cPickle
+from GP.GP_Algorithms.GP_CompileCache import compile_cache
 
 
 #######################################################################################################################
@@ -1054,6 +1060,267 @@ class HallOfFame(object):
     def __str__(self):
         return str(self.items)
 
+def _count_compiles(evaluate, item, **kwargs):
+    """Evaluate one item, returning the fitness and the hits and misses of the compile cache during the evaluation"""
+    hits, misses = compile_cache.hits, compile_cache.misses
+    fit = evaluate(item, **kwargs)
+    return fit, compile_cache.hits - hits, compile_cache.misses - misses
+
+
+def _hit_rate(hits, misses):
+    return hits / (hits + misses) if hits + misses > 0 else float('nan')
+
+
+def map_compile_stats(map_fun, evaluate, items, **kwargs):
+    """
+    Function used to evaluate the individuals with map_fun (map, toolbox.map, ...) while counting the hits of the
+    compile caches of the processes where the evaluations take place. If the evaluation function provides
+    evaluate_population, as GP_Interpreter.RMSEEvaluator, all the individuals are evaluated with a single call in the
+    current process
+
+    Attributes:
+        map_fun: function
+            map function
+        evaluate: function
+            evaluation function
+        items: list
+            individuals to evaluate
+        **kwargs:
+            static keyword arguments of the evaluation function
+    Return:
+        fitnesses: list
+            fitnesses of the individuals
+        hit_rate: float
+            fraction of the compilations found in the cache, nan if no individual was compiled
+    """
+    evaluate_population = getattr(getattr(evaluate, 'func', evaluate), 'evaluate_population', None)
+    if evaluate_population is not None:
+        return evaluate_population(items), float('nan')
+    results = list(map_fun(partial(_count_compiles, evaluate, **kwargs), items))
+    return [fit for fit, _, _ in results], _hit_rate(sum(r[1] for r in results), sum(r[2] for r in results))
+
+
+_pool_evaluate = None
+
+
+def _init_pool_worker(evaluate, static_kwargs):
+    """Store the evaluation function with its static keyword arguments in a worker process"""
+    global _pool_evaluate
+    _pool_evaluate = partial(evaluate, **static_kwargs)
+
+
+def _pool_worker(item):
+    """Evaluate one item in a worker process, returning the fitness, the CPU time and the compile cache counters"""
+    t0 = process_time()
+    fit, hits, misses = _count_compiles(_pool_evaluate, item)
+    return fit, process_time() - t0, hits, misses
+
+
+class EvaluationPool(object):
+    """
+    Long-lived pool of worker processes used to evaluate the individuals over a whole evolutionary run.
+
+    The evaluation function and its static keyword arguments (plant object, interpolators, uncertainty profiles, ...)
+    are passed once to each worker by the pool initializer, so that at each generation only the individuals are sent
+    to the workers. With nbCPU = 1 the individuals are evaluated in the calling process, on a copy of the static keyword
+    arguments made once, so that as in the workers the evaluations cannot modify the objects of the caller.
+
+    Attributes:
+        nbCPU : int
+            number of worker processes
+        pool : multiprocess.Pool or None
+            pool of worker processes, None if nbCPU = 1
+        overhead : list
+            pool overhead of each call to map, computed as the elapsed time minus the CPU time spent evaluating in the
+            workers divided by the number of workers that can run in parallel
+        busy : list
+            total CPU time spent evaluating in the workers for each call to map
+        compile_hit_rate : list
+            hit rate of the compile caches of the workers for each call to map
+    Methods:
+        map(items):
+            evaluate the items and return their fitnesses in order
+        close():
+            terminate the worker processes
+    """
+
+    def __init__(self, nbCPU, evaluate, **static_kwargs):
+        self.nbCPU = nbCPU
+        self.overhead = []
+        self.busy = []
+        self.compile_hit_rate = []
+        if nbCPU > 1:
+            self.pool = multiprocess.Pool(nbCPU, initializer=_init_pool_worker, initargs=(evaluate, static_kwargs))
+        else:
+            self.pool = None
+            self._evaluate = partial(evaluate, **deepcopy(static_kwargs))
+
+    def map(self, items):
+        items = list(items)
+        t0 = perf_counter()
+        if self.pool is not None:
+            results = self.pool.map(_pool_worker, items)
+            n_workers = max(1, min(self.nbCPU, len(items), os.cpu_count()))
+        else:
+            results = []
+            for item in items:
+                t_item = process_time()
+                fit, hits, misses = _count_compiles(self._evaluate, item)
+                results.append((fit, process_time() - t_item, hits, misses))
+            n_workers = 1
+        busy = sum(r[1] for r in results)
+        self.busy.append(busy)
+        self.overhead.append(perf_counter() - t0 - busy / n_workers)
+        self.compile_hit_rate.append(_hit_rate(sum(r[2] for r in results), sum(r[3] for r in results)))
+        return [r[0] for r in results]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self.pool is not None:
+            self.pool.terminate()  # do not wait for the pending evaluations
+        self.close()
+
+
+def structural_key(ind):
+    """
+    Function used to build the structural key of an individual, which is the prefix string of its tree or the tuple
+    of the prefix strings of its trees for multi-tree individuals. The strings include the values of the ephemeral
+    constants.
+    """
+    if isinstance(ind, gp.PrimitiveTree):
+        return str(ind)
+    return tuple(str(tree) for tree in ind)
+
+
+class FitnessCache(object):
+    """
+    Least recently used cache from the structural key of the individuals to their fitness, used by the
+    eaMuPlusLambdaTol_* loops to avoid evaluating again the exact copies of already evaluated individuals produced by
+    reproduction, failed mutations and shrink mutations.
+
+    The cache is valid for one scenario, which is identified by the content of the evaluation keyword arguments:
+    numbers, strings and None by value, arrays by their bytes, lists, tuples and dicts by their items and any other
+    object by its pickled state, or by identity if it cannot be pickled. When the scenario changes, also in place, for
+    example when the wind speed of the Goddard gust scenario is resampled or an uncertainty profile is modified, the
+    cache is cleared. The eaMuPlusLambdaTol_* loops clear the cache when they start, and stochastic evaluation
+    functions must set enabled to False.
+
+    Attributes:
+        maxsize : int
+            maximum number of fitnesses stored
+        enabled : bool
+            if False every individual is evaluated
+        hits : int
+            number of individuals whose fitness was found in the cache
+        misses : int
+            number of individuals evaluated
+        cache : OrderedDict
+            fitnesses, from the least to the most recently used
+        scenario : str
+            fingerprint of the scenario of the cached fitnesses
+    Methods:
+        set_scenario(scenario):
+            clear the cache if the scenario changed
+        lookup(individuals, scenario=None):
+            return the individuals that must be evaluated
+        update(fitnesses):
+            store the fitnesses of the individuals returned by the last lookup and return the fitnesses of all the
+            individuals passed to the last lookup, in order
+        clear():
+            remove the stored fitnesses
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.cache = OrderedDict()
+        self.scenario = None
+        self._scenario_objects = []
+        self._pending = None
+
+    def _digest(self, value, digest, objects):
+        if value is None or isinstance(value, (numbers.Number, str)):
+            digest.update(repr((type(value).__name__, value)).encode())
+        elif isinstance(value, np.ndarray):
+            digest.update(repr((value.dtype.str, value.shape)).encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+        elif isinstance(value, (list, tuple)):
+            digest.update(repr((type(value).__name__, len(value))).encode())
+            for item in value:
+                self._digest(item, digest, objects)
+        elif isinstance(value, dict):
+            digest.update(repr(('dict', len(value))).encode())
+            for name in sorted(value, key=repr):
+                self._digest(name, digest, objects)
+                self._digest(value[name], digest, objects)
+        else:
+            try:
+                digest.update(cPickle.dumps(value, protocol=4))
+            except Exception:
+                digest.update(repr(('id', id(value))).encode())
+                objects.append(value)  # keep the object alive so that its id is not reused
+
+    def set_scenario(self, scenario):
+        digest = hashlib.sha1()
+        objects = []
+        self._digest(scenario, digest, objects)
+        fingerprint = digest.hexdigest()
+        if fingerprint != self.scenario:
+            self.cache.clear()
+            self.scenario = fingerprint
+            self._scenario_objects = objects
+
+    def lookup(self, individuals, scenario=None):
+        if not self.enabled:
+            self._pending = None
+            return individuals
+        if scenario is not None:
+            self.set_scenario(scenario)
+        keys = [structural_key(ind) for ind in individuals]
+        fits = [None] * len(individuals)
+        to_evaluate = {}
+        for i, key in enumerate(keys):
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                fits[i] = copy(self.cache[key])
+            elif key not in to_evaluate:
+                to_evaluate[key] = individuals[i]
+        self._pending = (keys, fits, list(to_evaluate))
+        self.misses += len(to_evaluate)
+        self.hits += len(individuals) - len(to_evaluate)
+        return list(to_evaluate.values())
+
+    def update(self, fitnesses):
+        if self._pending is None:
+            return list(fitnesses)
+        keys, fits, new_keys = self._pending
+        self._pending = None
+        for key, fit in zip(new_keys, fitnesses):
+            self.cache[key] = fit
+            if len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+        new_fits = dict(zip(new_keys, fitnesses))
+        return [fit if fit is not None else copy(new_fits[key]) for key, fit in zip(keys, fits)]
+
+    def clear(self):
+        self.cache.clear()
+        self.scenario = None
+        self._scenario_objects = []
+
+
+fitness_cache = FitnessCache()  # shared by the eaMuPlusLambdaTol_* loops
+
+
 ##############################  MODIFIED EVOLUTIONARY STRATEGIES  ##############################
 
 def eaMuPlusLambdaTol_Godddard(population, toolbox, mu, lambda_, ngen, cxpb, mutpb, pset, creator,
@@ -1123,7 +1390,11 @@ def eaMuPlusLambdaTol_Godddard(population, toolbox, mu, lambda_, ngen, cxpb, mut
     # Evaluate the individuals with an invalid fitness
     invalid_ind = [ind for ind in population if not ind.fitness.valid]
 
-    fitnesses = toolbox.map(partial(toolbox.evaluate, pset=pset, kwargs=kwargs), invalid_ind)
+    fitness_cache.clear()
+    eval_ind = fitness_cache.lookup(invalid_ind, dict(kwargs, pset=pset, evaluate=toolbox.evaluate))
+    fitnesses, compile_hit_rate = map_compile_stats(toolbox.map, toolbox.evaluate, eval_ind, pset=pset,
+                                                    kwargs=kwargs)
+    fitnesses = fitness_cache.update(fitnesses)
 
     for ind, fit in zip(invalid_ind, fitnesses):
         ind.fitness.values = fit
@@ -1131,7 +1402,8 @@ def eaMuPlusLambdaTol_Godddard(population, toolbox, mu, lambda_, ngen, cxpb, mut
     if halloffame is not None:
         halloffame.update(population, for_feasible=True)
     record = stats.compile(population) if stats is not None else {}
-    logbook.record(gen=0, nevals=len(invalid_ind), **record)
+    logbook.record(gen=0, nevals=len(eval_ind), fitness_cache_hits=len(invalid_ind) - len(eval_ind),
+                   compile_hit_rate=compile_hit_rate, **record)
     if verbose:
         print(logbook.stream)
 
@@ -1164,7 +1436,10 @@ def eaMuPlusLambdaTol_Godddard(population, toolbox, mu, lambda_, ngen, cxpb, mut
                                                                                               deltaT / 1000))                         # Modified part
 
         invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
-        fitnesses = toolbox.map(partial(toolbox.evaluate, pset=pset, kwargs=kwargs), invalid_ind)
+        eval_ind = fitness_cache.lookup(invalid_ind, dict(kwargs, pset=pset, evaluate=toolbox.evaluate))
+        fitnesses, compile_hit_rate = map_compile_stats(toolbox.map, toolbox.evaluate, eval_ind, pset=pset,
+                                                        kwargs=kwargs)
+        fitnesses = fitness_cache.update(fitnesses)
         for ind, fit in zip(invalid_ind, fitnesses):
             ind.fitness.values = fit
 
@@ -1182,7 +1457,8 @@ def eaMuPlusLambdaTol_Godddard(population, toolbox, mu, lambda_, ngen, cxpb, mut
 
         # Update the statistics with the new population
         record = stats.compile(population) if stats is not None else {}
-        logbook.record(gen=gen, nevals=len(invalid_ind), **record)
+        logbook.record(gen=gen, nevals=len(eval_ind), fitness_cache_hits=len(invalid_ind) - len(eval_ind),
+                       compile_hit_rate=compile_hit_rate, **record)
         if verbose:
             print(logbook.stream)
 
@@ -1264,7 +1540,11 @@ def eaMuPlusLambdaTol_FestipReentry(population, toolbox, mu, lambda_, ngen, cxpb
     # Evaluate the individuals with an invalid fitness
     invalid_ind = [ind for ind in population if not ind.fitness.valid]
 
-    fitnesses = toolbox.map(partial(toolbox.evaluate, pset=pset, kwargs=kwargs), invalid_ind)
+    fitness_cache.clear()
+    eval_ind = fitness_cache.lookup(invalid_ind, dict(kwargs, pset=pset, evaluate=toolbox.evaluate))
+    fitnesses, compile_hit_rate = map_compile_stats(toolbox.map, toolbox.evaluate, eval_ind, pset=pset,
+                                                    kwargs=kwargs)
+    fitnesses = fitness_cache.update(fitnesses)
 
     for ind, fit in zip(invalid_ind, fitnesses):
         ind.fitness.values = fit
@@ -1272,7 +1552,8 @@ def eaMuPlusLambdaTol_FestipReentry(population, toolbox, mu, lambda_, ngen, cxpb
     if halloffame is not None:
         halloffame.update(population, for_feasible=True)
     record = stats.compile(population) if stats is not None else {}
-    logbook.record(gen=0, nevals=len(invalid_ind), **record)
+    logbook.record(gen=0, nevals=len(eval_ind), fitness_cache_hits=len(invalid_ind) - len(eval_ind),
+                   compile_hit_rate=compile_hit_rate, **record)
     if verbose:
         print(logbook.stream)
 
@@ -1299,7 +1580,10 @@ def eaMuPlusLambdaTol_FestipReentry(population, toolbox, mu, lambda_, ngen, cxpb
         offspring, len_feas, mutpb, cxpb = InclusivevarOr_Gannic(population, toolbox, lambda_, sub_div, good_index, cxpb, mutpb)
 
         invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
-        fitnesses = toolbox.map(partial(toolbox.evaluate, pset=pset, kwargs=kwargs), invalid_ind)
+        eval_ind = fitness_cache.lookup(invalid_ind, dict(kwargs, pset=pset, evaluate=toolbox.evaluate))
+        fitnesses, compile_hit_rate = map_compile_stats(toolbox.map, toolbox.evaluate, eval_ind, pset=pset,
+                                                        kwargs=kwargs)
+        fitnesses = fitness_cache.update(fitnesses)
         for ind, fit in zip(invalid_ind, fitnesses):
             ind.fitness.values = fit
 
@@ -1315,7 +1599,8 @@ def eaMuPlusLambdaTol_FestipReentry(population, toolbox, mu, lambda_, ngen, cxpb
 
         # Update the statistics with the new population
         record = stats.compile(population) if stats is not None else {}
-        logbook.record(gen=gen, nevals=len(invalid_ind), **record)
+        logbook.record(gen=gen, nevals=len(eval_ind), fitness_cache_hits=len(invalid_ind) - len(eval_ind),
+                       compile_hit_rate=compile_hit_rate, **record)
         if verbose:
             print(logbook.stream)
 
@@ -1404,129 +1689,122 @@ def eaMuPlusLambdaTol_GANNIC(population, toolbox, mu, lambda_, ngen, cxpb, mutpb
     # Evaluate the individuals with an empty fitness
     invalid_ind = [ind for ind in population if not ind.fitness.valid]
 
-    # perform fitness evaluation with or without multiprocessing
-    if nbCPU > 1:
-        pool = multiprocess.Pool(nbCPU)
-        fitnesses = pool.imap(partial(toolbox.evaluate, pset=pset, kwargs=kwargs), enumerate(invalid_ind))
-        pool.close()
-        pool.join()
-    else:
-        fitnesses = map(partial(toolbox.evaluate, pset=pset, kwargs=kwargs), enumerate(invalid_ind))
-
-    # compute statistics on population
-    pop = POP(population, creator)
-    data, all_lengths = pop.retrieve_stats(data, all_lengths)
-
-    # assign evaluated fitness to population
-    invalid_ind_orig = [ind for ind in population if not ind.fitness.valid]
-    for ind, fit in zip(invalid_ind_orig, fitnesses):
-        ind.fitness.values = fit[:2]
-        ind.fit_components = fit[2]
-        ind.successes = fit[3]
-
-    # update hall of fame
-    if halloffame is not None:
-        halloffame.update(population, for_feasible=True)
-
-    # update logbook
-    record = stats.compile(population) if stats is not None else {}
-    logbook.record(gen=start_gen, nevals=len(invalid_ind), **record)
-    if verbose:
-        print(logbook.stream)
-
-    # find min fitness
-    min_fit = np.array(logbook.chapters["fitness"].select("min"))
-
-    # save data
-    if kwargs['save_gen'] is not None:
-        output = open(kwargs['save_path'] + 'Hof_gen_0', "wb")
-        cPickle.dump(halloffame, output, -1)
-        output.close()
-        output = open(kwargs['save_path'] + 'Population_gen_0', "wb")
-        cPickle.dump(population, output, -1)
-        output.close()
-        output = open(kwargs['save_path'] + 'Logbook_gen_0', "wb")
-        cPickle.dump(logbook, output, -1)
-        output.close()
-        np.save(kwargs['save_path'] + 'Min_fitness_gen_0', min_fit)
-
-    # check stopping criterion
-    success = False
-    if kwargs['fit_tol'] is not None:
-        if min_fit[-1][0] <= kwargs['fit_tol']:
-            success = True
-        else:
-            success = False
-
-    # Begin the generational process
-    gen = start_gen+1
-
-    while gen < ngen + 1 and not success:
-
-        # Perform crossover, mutation and pass
-        sub_div, good_index = subset_diversity(population, creator)
-        offspring, len_feas, mutpb, cxpb = InclusivevarOr_Gannic(population, toolbox, lambda_, sub_div, good_index, cxpb, mutpb)
-
-        invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
-        # evaluate fitness
-
-        if nbCPU > 1:
-            pool = multiprocess.Pool(nbCPU)
-            fitnesses = pool.imap(partial(toolbox.evaluate, pset=pset, kwargs=kwargs), enumerate(invalid_ind))
-            pool.close()
-            pool.join()
-        else:
-            fitnesses = map(partial(toolbox.evaluate, pset=pset, kwargs=kwargs), enumerate(invalid_ind))
+    # perform fitness evaluation with or without multiprocessing, the pool is kept for the whole evolution
+    with EvaluationPool(nbCPU, toolbox.evaluate, pset=pset, kwargs=kwargs) as eval_pool:
+        fitness_cache.clear()
+        eval_ind = fitness_cache.lookup(invalid_ind, dict(kwargs, pset=pset, evaluate=toolbox.evaluate))
+        fitnesses = fitness_cache.update(eval_pool.map(enumerate(eval_ind)))
 
+        # compute statistics on population
+        pop = POP(population, creator)
+        data, all_lengths = pop.retrieve_stats(data, all_lengths)
 
-        # assign fitness to evaluated individuals
-        for ind, fit in zip(invalid_ind, fitnesses):
+        # assign evaluated fitness to population
+        invalid_ind_orig = [ind for ind in population if not ind.fitness.valid]
+        for ind, fit in zip(invalid_ind_orig, fitnesses):
             ind.fitness.values = fit[:2]
             ind.fit_components = fit[2]
             ind.successes = fit[3]
 
-        # Update the hall of fame with the generated individuals
+        # update hall of fame
         if halloffame is not None:
-            halloffame.update(invalid_ind, for_feasible=True)
-
-        # select new population from parents and offspring
-        organized_pop, good_indexes = subset_diversity(population + offspring, creator)
-        best = copy(selBest(population + offspring))
-        population[:] = copy(toolbox.select(mu, organized_pop, good_indexes))
-        if best not in population:
-            population.append(best)
-
-        # compute statistics on population
-        pop = POP(population, creator)
-        data, all_lengths = pop.retrieve_stats(data, all_lengths)
+            halloffame.update(population, for_feasible=True)
 
-        # Update the statistics with the new population
+        # update logbook
         record = stats.compile(population) if stats is not None else {}
-        logbook.record(gen=gen, nevals=len(invalid_ind), **record)
+        logbook.record(gen=start_gen, nevals=len(eval_ind), fitness_cache_hits=len(invalid_ind) - len(eval_ind),
+                       pool_overhead=eval_pool.overhead[-1], compile_hit_rate=eval_pool.compile_hit_rate[-1], **record)
         if verbose:
             print(logbook.stream)
 
+        # find min fitness
         min_fit = np.array(logbook.chapters["fitness"].select("min"))
 
-        if kwargs['fit_tol'] is not None:
-            if min_fit[-1][0] <= kwargs['fit_tol']:
-                success = True
-            else:
-                success = False
-
-        if kwargs['save_gen'] is not None and gen % kwargs['save_gen'] == 0:
-            output = open(kwargs['save_path'] + 'Hof_gen_{}'.format(gen), "wb")
+        # save data
+        if kwargs['save_gen'] is not None:
+            output = open(kwargs['save_path'] + 'Hof_gen_0', "wb")
             cPickle.dump(halloffame, output, -1)
             output.close()
-            output = open(kwargs['save_path'] + 'Population_gen_{}'.format(gen), "wb")
+            output = open(kwargs['save_path'] + 'Population_gen_0', "wb")
             cPickle.dump(population, output, -1)
             output.close()
-            output = open(kwargs['save_path'] + 'Logbook_gen_{}'.format(gen), "wb")
+            output = open(kwargs['save_path'] + 'Logbook_gen_0', "wb")
             cPickle.dump(logbook, output, -1)
             output.close()
-            np.save(kwargs['save_path'] + 'Min_fitness_gen_{}'.format(gen), min_fit)
+            np.save(kwargs['save_path'] + 'Min_fitness_gen_0', min_fit)
 
-        gen += 1
+        # check stopping criterion
+        success = False
+        if kwargs['fit_tol'] is not None:
+            if min_fit[-1][0] <= kwargs['fit_tol']:
+                success = True
+            else:
+                success = False
+
+        # Begin the generational process
+        gen = start_gen+1
+
+        while gen < ngen + 1 and not success:
+
+            # Perform crossover, mutation and pass
+            sub_div, good_index = subset_diversity(population, creator)
+            offspring, len_feas, mutpb, cxpb = InclusivevarOr_Gannic(population, toolbox, lambda_, sub_div, good_index, cxpb, mutpb)
+
+            invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
+            # evaluate fitness
+            eval_ind = fitness_cache.lookup(invalid_ind, dict(kwargs, pset=pset, evaluate=toolbox.evaluate))
+            fitnesses = fitness_cache.update(eval_pool.map(enumerate(eval_ind)))
+
+            # assign fitness to evaluated individuals
+            for ind, fit in zip(invalid_ind, fitnesses):
+                ind.fitness.values = fit[:2]
+                ind.fit_components = fit[2]
+                ind.successes = fit[3]
+
+            # Update the hall of fame with the generated individuals
+            if halloffame is not None:
+                halloffame.update(invalid_ind, for_feasible=True)
+
+            # select new population from parents and offspring
+            organized_pop, good_indexes = subset_diversity(population + offspring, creator)
+            best = copy(selBest(population + offspring))
+            population[:] = copy(toolbox.select(mu, organized_pop, good_indexes))
+            if best not in population:
+                population.append(best)
+
+            # compute statistics on population
+            pop = POP(population, creator)
+            data, all_lengths = pop.retrieve_stats(data, all_lengths)
+
+            # Update the statistics with the new population
+            record = stats.compile(population) if stats is not None else {}
+            logbook.record(gen=gen, nevals=len(eval_ind), fitness_cache_hits=len(invalid_ind) - len(eval_ind),
+                           pool_overhead=eval_pool.overhead[-1], compile_hit_rate=eval_pool.compile_hit_rate[-1],
+                           **record)
+            if verbose:
+                print(logbook.stream)
+
+            min_fit = np.array(logbook.chapters["fitness"].select("min"))
+
+            if kwargs['fit_tol'] is not None:
+                if min_fit[-1][0] <= kwargs['fit_tol']:
+                    success = True
+                else:
+                    success = False
+
+            if kwargs['save_gen'] is not None and gen % kwargs['save_gen'] == 0:
+                output = open(kwargs['save_path'] + 'Hof_gen_{}'.format(gen), "wb")
+                cPickle.dump(halloffame, output, -1)
+                output.close()
+                output = open(kwargs['save_path'] + 'Population_gen_{}'.format(gen), "wb")
+                cPickle.dump(population, output, -1)
+                output.close()
+                output = open(kwargs['save_path'] + 'Logbook_gen_{}'.format(gen), "wb")
+                cPickle.dump(logbook, output, -1)
+                output.close()
+                np.save(kwargs['save_path'] + 'Min_fitness_gen_{}'.format(gen), min_fit)
+
+            gen += 1
 
     return population, logbook, data, all_lengths
 
@@ -1587,61 +1865,62 @@ def eaMuPlusLambdaTol_OPGD_IGP(population, toolbox, mu, lambda_, ngen, cxpb, mut
 
     # Evaluate the individuals with an invalid fitness
     invalid_ind = [ind for ind in population if not ind.fitness.valid]
-    pool = multiprocess.Pool(kwargs['nbCPU'])
-    fitnesses = pool.map(partial(toolbox.evaluate, kwargs=kwargs), invalid_ind)
-    pool.close()
-    pool.join()
-    for ind, fit in zip(invalid_ind, fitnesses):
-        ind.fitness.values = fit
+    with EvaluationPool(kwargs['nbCPU'], toolbox.evaluate, kwargs=kwargs) as eval_pool:  # kept for the whole evolution
+        fitness_cache.clear()
+        eval_ind = fitness_cache.lookup(invalid_ind, dict(kwargs, evaluate=toolbox.evaluate))
+        fitnesses = fitness_cache.update(eval_pool.map(eval_ind))
+        for ind, fit in zip(invalid_ind, fitnesses):
+            ind.fitness.values = fit
 
-    if halloffame is not None:
-        halloffame.update(population, True)
+        if halloffame is not None:
+            halloffame.update(population, True)
 
-    record = stats.compile(population) if stats is not None else {}
-    logbook.record(gen=0, nevals=len(invalid_ind), **record)
-    if verbose:
-        print(logbook.stream)
+        record = stats.compile(population) if stats is not None else {}
+        logbook.record(gen=0, nevals=len(eval_ind), fitness_cache_hits=len(invalid_ind) - len(eval_ind),
+                       pool_overhead=eval_pool.overhead[-1], compile_hit_rate=eval_pool.compile_hit_rate[-1], **record)
+        if verbose:
+            print(logbook.stream)
 
-    # Begin the generational process
-    gen = 1
+        # Begin the generational process
+        gen = 1
 
-    while gen < ngen + 1:
-        # Vary the population
+        while gen < ngen + 1:
+            # Vary the population
 
-        sub_div, good_index = subset_diversity(population, creator)
-        offspring, len_feas, mutpb, cxpb = InclusivevarOr_Gannic(population, toolbox, lambda_, sub_div, good_index, cxpb, mutpb)
+            sub_div, good_index = subset_diversity(population, creator)
+            offspring, len_feas, mutpb, cxpb = InclusivevarOr_Gannic(population, toolbox, lambda_, sub_div, good_index, cxpb, mutpb)
 
-        # Evaluate the individuals with an invalid fitness
+            # Evaluate the individuals with an invalid fitness
 
-        invalid_ind = [ind for ind in population+offspring if not ind.fitness.valid]
-        pool = multiprocess.Pool(kwargs['nbCPU'])
-        fitnesses = pool.map(partial(toolbox.evaluate, kwargs=kwargs), invalid_ind)
-        pool.close()
-        pool.join()
-        for ind, fit in zip(invalid_ind, fitnesses):
-            ind.fitness.values = fit
+            invalid_ind = [ind for ind in population+offspring if not ind.fitness.valid]
+            eval_ind = fitness_cache.lookup(invalid_ind, dict(kwargs, evaluate=toolbox.evaluate))
+            fitnesses = fitness_cache.update(eval_pool.map(eval_ind))
+            for ind, fit in zip(invalid_ind, fitnesses):
+                ind.fitness.values = fit
 
 
-        # Update the hall of fame with the generated individuals
-        if halloffame is not None:
-            halloffame.update(offspring, True)
+            # Update the hall of fame with the generated individuals
+            if halloffame is not None:
+                halloffame.update(offspring, True)
 
-        # Select the next generation population
+            # Select the next generation population
 
-        global_pop = population + offspring
-        best_ind = tools.selBest(global_pop, 1)
-        pop_without_best = [ind for ind in global_pop if ind != best_ind[0]]
+            global_pop = population + offspring
+            best_ind = tools.selBest(global_pop, 1)
+            pop_without_best = [ind for ind in global_pop if ind != best_ind[0]]
 
-        organized_pop, good_indexes = subset_diversity(pop_without_best, creator)
-        population = copy(toolbox.select(mu - 1, organized_pop, good_indexes))
-        population = population + best_ind
+            organized_pop, good_indexes = subset_diversity(pop_without_best, creator)
+            population = copy(toolbox.select(mu - 1, organized_pop, good_indexes))
+            population = population + best_ind
 
-        # Update the statistics with the new population
-        record = stats.compile(population) if stats is not None else {}
-        logbook.record(gen=gen, nevals=len(invalid_ind), **record)
+            # Update the statistics with the new population
+            record = stats.compile(population) if stats is not None else {}
+            logbook.record(gen=gen, nevals=len(eval_ind), fitness_cache_hits=len(invalid_ind) - len(eval_ind),
+                           pool_overhead=eval_pool.overhead[-1], compile_hit_rate=eval_pool.compile_hit_rate[-1],
+                           **record)
 
-        if verbose:
-            print(logbook.stream)
-        gen += 1
+            if verbose:
+                print(logbook.stream)
+            gen += 1
 
     return population, logbook, data, all_lengths
@@ -101,7 +101,11 @@ def eaMuPlusLambdaTolSimple(population, toolbox, mu, lambda_, ngen, cxpb, mutpb,
 
     # Evaluate the individuals with an invalid fitness
     invalid_ind = [ind for ind in population if not ind.fitness.valid]
-    fitnesses = toolbox.map(partial(toolbox.evaluate, pset=pset, kwargs=kwargs), invalid_ind)
+    funs.fitness_cache.clear()
+    eval_ind = funs.fitness_cache.lookup(invalid_ind, dict(kwargs, pset=pset, evaluate=toolbox.evaluate))
+    fitnesses, compile_hit_rate = funs.map_compile_stats(toolbox.map, toolbox.evaluate, eval_ind, pset=pset,
+                                                         kwargs=kwargs)
+    fitnesses = funs.fitness_cache.update(fitnesses)
     for ind, fit in zip(invalid_ind, fitnesses):
         ind.fitness.values = fit
 
@@ -111,7 +115,8 @@ def eaMuPlusLambdaTolSimple(population, toolbox, mu, lambda_, ngen, cxpb, mutpb,
         halloffame.update(population)
 
     record = stats.compile(population) if stats is not None else {}
-    logbook.record(gen=0, nevals=len(invalid_ind), **record)
+    logbook.record(gen=0, nevals=len(eval_ind), fitness_cache_hits=len(invalid_ind) - len(eval_ind),
+                   compile_hit_rate=compile_hit_rate, **record)
     if verbose:
         print(logbook.stream)
 
@@ -144,7 +149,10 @@ def eaMuPlusLambdaTolSimple(population, toolbox, mu, lambda_, ngen, cxpb, mutpb,
         # Evaluate the individuals with an invalid fitness
 
         invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
-        fitnesses = toolbox.map(partial(toolbox.evaluate, pset=pset, kwargs=kwargs), invalid_ind)
+        eval_ind = funs.fitness_cache.lookup(invalid_ind, dict(kwargs, pset=pset, evaluate=toolbox.evaluate))
+        fitnesses, compile_hit_rate = funs.map_compile_stats(toolbox.map, toolbox.evaluate, eval_ind, pset=pset,
+                                                             kwargs=kwargs)
+        fitnesses = funs.fitness_cache.update(fitnesses)
         for ind, fit in zip(invalid_ind, fitnesses):
             ind.fitness.values = fit
 
@@ -161,7 +169,8 @@ def eaMuPlusLambdaTolSimple(population, toolbox, mu, lambda_, ngen, cxpb, mutpb,
 
         # Update the statistics with the new population
         record = stats.compile(population) if stats is not None else {}
-        logbook.record(gen=gen, nevals=len(invalid_ind), **record)
+        logbook.record(gen=gen, nevals=len(eval_ind), fitness_cache_hits=len(invalid_ind) - len(eval_ind),
+                       compile_hit_rate=compile_hit_rate, **record)
 
         if verbose:
             print(logbook.stream)
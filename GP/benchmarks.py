@@ -0,0 +1,539 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+# ------ Copyright (C) 2020 University of Strathclyde and Author ------
+# ---------------- Author: Francesco Marchetti ------------------------
+# ----------- e-mail: francesco.marchetti@strath.ac.uk ----------------
+
+# Alternatively, the contents of this file may be used under the terms
+# of the GNU General Public License Version 3.0, as described below:
+
+# This file is free software: you may copy, redistribute and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3.0 of the License, or (at your
+# option) any later version.
+
+# This file is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Benchmarks for the GP algorithms
+
+Run from the repository root, e.g. `python -m GP.benchmarks pool`
+"""
+
+import argparse
+import itertools
+import operator
+import random
+import warnings
+from functools import partial
+from time import perf_counter, process_time
+import multiprocess
+import numpy as np
+import sympy
+from deap import gp, creator, base, tools
+import GP.GP_Algorithms.IGP.IGP_Functions as gpfuns
+import GP.GP_Algorithms.IGP.Recombination_operators as rops
+from GP.GP_Algorithms.GP_CompileCache import CompileCache
+from GP.GP_Algorithms.GP_Interpreter import RMSEEvaluator
+import GP.GP_Algorithms.GP_PrimitiveSet as gpprim
+
+
+def opgd_test_case(plant):
+    """
+    Function used to build the primitive set, toolbox and evaluation kwargs of an OPGD-IGP test case
+
+    Attributes:
+        plant: str
+            'oscillator' or 'pendulum'
+
+    Return:
+        pset: class
+            primitive set
+        toolbox: class
+            GP building blocks
+        kwargs: dict
+            static arguments of the evaluation function
+    """
+    import GP.GPBased_ControlSchemes.OPGD_IGP.functionsIGPadjoint as funs
+    if plant == 'oscillator':
+        from GP.GPBased_ControlSchemes.OPGD_IGP.test_cases.armonic_oscillator.Plant import Oscillator as Plant
+        from GP.GPBased_ControlSchemes.OPGD_IGP.test_cases.armonic_oscillator.dynamics import dynamics
+        arguments = ['eX', 'eV']
+    elif plant == 'pendulum':
+        from GP.GPBased_ControlSchemes.OPGD_IGP.test_cases.inverted_pendulum.Plant import Pendulum as Plant
+        from GP.GPBased_ControlSchemes.OPGD_IGP.test_cases.inverted_pendulum.dynamics import dynamics
+        arguments = ['eX', 'eV', 'eTheta', 'eOmega']
+    else:
+        raise ValueError('Invalid plant: \'{}\''.format(plant))
+    obj = Plant()
+    pset = gp.PrimitiveSet("Main", obj.n_states)
+    pset.addPrimitive(operator.add, 2)
+    pset.addPrimitive(operator.sub, 2)
+    pset.addPrimitive(operator.mul, 2)
+    pset.renameArguments(**{'ARG{}'.format(i): name for i, name in enumerate(arguments)})
+    creator.create("Fitness", base.Fitness, weights=(-1.0, -1.0))
+    creator.create("Individual", gp.PrimitiveTree, fitness=creator.Fitness)
+    toolbox = base.Toolbox()
+    toolbox.register("expr", gp.genHalfAndHalf, pset=pset, min_=1, max_=4)
+    toolbox.register("individual", tools.initIterate, creator.Individual, toolbox.expr)
+    toolbox.register("population", tools.initRepeat, list, toolbox.individual)
+    toolbox.register("evaluate", funs.evaluate_individualIGP_adjoint)
+    toolbox.register("select", gpfuns.InclusiveTournamentV2, selected_individuals=1, fitness_size=2, parsimony_size=1.6,
+                     creator=creator)
+    toolbox.register("mate", gp.cxOnePoint)
+    toolbox.register("expr_mut", gp.genHalfAndHalf, min_=1, max_=4)
+    toolbox.register("mutate", rops.xmut, expr=toolbox.expr_mut, unipb=0.6, shrpb=0.1, inspb=0.3, pset=pset,
+                     creator=creator)
+    toolbox.decorate("mate", gp.staticLimit(key=operator.attrgetter("height"), max_value=10))
+    toolbox.decorate("mutate", gp.staticLimit(key=operator.attrgetter("height"), max_value=10))
+    toolbox.decorate("mate", gp.staticLimit(key=len, max_value=15))
+    toolbox.decorate("mutate", gp.staticLimit(key=len, max_value=15))
+    kwargs = {'obj': obj, 'pset': pset, 'opt_steps': 0, 'mul_fun': pset.primitives[pset.ret][2],
+              'verbose_adam': False, 'dynamics': dynamics, 'symbols': [sympy.symbols(s) for s in obj.str_symbols]}
+    return pset, toolbox, kwargs
+
+
+def bench_pool(plants=('oscillator', 'pendulum'), nbCPU=2, size_pop=100, n_gen=10, opt_steps=0):
+    """
+    Function used to compare the per-generation overhead of a new pool at each generation with the persistent
+    EvaluationPool used by the eaMuPlusLambdaTol_* loops
+
+    Attributes:
+        plants: tuple of str
+            OPGD-IGP test cases to run
+        nbCPU: integer
+            number of worker processes
+        size_pop: integer
+            number of individuals evaluated at each generation
+        n_gen: integer
+            number of timed generations
+        opt_steps: integer
+            Adam steps performed in each evaluation
+
+    Return:
+        results: dict
+            mean seconds per generation of the evaluation time and of the overhead of each approach, keyed by
+            (plant, quantity)
+    """
+    warnings.filterwarnings("ignore")
+    results = {}
+    for plant in plants:
+        random.seed(0)
+        pset, toolbox, kwargs = opgd_test_case(plant)
+        kwargs['opt_steps'] = opt_steps
+        pops = [toolbox.population(n=size_pop) for _ in range(n_gen)]
+
+        t_eval = []
+        for pop in pops:
+            t0 = process_time()
+            list(map(partial(toolbox.evaluate, kwargs=kwargs), pop))
+            t_eval.append(process_time() - t0)
+        n_workers = min(nbCPU, multiprocess.cpu_count())
+
+        t_new_pool = []
+        for pop in pops:
+            t0 = perf_counter()
+            pool = multiprocess.Pool(nbCPU)
+            pool.map(partial(toolbox.evaluate, kwargs=kwargs), pop)
+            pool.close()
+            pool.join()
+            t_new_pool.append(perf_counter() - t0)
+
+        t0 = perf_counter()
+        eval_pool = gpfuns.EvaluationPool(nbCPU, toolbox.evaluate, kwargs=kwargs)
+        t_start = perf_counter() - t0
+        for pop in pops:
+            eval_pool.map(pop)
+        eval_pool.close()
+
+        results[(plant, 'eval')] = np.mean(t_eval)
+        results[(plant, 'new_pool')] = np.mean(t_new_pool) - np.mean(t_eval) / n_workers
+        results[(plant, 'persistent')] = np.mean(eval_pool.overhead)
+        results[(plant, 'persistent_start')] = t_start
+        print('{:>10} eval {:8.4f} s/gen  overhead: new pool {:8.4f} s/gen  persistent {:8.4f} s/gen '
+              '(+{:.4f} s once)'.format(plant, results[(plant, 'eval')], results[(plant, 'new_pool')],
+                                       results[(plant, 'persistent')], t_start))
+    return results
+
+
+def bench_compile_cache(plant='pendulum', size_pop=300, n_gen=20, survival=0.7, n_points=20):
+    """
+    Function used to compare gp.compile with the CompileCache on a population where a fraction of the individuals
+    survives unchanged at each generation, as the elites and clones of the eaMuPlusLambdaTol_* loops
+
+    Attributes:
+        plant: str
+            OPGD-IGP test case providing the primitive set
+        size_pop: integer
+            number of individuals compiled at each generation
+        n_gen: integer
+            number of generations
+        survival: float
+            fraction of the individuals kept unchanged from one generation to the next
+        n_points: integer
+            number of random inputs used to check that the compiled functions give the same outputs
+
+    Return:
+        results: dict
+            seconds per generation spent compiling with each approach, hit rate of the cache and maximum output
+            difference
+    """
+    random.seed(0)
+    pset, toolbox, kwargs = opgd_test_case(plant)
+    pops = [toolbox.population(n=size_pop)]
+    for _ in range(n_gen - 1):
+        survivors = random.sample(pops[-1], int(survival * size_pop))
+        pops.append(survivors + toolbox.population(n=size_pop - len(survivors)))
+
+    t0 = perf_counter()
+    funcs = [[gp.compile(ind, pset) for ind in pop] for pop in pops]
+    t_compile = (perf_counter() - t0) / n_gen
+    cache = CompileCache()
+    t0 = perf_counter()
+    funcs_cached = [[cache(ind, pset) for ind in pop] for pop in pops]
+    t_cached = (perf_counter() - t0) / n_gen
+
+    inputs = np.random.RandomState(0).uniform(-1, 1, (n_points, len(pset.arguments)))
+    diff = 0.0
+    with np.errstate(all='ignore'):
+        for f_pop, fc_pop in zip(funcs[-1:], funcs_cached[-1:]):
+            for f, fc in zip(f_pop, fc_pop):
+                for x in inputs:
+                    diff = max(diff, abs(np.nan_to_num(f(*x)) - np.nan_to_num(fc(*x))))
+
+    results = {'compile': t_compile, 'cached': t_cached, 'hit_rate': cache.hit_rate(), 'diff': diff}
+    print('{} individuals, {:.0%} survival: gp.compile {:.2f} ms/gen  cache {:.2f} ms/gen  hit rate {:.3f}  '
+          'max output difference {:.1e}'.format(size_pop, survival, 1e3 * t_compile, 1e3 * t_cached,
+                                                results['hit_rate'], diff))
+    return results
+
+
+def bench_fitness_cache(plant='oscillator', size_pop=100, n_gen=10, nbCPU=1, opt_steps=0):
+    """
+    Function used to run eaMuPlusLambdaTol_OPGD_IGP with and without the fitness cache, comparing the number of
+    evaluations, the elapsed time and the final population
+
+    Attributes:
+        plant: str
+            OPGD-IGP test case
+        size_pop: integer
+            number of individuals in the population
+        n_gen: integer
+            number of generations
+        nbCPU: integer
+            number of worker processes, 1 to evaluate in the main process
+        opt_steps: integer
+            Adam steps performed in each evaluation
+
+    Return:
+        results: dict
+            total evaluations, cache hits and elapsed time with and without the cache, keyed by (enabled, quantity),
+            and whether the final populations match and the cache was hit across generations
+    """
+    warnings.filterwarnings("ignore")
+    pset, toolbox, kwargs = opgd_test_case(plant)
+    kwargs.update(opt_steps=opt_steps, nbCPU=nbCPU)
+    stats = tools.Statistics(lambda ind: ind.fitness.values)
+    mstats = tools.MultiStatistics(fitness=stats)
+    mstats.register("min", gpfuns.Min)
+    results = {}
+    final_fits = {}
+    for enabled in (False, True):
+        gpfuns.fitness_cache.clear()
+        gpfuns.fitness_cache.enabled = enabled
+        random.seed(0)
+        np.random.seed(0)
+        pop = toolbox.population(n=size_pop)
+        t0 = perf_counter()
+        pop, log, _, _ = gpfuns.eaMuPlusLambdaTol_OPGD_IGP(pop, toolbox, size_pop, int(1.2 * size_pop), n_gen, 0.2, 0.7,
+                                                          creator, stats=mstats, verbose=False, **kwargs)
+        results[(enabled, 'time')] = perf_counter() - t0
+        results[(enabled, 'nevals')] = sum(log.select('nevals'))
+        results[(enabled, 'hits')] = sum(log.select('fitness_cache_hits'))
+        final_fits[enabled] = sorted(ind.fitness.values for ind in pop)
+        print('cache {:>5}: {:6d} evaluations {:6d} cache hits {:8.2f} s'.format(
+            str(enabled), results[(enabled, 'nevals')], results[(enabled, 'hits')], results[(enabled, 'time')]))
+    gpfuns.fitness_cache.enabled = True
+    results['same_population'] = final_fits[False] == final_fits[True]
+    print('same final fitnesses: {}'.format(results['same_population']))
+    # the individuals surviving a generation are looked up again at the next one, so a cache that is not hit means
+    # that the scenario fingerprint changed between generations
+    results['cache_hit'] = results[(True, 'hits')] > 0
+    print('cache hit across generations: {}'.format(results['cache_hit']))
+    return results
+
+
+def eurogp21_pset(terminals):
+    """Function used to build the primitive set of the EuroGP21 symbolic regression benchmarks"""
+    pset = gp.PrimitiveSet("Main", terminals)
+    for primitive, arity in [(operator.add, 2), (operator.sub, 2), (operator.mul, 2), (gpprim.TriAdd, 3),
+                             (gpprim.TriMul, 3), (np.tanh, 1), (gpprim.Square, 1), (gpprim.ModLog, 1),
+                             (gpprim.ModExp, 1), (np.sin, 1), (np.cos, 1)]:
+        pset.addPrimitive(primitive, arity)
+    pset.addEphemeralConstant("rand0", partial(lambda: round(random.uniform(-10, 10), 4)))
+    if terminals == 1:
+        pset.renameArguments(ARG0='x')
+    else:
+        pset.renameArguments(**{'ARG{}'.format(i): 'x{}'.format(i + 1) for i in range(terminals)})
+    return pset
+
+
+def bench_interpreter(size_pop=300, n_repeat=3, max_height=6):
+    """
+    Function used to compare the evaluations per second of the EuroGP21 evaluation, which compiles and evaluates each
+    individual, with the RMSEEvaluator evaluating the whole population with the PopulationInterpreter
+
+    The datasets are generated as in Benchmarks.select_testcase for koza1 (20 points, 1 input) and korns11 (5000
+    points, 5 inputs). The compiled individuals are called on the rows of the dataset, as in the EuroGP21 evaluate, and
+    the reference fitnesses are computed by calling every primitive on new arrays, so that the individuals that
+    disagree with the reference show primitives modifying their inputs.
+
+    Attributes:
+        size_pop: integer
+            number of individuals
+        n_repeat: integer
+            number of timed evaluations of the population
+        max_height: integer
+            maximum height of the generated individuals
+
+    Return:
+        results: dict
+            evaluations per second of each approach, maximum relative fitness difference of the interpreter and number of
+            compiled individuals disagreeing with the reference, keyed by (benchmark, quantity)
+    """
+    rand_state = np.random.RandomState(0)
+    datasets = {'koza1': (1, lambda x: x**4 + x**3 + x**2 + x, rand_state.uniform(-1, 1, (1, 20))),
+                'korns11': (5, lambda x, y, z, v, w: 6.87 + 11*np.cos(7.23*x**3),
+                            rand_state.uniform(-50, 10, (5, 5000)))}
+    results = {}
+    for bench, (terminals, f, inputs) in datasets.items():
+        random.seed(0)
+        pset = eurogp21_pset(terminals)
+        pop = [gp.PrimitiveTree(gp.genHalfAndHalf(pset, 1, max_height)) for _ in range(size_pop)]
+        outputs = f(*inputs)
+
+        def evaluate_compiled(individual):
+            f_ind = gp.compile(individual, pset=pset)
+            out = f_ind(*inputs)  # as the EuroGP21 evaluate, the primitives must not modify the dataset
+            err = outputs - out * np.ones(inputs.shape[1])
+            return [np.sqrt(sum(err**2)/(len(err))), 0.0]
+
+        with np.errstate(all='ignore'):
+            inputs_orig = np.copy(inputs)
+            t0 = perf_counter()
+            for _ in range(n_repeat):
+                compiled_fits = [evaluate_compiled(ind)[0] for ind in pop]
+            t_compiled = (perf_counter() - t0) / n_repeat
+            evaluator = RMSEEvaluator(pset, inputs_orig, outputs)
+            t0 = perf_counter()
+            for _ in range(n_repeat):
+                fits = evaluator.evaluate_population(pop)
+            t_interpreter = (perf_counter() - t0) / n_repeat
+
+            context = dict(pset.context)
+            for primitive in pset.primitives[pset.ret]:
+                context[primitive.name] = partial(lambda fun, *args: fun(*[np.broadcast_to(a, inputs.shape[1:])
+                                                                            .astype(float) for a in args]),
+                                                  pset.context[primitive.name])
+            ref = []
+            for ind in pop:
+                out = eval('lambda {}: {}'.format(','.join(pset.arguments), ind), context, {})(*np.copy(inputs_orig))
+                ref.append(np.sqrt(np.mean((outputs - out * np.ones(inputs.shape[1]))**2)))
+        ref = np.array(ref)
+        fits = np.array([fit[0] for fit in fits])
+        finite = np.isfinite(ref) & np.isfinite(fits)
+        diff = np.max(np.abs(ref[finite] - fits[finite]) / np.maximum(1, np.abs(ref[finite])))
+        mismatch = np.sum(np.isfinite(ref) != np.isfinite(fits))
+        compiled_fits = np.array(compiled_fits)
+        compiled_mismatch = np.sum(~(np.isclose(compiled_fits, ref, rtol=1e-12, atol=0) |
+                                     (np.isnan(compiled_fits) & np.isnan(ref)) | (compiled_fits == ref)))
+        compiled_mismatch += np.any(inputs != inputs_orig)
+
+        results[(bench, 'compiled')] = size_pop / t_compiled
+        results[(bench, 'interpreter')] = size_pop / t_interpreter
+        results[(bench, 'diff')] = diff
+        results[(bench, 'compiled_mismatch')] = compiled_mismatch
+        print('{:>8} {:5d} points: compiled {:9.0f} evals/s ({} differ from the reference)  interpreter {:9.0f} evals/s '
+              '({} unique of {} nodes)  max relative difference {:.1e}, {} non-finite mismatches'.format(
+               bench, inputs.shape[1], results[(bench, 'compiled')], compiled_mismatch, results[(bench, 'interpreter')],
+               evaluator.interpreter.n_nodes, sum(len(ind) for ind in pop), diff, mismatch))
+    return results
+
+
+# previous implementations of the protected primitives, reference of bench_primitives
+def _previous_ModSqrt(x):
+    if type(x) == int:
+        x = float(x)
+    if type(x) != float and type(x) != np.float64:
+        id = np.where(x < 0)
+        x[id] = 0
+        return np.sqrt(x)
+    else:
+        if x > 0:
+            return np.sqrt(x)
+        else:
+            return 0
+
+
+def _previous_ModLog(x):
+    if type(x) == int:
+        x = float(x)
+    if type(x) != float and type(x) != np.float64:
+        id = np.where(x <= 0)
+        x[id] = 1e-300
+        return np.log(x)
+    else:
+        if x>0:
+            return np.log(x)
+        else:
+            return np.log(1e-300)
+
+
+def _previous_ModExp(x):
+    if type(x) == int:
+        x = float(x)
+    if type(x) != float and type(x) != np.float64:
+        id1 = np.where(x>100)
+        x[id1] = 100
+        id2 = np.where(x<-100)
+        x[id2] = -100
+        return np.exp(x)
+    else:
+        if -100<=x<=100:
+            return np.exp(x)
+        else:
+            if x>0:
+                return np.exp(100)
+            else:
+                return np.exp(-100)
+
+
+def _previous_Square(x):
+    if type(x) == int:
+        x = float(x)
+    if type(x) != float and type(x) != np.float64 and type(x) != int:
+        id1 = np.where(x>1e150)
+        x[id1] = 1e150
+        id2 = np.where(x<-1e150)
+        x[id2] = -1e150
+        return x ** 2
+    else:
+        if -1e150<=x<=1e150:
+            return x ** 2
+        else:
+            return 1e150 ** 2
+
+
+def _previous_Div(x, y):
+    try:
+        return x / y
+    except ZeroDivisionError:
+        return 0
+
+
+def _previous_Mul(left, right):
+    try:
+        return left * right
+    except (RuntimeError, RuntimeWarning, TypeError, ArithmeticError, BufferError, BaseException, NameError, ValueError,
+            FloatingPointError, OverflowError):
+        return left
+
+
+def bench_primitives(n_points=10000, n_repeat=200):
+    """
+    Function used to compare the protected primitives of GP_PrimitiveSet with their previous implementations, which
+    checked the type of their input and modified arrays in place, and to check that they return the same values.
+
+    The previous unary implementations are timed on a copy of the input, the defensive copy needed to evaluate an
+    individual without corrupting the dataset, while Div and Mul did not modify their inputs and are timed without it.
+    The current ones are timed returning a new array and writing in an out buffer. The parity is checked on scalars of
+    type int, float and np.float64, on all their pairs for Div and Mul, and on arrays holding negative, zero, subnormal
+    and large values, and the inputs of the current primitives must be left unchanged. The previous Div only protected
+    Python scalars, dividing np.float64 scalars and arrays by 0 to inf or nan, so the reference of Div and Mul is their
+    previous implementation called on Python floats, element by element for the arrays.
+
+    Attributes:
+        n_points: integer
+            size of the input arrays
+        n_repeat: integer
+            number of timed calls of each function
+
+    Return:
+        results: dict
+            time per call in microseconds of each variant and number of mismatches, keyed by (primitive, quantity)
+    """
+    rand_state = np.random.RandomState(0)
+    x = rand_state.uniform(-300, 300, n_points)
+    x[::7] = 0.0
+    x[::11] = rand_state.uniform(-1e200, 1e200, len(x[::11]))
+    x[::13] = rand_state.uniform(0, 1e-305, len(x[::13]))
+    y = rand_state.uniform(-300, 300, n_points)
+    y[::5] = 0.0
+    y[::17] = rand_state.uniform(-1e200, 1e200, len(y[::17]))
+    out = np.empty(n_points)
+    scalars = [0, 3, -2, 0.0, 2.5, 1e-320, -1e-320, 50.0, -150.0, 1e200, -1e200, np.float64(4.0), np.float64(-7.5)]
+    primitives = [('ModSqrt', gpprim.ModSqrt, _previous_ModSqrt, (x,)),
+                  ('ModLog', gpprim.ModLog, _previous_ModLog, (x,)),
+                  ('ModExp', gpprim.ModExp, _previous_ModExp, (x,)),
+                  ('Square', gpprim.Square, _previous_Square, (x,)),
+                  ('Div', gpprim.Div, _previous_Div, (x, y)), ('Mul', gpprim.Mul, _previous_Mul, (x, y))]
+
+    def timed(fun, *args):
+        t0 = perf_counter()
+        for _ in range(n_repeat):
+            fun(*args)
+        return (perf_counter() - t0) / n_repeat * 1e6
+
+    results = {}
+    with np.errstate(all='ignore'):
+        for name, current, previous, args in primitives:
+            args_in = [np.copy(a) for a in args]
+            if len(args) == 1:
+                reference = previous(np.copy(x))
+                cases = [(v,) for v in scalars]
+                scalar_previous = previous
+                timed_previous = lambda v: previous(np.copy(v))
+            else:
+                scalar_previous = lambda *v: previous(*map(float, v))
+                reference = np.array([scalar_previous(a, b) for a, b in zip(*args)])
+                cases = list(itertools.product(scalars, repeat=2))
+                timed_previous = previous
+            mismatch = np.sum(current(*args) != reference)
+            mismatch += sum(current(*v) != scalar_previous(*v) for v in cases)
+            mismatch += sum(np.sum(a != a_in) for a, a_in in zip(args, args_in))  # input modified by the primitive
+            results[(name, 'previous')] = timed(timed_previous, *args)
+            results[(name, 'current')] = timed(current, *args)
+            results[(name, 'current_out')] = timed(lambda *v: current(*v, out=out), *args)
+            results[(name, 'mismatch')] = mismatch
+            print('{:>8}: previous {:6.1f} us, current {:6.1f} us, with out {:6.1f} us, '
+                  '{} mismatches over the array and {} scalar cases'.format(
+                   name, results[(name, 'previous')], results[(name, 'current')], results[(name, 'current_out')],
+                   mismatch, len(cases)))
+    return results
+
+
+benchmarks = {'pool': bench_pool,
+              'compile_cache': bench_compile_cache,
+              'fitness_cache': bench_fitness_cache,
+              'interpreter': bench_interpreter,
+              'primitives': bench_primitives}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('names', nargs='*', default=sorted(benchmarks),
+                        help='Benchmarks to run from {}, default all'.format(sorted(benchmarks)))
+    names = parser.parse_args().names
+    for name in names:
+        if name not in benchmarks:
+            parser.error('Invalid benchmark: \'{}\''.format(name))
+    for name in names:
+        print('---- ' + name)
+        benchmarks[name]()
@@ -7,5 +7,16 @@
 
 from .q_agents import *
 from .networks import *
-from .environment import *
+from .policy import *
 from .run_agent import *
+
+_lazy_environment = ('Environment', 'VecCartPole')
+__all__ = [name for name in dir() if not name.startswith('_')] + list(_lazy_environment)
+
+
+def __getattr__(name):
+    # Environments need gym, which is only imported when they are first used
+    if name in _lazy_environment:
+        from . import environment
+        return getattr(environment, name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -0,0 +1,18 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/. */
+# ------ Copyright (C) 2021 University of Strathclyde and Author ------
+# ---------------------- Author: Callum Wilson ------------------------
+# --------------- e-mail: callum.j.wilson@strath.ac.uk ----------------
+"""
+Imports the EQLM package, which holds the code QLearn shares with it
+
+QLearn is imported from the repository root, where the EQLM folder contains
+the EQLM package. If the EQLM folder itself is on the path, as in its
+notebook and benchmarks, the package is imported directly.
+"""
+
+try:
+    from EQLM import EQLM
+except ImportError:
+    import EQLM
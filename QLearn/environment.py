@@ -4,9 +4,10 @@
 # ------ Copyright (C) 2021 University of Strathclyde and Author ------
 # ---------------------- Author: Callum Wilson ------------------------
 # --------------- e-mail: callum.j.wilson@strath.ac.uk ----------------
-"""Contains the gym environment wrapper class"""
+"""Contains the gym environment wrapper class and a vectorised CartPole environment"""
 
 import gym
+from ._eqlm import EQLM as _EQLM
 
 
 class Environment(gym.Wrapper):
@@ -72,3 +73,7 @@ class Environment(gym.Wrapper):
 		if render:
 			super().render(**kwargs)
 		return gym.spaces.flatten(self.observation_space,s).reshape(1,-1),r,d,info
+
+
+# the vectorised CartPole is shared with EQLM
+VecCartPole = _EQLM.VecCartPole
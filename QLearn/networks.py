@@ -6,12 +6,37 @@
 # --------------- e-mail: callum.j.wilson@strath.ac.uk ----------------
 """Q-Networks for calculating action-value estimates"""
 
-try:
-    import tensorflow.compat.v1 as tf
-    tf.disable_v2_behavior()
-except ImportError:
-    import tensorflow as tf
-    
+def _import_tensorflow():
+    """Import tensorflow with v1 behaviour, replacing the lazy module reference `tf`"""
+    global tf
+    if isinstance(tf, _LazyTensorflow):
+        try:
+            import tensorflow.compat.v1 as tf
+            tf.disable_v2_behavior()
+        except ImportError:
+            import tensorflow as tf
+    return tf
+
+class _LazyTensorflow(object):
+    """Stands in for tensorflow until an attribute is first used, e.g. on building a network"""
+    def __getattr__(self, name):
+        return getattr(_import_tensorflow(), name)
+
+tf = _LazyTensorflow()
+
+# Tensorflow with v2 behaviour, imported on building the first CompiledMLPQNet
+tf2 = None
+
+def _import_tensorflow_v2():
+    """Import tensorflow with v2 behaviour as `tf2`, checking eager execution is enabled"""
+    global tf2
+    import tensorflow
+    if not tensorflow.executing_eagerly():
+        raise RuntimeError('CompiledMLPQNet needs eager execution, which is disabled in this '
+                           'process once a tensorflow v1 network such as MLPQNet is built')
+    tf2 = tensorflow
+    return tf2
+
 import random
 import numpy as np
 import pdb
@@ -57,6 +82,8 @@ class MLPQNet():
         Placeholder for new action-value estimates used to update
     updateModel : tf.Operation
         For running network updates
+    syncModel, softSyncModel : tf.Operation or None
+        Operations copying parameters from a source network, built by `build_sync`
     sess : tf.Session
         Tensorflow session
         
@@ -70,11 +97,15 @@ class MLPQNet():
         asdf
     update(self, S, Q)
         asdf
+    build_sync(self, source, tau=None)
+        Build operations which copy parameters from source within the graph
+    sync(self, soft=False)
+        Copy parameters from the source network
     """
     def __init__(self, state_size, action_size,
                  hidden_layers=[20, 10], alpha=0.01, activation_function='tanh', update_steps=50, clip_norm=1.0,
                  W_init_magnitude=0.1, w_init_magnitude=0.1, b_init_magnitude=0.0, minibatch_size=10,
-                 is_target=False, seed=None, **kwargs):
+                 is_target=False, seed=None, sess=None, **kwargs):
         """
         Parameters
         ----------
@@ -92,6 +123,9 @@ class MLPQNet():
             Whether the network is a target network which does not update, default False
         seed : int, optional
             Seed for random number generation, default None
+        sess : tf.Session, optional
+            Session of another network in the same graph, used by target networks so
+            parameters can be copied without leaving the graph, default new session
         """
         # Build network
         self.n_layer = len(hidden_layers)
@@ -124,10 +158,16 @@ class MLPQNet():
         self.p_assign += [w.assign(self.new_params['w'][i]) for i, w in enumerate(self.w)]
         self.p_assign += [b.assign(self.new_params['b'][i]) for i, b in enumerate(self.b)]
 
+        self.syncModel = None
+        self.softSyncModel = None
         self.target=is_target
         if self.target:
-            self.sess = tf.Session()
-            self.sess.run(tf.global_variables_initializer())
+            if sess is None:
+                self.sess = tf.Session()
+                self.sess.run(tf.global_variables_initializer())
+            else:
+                self.sess = sess
+                self.sess.run(tf.variables_initializer(self.var_list))
             return
 
         # Update rules
@@ -155,6 +195,29 @@ class MLPQNet():
             p_assign_dict[self.new_params['b'][n]] = p_new['b'][n]
         self.sess.run(self.p_assign, feed_dict=p_assign_dict)
 
+    def build_sync(self, source, tau=None):
+        """
+        Build operations which copy parameters from source within the graph
+
+        ...
+
+        Parameters
+        ----------
+        source : MLPQNet
+            Network sharing this network's session whose parameters are copied
+        tau : float, optional
+            If given, also build a soft update p = tau*p_source + (1-tau)*p
+        """
+        pairs = list(zip(self.var_list,source.var_list))
+        self.syncModel = tf.group(*[p.assign(p_s) for p, p_s in pairs])
+        if tau is not None:
+            self.softSyncModel = tf.group(*[p.assign(tf.add(tf.scalar_mul(tau,p_s),
+                tf.scalar_mul(1.0-tau,p))) for p, p_s in pairs])
+
+    def sync(self, soft=False):
+        """Copy parameters from the source network, softly if soft"""
+        self.sess.run(self.softSyncModel if soft else self.syncModel)
+
     def get_params(self):
         """Return current values of updatable parameters"""
         return self.sess.run(self.p_dict)
@@ -188,3 +251,272 @@ class MLPQNet():
         """Updates based on states and target action values"""
         if not self.target:
             self.sess.run(self.updateModel,{self.s_input:S,self.nextQ:Q})
+
+
+class CompiledMLPQNet():
+    """
+    A Q-Network with the structure and update rule of MLPQNet using tensorflow 2
+
+    Predictions, updates and target syncs are `tf.function`s compiled with XLA
+    (`jit_compile=True`) in place of session runs with feed dicts, and run on
+    CPU only machines. Updates apply RMSProp as `tf.train.RMSPropOptimizer`
+    does, with mean squares initialised to 1, to gradients of the summed
+    squared error each clipped to `clip_norm`. Parameters have the same layout
+    as MLPQNet, so `get_params` and `assign_params` are interchangeable.
+
+    Each compiled function is called through a concrete function cached for
+    its input shapes, and predictions for batches are padded to a power of
+    two rows, so XLA compiles a small number of shapes. With
+    `build_train_step`, `train_step` computes Q-learning targets with the
+    target network and updates in a single call. Eager execution is needed,
+    so this network cannot be built in a process which has built an MLPQNet.
+
+    ...
+
+    Attributes
+    ----------
+    n_layer : int
+        Number of hidden layers
+    w : list of tf.Variable
+        Input weights to each hidden layer
+    b : list of tf.Variable
+        Biases for each hidden node
+    W : tf.Variable
+        Output weights
+    act_fn : function
+        Neuron activation function
+    var_list : list of tf.Variable
+        All updatable parameters in the network
+    p_dict : dict
+        Dictionary referring to all updatable parameters
+    ms : list of tf.Variable
+        RMSProp mean squared gradients of each parameter in var_list
+    alpha : float
+        Learning rate
+    clip_norm : float or None
+        Maximum norm of the gradient of each parameter
+    target : bool
+        Indicates if network is a target network
+    prep_state : None
+        Networks with preprocessed states are not supported
+    k : int
+        Minibatch size for updates
+    source : CompiledMLPQNet or None
+        Network whose parameters are copied by `sync`, set by `build_sync`
+    tau : float or None
+        Rate of soft updates by `sync`
+    target_net : CompiledMLPQNet or None
+        Network giving next state action-values in `train_step`, set by `build_train_step`
+    gamma : float or None
+        Discount factor used by `train_step`
+    sess : None
+        No session is used, kept for compatibility with QAgent
+    """
+    rms_decay = 0.9
+    rms_epsilon = 1e-10
+
+    def __init__(self, state_size, action_size,
+                 hidden_layers=[20, 10], alpha=0.01, activation_function='tanh', update_steps=50, clip_norm=1.0,
+                 W_init_magnitude=0.1, w_init_magnitude=0.1, b_init_magnitude=0.0, minibatch_size=10,
+                 is_target=False, seed=None, sess=None, **kwargs):
+        """
+        Parameters
+        ----------
+        state_size, action_size : int
+            Size of the environment state space and action space
+        hidden_layers : array of int, optional
+            Number of hidden nodes in each layer, default [20, 10]
+        alpha : float, optional
+            Learning rate, default 0.01
+        activation_function : str, optional
+            Neuron activation function, default tanh
+        clip_norm : float, optional
+            Maximum norm of the gradient of each parameter, None for no clipping, default 1
+        W_init_magnitude, w_init_magnitude, b_init_magnitude : float, optional
+            Initialisation magnitude for each set of parameters, default 0.1, 0.1, 0.0
+        minibatch_size : int, optional
+            Minibatch size for updates, default 10
+        is_target : bool, optional
+            Whether the network is a target network which does not update, default False
+        seed : int, optional
+            Seed for random number generation, default None
+        sess : None, optional
+            Ignored, accepted so QAgent can build target networks as for MLPQNet
+
+        Raises
+        ------
+        ValueError
+            If an invalid activation function is passed
+        RuntimeError
+            If eager execution has been disabled by a tensorflow v1 network
+        """
+        _import_tensorflow_v2()
+        self.n_layer = len(hidden_layers)
+        N_hid = [state_size] + list(hidden_layers)
+        self.w = []
+        self.b = []
+        for i in range(self.n_layer):
+            self.w.append(tf2.Variable(tf2.random.uniform([N_hid[i],N_hid[i+1]],0,w_init_magnitude,seed=seed)))
+            self.b.append(tf2.Variable(tf2.random.uniform([1,N_hid[i+1]],0,b_init_magnitude,seed=seed)))
+        self.W = tf2.Variable(tf2.random.uniform([N_hid[-1],action_size],0,W_init_magnitude,seed=seed))
+        try:
+            self.act_fn = tf2.keras.activations.get(activation_function)
+        except ValueError:
+            raise ValueError('Invalid activation function: \'{}\''.format(activation_function))
+        self.var_list = self.w + self.b + [self.W]
+        self.p_dict = {'W':self.W, 'w':self.w, 'b':self.b}
+        self.state_size = state_size
+        self.action_size = action_size
+
+        self.source = None
+        self.tau = None
+        self.sess = None
+        self.prep_state = None
+        self.target = is_target
+        self.k = int(minibatch_size)
+        self.alpha = alpha
+        self.clip_norm = clip_norm
+        self.ms = []
+        self.target_net = None
+        self.gamma = None
+        self._fns = {}
+        self._predict = tf2.function(self._Q_graph, jit_compile=True)
+        self._sync = None
+        if self.target:
+            return
+        self.ms = [tf2.Variable(tf2.ones_like(v)) for v in self.var_list]
+        self._train = tf2.function(self._train_graph, jit_compile=True)
+        self._train_step = tf2.function(self._train_step_graph, jit_compile=True)
+
+    def _concrete(self, fn, *shapes):
+        """Concrete function of compiled function fn for float32 inputs of the given shapes"""
+        key = (fn,) + shapes
+        try:
+            return self._fns[key]
+        except KeyError:
+            self._fns[key] = fn.get_concrete_function(*[tf2.TensorSpec(shape, tf2.float32) for shape in shapes])
+            return self._fns[key]
+
+    def _Q_graph(self, s):
+        """Action-values for a batch of states"""
+        x = s
+        for w, b in zip(self.w, self.b):
+            x = self.act_fn(tf2.add(tf2.matmul(x,w),b))
+        return tf2.matmul(x,self.W)
+
+    def _train_graph(self, S, Q):
+        """One RMSProp step on the summed squared error between Q and the estimates for S"""
+        self._apply_gradients(S, Q)
+
+    def _train_step_graph(self, s, a, r, s_next, done, w):
+        """Update towards Q-learning targets as QLearn.QAgent does, returning TD errors"""
+        Q = self._Q_graph(s)
+        a_mask = tf2.one_hot(tf2.cast(a, tf2.int32), self.action_size)
+        Q_a = tf2.reduce_sum(Q*a_mask, 1)
+        Q_next = tf2.reduce_max(self.target_net._Q_graph(s_next), 1)
+        td_error = r + self.gamma*(1.0-done)*Q_next - Q_a
+        self._apply_gradients(s, Q + a_mask*tf2.expand_dims(w*td_error, 1))
+        return td_error
+
+    def _apply_gradients(self, S, Q):
+        """RMSProp step for targets Q, which are held constant"""
+        Q = tf2.stop_gradient(Q)
+        with tf2.GradientTape() as tape:
+            loss = tf2.reduce_sum(tf2.square(Q - self._Q_graph(S)))
+        grads = tape.gradient(loss, self.var_list)
+        for grad, var, ms in zip(grads, self.var_list, self.ms):
+            if self.clip_norm is not None:
+                grad = tf2.clip_by_norm(grad, self.clip_norm)
+            ms.assign(self.rms_decay*ms + (1.0-self.rms_decay)*tf2.square(grad))
+            var.assign_sub(self.alpha*grad/tf2.sqrt(ms + self.rms_epsilon))
+
+    def _sync_graph(self, tau):
+        """Set each parameter to tau times the source parameter plus (1-tau) times itself"""
+        for p, p_s in zip(self.var_list, self.source.var_list):
+            p.assign(tau*p_s + (1.0-tau)*p)
+
+    def assign_params(self,p_new):
+        """Assign new values p_new to updatable parameters"""
+        self.W.assign(p_new['W'])
+        for n in range(self.n_layer):
+            self.w[n].assign(p_new['w'][n])
+            self.b[n].assign(p_new['b'][n])
+
+    def build_sync(self, source, tau=None):
+        """
+        Set the network whose parameters are copied by `sync`
+
+        ...
+
+        Parameters
+        ----------
+        source : CompiledMLPQNet
+            Network whose parameters are copied
+        tau : float, optional
+            If given, soft updates set p = tau*p_source + (1-tau)*p
+        """
+        self.source = source
+        self.tau = tau
+        self._sync = tf2.function(self._sync_graph, jit_compile=True)
+
+    def sync(self, soft=False):
+        """Copy parameters from the source network, softly if soft"""
+        self._sync(self.tau if soft else 1.0)
+
+    def build_train_step(self, target, gamma):
+        """Set the target network and discount factor used to compute targets in `train_step`"""
+        self.target_net = target
+        self.gamma = gamma
+
+    def get_params(self):
+        """Return current values of updatable parameters"""
+        return {'W':self.W.numpy(), 'w':[w.numpy() for w in self.w], 'b':[b.numpy() for b in self.b]}
+
+    def Q_predict(self, s=None, s_prep=None):
+        """
+        Return predicted action-values for the state
+
+        ...
+
+        Parameters
+        ----------
+        s : array-like, optional
+            State in its `normal` form
+        s_prep : array_like, optional
+            Not supported, as no preprocessed state is defined
+
+        Returns
+        -------
+        array-like
+            Predicted action values for the state, empty if `s` is `None`
+        """
+        if s is None:
+            return []
+        s = np.asarray(s, dtype=np.float32)
+        n = len(s)
+        if n == 0:
+            return np.zeros((0,self.action_size), dtype=np.float32)
+        n_pad = 1 << (n-1).bit_length()
+        if n_pad != n:
+            s = np.concatenate([s, np.zeros((n_pad-n,self.state_size), dtype=np.float32)])
+        return self._concrete(self._predict, (n_pad,self.state_size))(tf2.constant(s)).numpy()[:n]
+
+    def update(self, S, Q):
+        """Updates based on states and target action values"""
+        if not self.target:
+            k = len(S)
+            self._concrete(self._train, (k,self.state_size), (k,self.action_size))(
+                tf2.constant(S, dtype=tf2.float32), tf2.constant(Q, dtype=tf2.float32))
+
+    def train_step(self, s, a, r, s_next, done, w=None):
+        """
+        Update on a minibatch of transitions in one compiled call, returning TD errors
+
+        The result is the same as predicting action-values, computing targets
+        and calling `update` as QLearn.QAgent does, with importance sampling
+        weights w scaling the TD errors used as targets.
+        """
+        k = len(a)
+        w = np.ones(k, dtype=np.float32) if w is None else w
+        fn = self._concrete(self._train_step, (k,self.state_size), (k,), (k,), (k,self.state_size), (k,), (k,))
+        return fn(*[tf2.constant(x, dtype=tf2.float32) for x in (s, a, r, s_next, done, w)]).numpy()
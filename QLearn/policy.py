@@ -0,0 +1,15 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/. */
+# ------ Copyright (C) 2021 University of Strathclyde and Author ------
+# ---------------------- Author: Callum Wilson ------------------------
+# --------------- e-mail: callum.j.wilson@strath.ac.uk ----------------
+"""Frozen numpy policies exported from trained Q-Networks, with no tensorflow dependency"""
+
+from ._eqlm import EQLM as _EQLM
+
+
+# the policies are shared with EQLM, whose export_policy also takes the parameters of QLearn networks
+NumpyPolicy = _EQLM.policy.NumpyPolicy
+export_policy = _EQLM.policy.export_policy
+load_policy = _EQLM.policy.load_policy
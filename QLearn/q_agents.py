@@ -10,32 +10,16 @@ and sampling experiences
 """
 
 from . import networks
-from random import Random
+from ._eqlm import EQLM as _EQLM
 import numpy as np
 import numpy.random as rand
 import pdb
 
 
-class ReplayMemory(list):
-    """
-    List for storing experiences and separately storing demonstration experience
-    """
-    def __init__(self,memory_size=None,demo_memory=[],n_demo=None,seed=None,**kwargs):
-        list.__init__(self,[])
-        self.max_len = memory_size
-        self.demo_memory = demo_memory
-        self.n_demo = int(n_demo) if n_demo is not None else 0
-        self.rand_state = Random(seed)
-    def add(self, list_add):
-        self.append(list_add)
-        if self.max_len:
-            while len(self)>self.max_len:
-                self.remove(self[0])
-    def sample(self, n):
-        if self.n_demo>0:
-            return self.rand_state.sample(self,n-self.n_demo) + self.demo_memory.sample(self.n_demo)
-        else:
-            return self.rand_state.sample(self,n)
+# the profiler and the replay memory are shared with EQLM, whose ReplayMemory is also used with MLPQNet
+PhaseTimer = _EQLM.q_agents.PhaseTimer
+SumTree = _EQLM.q_agents.SumTree
+ReplayMemory = _EQLM.q_agents.ReplayMemory
 
 
 class QAgent(object):
@@ -70,6 +54,10 @@ class QAgent(object):
         Number of episodes at start of training to use f_heur
     target_steps : int
         Number of steps between target network updates
+    target_tau : float or None
+        If given, the target network is softly updated at every step with this rate
+    fused_update : bool
+        Whether network updates use the network's fused `train_step`
     prev_s : array-like, None
         Placeholder for storing previous state to add to memory
     prev_a : int, None
@@ -80,6 +68,8 @@ class QAgent(object):
         Counts the number of steps within an episode
     rand_state : np.random.RandomState
         Random state for generating random numbers
+    profiler : PhaseTimer
+        Times the phases of each update, disabled unless profile is True
 
     Methods
     -------
@@ -94,7 +84,8 @@ class QAgent(object):
 
     """
     def __init__(self,env,net_type='MLPQNet',f_heur=None,n_heur=0,seed=None,
-                 gamma=0.6,eps_i=0.9,eps_f=0.0,n_eps=400,target_steps=50,**kwargs):
+                 gamma=0.6,eps_i=0.9,eps_f=0.0,n_eps=400,target_steps=50,target_tau=None,
+                 fused_update=True,profile=False,**kwargs):
         """
         Parameters
         ----------
@@ -118,6 +109,14 @@ class QAgent(object):
             Number of episodes to linearly decrease epsilon, default 400
         target_steps : int, optional
             Number of steps between target network updates, default 50
+        target_tau : float, optional
+            Rate for soft (Polyak) target network updates at every step, by default
+            the target network is copied every target_steps steps
+        fused_update : bool, optional
+            If True and the network supports it, compute Q-learning targets and update
+            the network in a single call, e.g. for 'CompiledMLPQNet', default True
+        profile : bool, optional
+            Enables profiler to time each phase of action selection and updating, default False
         **kwargs
             Additional keyword arguments passed to nn, nn_target, and memory
 
@@ -135,8 +134,9 @@ class QAgent(object):
 
         self.nn = net_module(self.state_size, self.action_size, **kwargs)
         self.nn_target = net_module(self.state_size, self.action_size, 
-                                    is_target=True, **kwargs)
-        self.nn_target.assign_params(self.nn.get_params())
+                                    is_target=True, sess=self.nn.sess, **kwargs)
+        self.nn_target.build_sync(self.nn, tau=target_tau)
+        self.nn_target.sync()
 
         self.memory = ReplayMemory(seed=seed,**kwargs)
 
@@ -147,12 +147,17 @@ class QAgent(object):
         self.f_heur = f_heur
         self.n_heur = n_heur
         self.target_steps = target_steps
+        self.target_tau = target_tau
+        self.fused_update = fused_update and hasattr(self.nn,'build_train_step')
+        if self.fused_update:
+            self.nn.build_train_step(self.nn_target, self.gamma)
 
         self.prev_s = None
         self.prev_a = None
         self.ep_count = 0
         self.step_count = 0
         self.rand_state = rand.RandomState(seed=seed)
+        self.profiler = PhaseTimer(profile)
 
     def action_select(self,state):
         """
@@ -175,7 +180,8 @@ class QAgent(object):
         elif self.rand_state.random()<self.epsilon:
             action = self.rand_state.randint(self.action_size)
         else:
-            q_s=self.nn.Q_predict(state)
+            with self.profiler.phase('Q_predict'):
+                q_s=self.nn.Q_predict(state)
             action=np.argmax(q_s)
         self.prev_s=state
         self.prev_a=action
@@ -202,28 +208,58 @@ class QAgent(object):
         return action
 
     def network_update(self):
-        """Update nn weights and periodically update target_nn"""
-        D_update = self.memory.sample(self.nn.k)
-        s, a, r, Sd, St = (np.stack([d[0] for d in D_update]),
-                           np.array([d[1] for d in D_update]),
-                           np.array([d[2] for d in D_update]),
-                           np.stack([d[3] for d in D_update]),
-                           np.invert(np.array([d[4] for d in D_update])))
-        indt = np.where(St)[0]
-        if self.nn.prep_state is not None:
-            Q = self.nn.Q_predict(s_prep=s)
-            Qd = self.nn_target.Q_predict(s_prep=Sd[St])
+        """
+        Update nn weights and periodically update target_nn
+
+        With prioritised replay, importance sampling weights scale the TD
+        errors used as targets and the priorities of the minibatch are
+        updated from the returned TD errors.
+
+        ...
+
+        Returns
+        -------
+        np.ndarray
+            TD errors of the sampled minibatch
+        """
+        phase = self.profiler.phase
+        with phase('sample'):
+            s, a, r, Sd, Sdone = self.memory.sample(self.nn.k)
+            w = self.memory.sample_weights
+        if self.fused_update:
+            with phase('update'):
+                td_error = self.nn.train_step(s,a,r,Sd,Sdone,w)
         else:
-            Q = self.nn.Q_predict(s=s)
-            Qd = self.nn_target.Q_predict(s=Sd[St])
-        Q[range(Q.shape[0]),a] = r
-        Q[indt,a[indt]] += self.gamma*np.max(Qd,1)
-        self.nn.update(s,Q)
+            St = np.invert(Sdone)
+            indt = np.where(St)[0]
+            ind = np.arange(len(a))
+            with phase('Q_predict'):
+                if self.nn.prep_state is not None:
+                    Q = self.nn.Q_predict(s_prep=s)
+                    Qd = self.nn_target.Q_predict(s_prep=Sd[St])
+                else:
+                    Q = self.nn.Q_predict(s=s)
+                    Qd = self.nn_target.Q_predict(s=Sd[St])
+            Q_a = Q[ind,a]
+            Q[ind,a] = r
+            Q[indt,a[indt]] += self.gamma*np.max(Qd,1)
+            td_error = Q[ind,a] - Q_a
+            if w is not None:
+                Q[ind,a] = Q_a + w*td_error
+            with phase('update'):
+                self.nn.update(s,Q)
+        with phase('sample'):
+            self.memory.update_priorities(td_error)
 
         self.step_count += 1
-        if self.step_count >= self.target_steps:
-            self.nn_target.assign_params(self.nn.get_params())
+        if self.target_tau is not None:
+            with phase('target_sync'):
+                self.nn_target.sync(soft=True)
+        elif self.step_count >= self.target_steps:
+            with phase('target_sync'):
+                self.nn_target.sync()
             self.step_count = 0
+        return td_error
 
     def update(self,state,reward,done,net_update=True):
         """
@@ -241,19 +277,27 @@ class QAgent(object):
             Indicates if the new state is terminal
         net_update : bool, optional
             If the network weights should be updated, default True
+
+        Returns
+        -------
+        np.ndarray or None
+            TD errors of the sampled minibatch, None if the network was not updated
         """
         if done:
             self.ep_count += 1
             self.epsilon = np.max([self.epsilon-self.d_eps,self.eps_f])
 
         if self.nn.prep_state is not None:
-            s_prep = self.nn.sess.run(self.nn.prep_state,
-                                           feed_dict={self.nn.s_input:np.concatenate([self.prev_s,state])})
-            self.memory.add([s_prep[0],self.prev_a,reward,s_prep[1],done])
+            with self.profiler.phase('prep_state'):
+                s_prep = self.nn.sess.run(self.nn.prep_state,
+                                               feed_dict={self.nn.s_input:np.concatenate([self.prev_s,state])})
+            with self.profiler.phase('memory_add'):
+                self.memory.add([s_prep[0],self.prev_a,reward,s_prep[1],done])
         else:
-            self.memory.add([self.prev_s.reshape(-1),self.prev_a,reward,state.reshape(-1),done])
+            with self.profiler.phase('memory_add'):
+                self.memory.add([self.prev_s.reshape(-1),self.prev_a,reward,state.reshape(-1),done])
 
         if len(self.memory)+self.memory.n_demo<self.nn.k:
             return
         elif net_update:
-            self.network_update()
+            return self.network_update()
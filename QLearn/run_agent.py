@@ -7,11 +7,18 @@
 """Methods for training and testing agents"""
 
 import numpy as np
-from tqdm import trange
 from .q_agents import ReplayMemory
+from ._eqlm import EQLM as _EQLM
 import pickle
 import pdb
 
+def progress_range(n, show_progress=False, **kwargs):
+    """range(n), or a tqdm progress bar over it if show_progress, importing tqdm only then"""
+    if not show_progress:
+        return range(n)
+    from tqdm import trange
+    return trange(n, **kwargs)
+
 def data_smooth(data,n_avg):
     """Returns data averaged over n_avg episodes for clearer plotting"""
     x_vec = np.arange(n_avg,len(data)+1,n_avg)
@@ -20,7 +27,8 @@ def data_smooth(data,n_avg):
         data_avg.append(np.mean(data[x-n_avg:x]))
     return x_vec, data_avg
 
-def train_agent(agent, env, N_ep, save_name=None, show_progress=False):
+def train_agent(agent, env, N_ep, save_name=None, show_progress=False, snapshot_steps=None,
+                profile=False):
     """
     Train an agent for a fixed number of episodes
 
@@ -35,9 +43,17 @@ def train_agent(agent, env, N_ep, save_name=None, show_progress=False):
     N_ep : int
         Number of episodes to train
     save_name : str or None, optional
-        If str, save run data to a file named save_name after each episode, default None
+        If str, log each episode to a file named save_name with `EpisodeLog`, default None
     show_progress : bool, optional
         If True, shows a progress bar indicating remaining episodes, default False
+    snapshot_steps : int or None, optional
+        Number of episodes between weight snapshots in the log, by default the
+        weights are saved on improvement and at the end of training
+    profile : bool, optional
+        If True, enables the agent's profiler during training, default False. The
+        time of each environment step is included, per-episode phase timings are
+        logged with save_name, and the accumulated times are given by
+        agent.profiler.summary()
 
     Returns
     -------
@@ -52,23 +68,29 @@ def train_agent(agent, env, N_ep, save_name=None, show_progress=False):
     """
     R_ep = []
     steps = []
-    if show_progress:
-        t = trange(N_ep, desc='bar_desc', leave=True)
-    else:
-        t = range(N_ep)
+    profiler = agent.profiler
+    was_enabled = profiler.enabled
+    if profile:
+        profiler.enable()
+    timing_phases = profiler.phases+('other',) if profiler.enabled else None
+    log = EpisodeLog(save_name, snapshot_steps, timing_phases=timing_phases) if save_name else None
+    t = progress_range(N_ep, show_progress, desc='bar_desc', leave=True)
     for ep_no in t:
-        s = env.reset()
+        with profiler.phase('env_step'):
+            s = env.reset()
         done = False
         Rt = 0
         n_step = 0
         while not done:
             a = agent.action_select(s)
-            s, r, done, _ = env.step(a)
+            with profiler.phase('env_step'):
+                s, r, done, _ = env.step(a)
             agent.update(s,r,done)
             Rt += r
             n_step +=1
         R_ep.append(Rt)
         steps.append(n_step)
+        timing = profiler.lap() if profiler.enabled else None
         if show_progress:
             if ep_no>10:
                 t.set_description('R: {} Step: {}'.format(np.mean(R_ep[-10:]).round(1),n_step))
@@ -76,11 +98,18 @@ def train_agent(agent, env, N_ep, save_name=None, show_progress=False):
             else:
                 t.set_description('R: {} Step: {}'.format(np.mean(R_ep).round(1),n_step))
                 t.refresh()
-        if save_name:
-            data = {'params':agent.nn.get_params(),'R':R_ep,'step':steps}
-            pickle.dump(data, open(save_name,'wb'))
+        if log:
+            log.append(Rt, n_step, agent.nn.get_params, timing)
+    if log:
+        log.close(agent.nn.get_params())
+    if not was_enabled:
+        profiler.disable()
     return R_ep, steps, agent, env
 
+# the episode log is shared with EQLM, so that both packages write and read the same files
+EpisodeLog = _EQLM.utils.EpisodeLog
+load_results = _EQLM.utils.load_results
+
 def agent_demo(agent, env, N_ep, show=False, show_progress=False):
     """
     Demonstrate a trained agent's policy over a number of episodes
@@ -109,10 +138,7 @@ def agent_demo(agent, env, N_ep, show=False, show_progress=False):
     """
     R_ep = []
     steps = []
-    if show_progress:
-        t = trange(N_ep)
-    else:
-        t = range(N_ep)
+    t = progress_range(N_ep, show_progress)
     for ep_no in t:
         s = env.reset()
         done = False
@@ -129,13 +155,13 @@ def agent_demo(agent, env, N_ep, show=False, show_progress=False):
         steps.append(n_step)
     return R_ep, steps
 
-def heuristic_demo(H, env, N_ep, show=False):
+def heuristic_demo(H, env, N_ep, show=False, show_progress=True):
     """
     Demonstrate a heuristic policy H over a number of episodes
     """
     R_ep = []
     steps = []
-    for ep_no in trange(N_ep):
+    for ep_no in progress_range(N_ep, show_progress):
         s = env.reset()
         done = False
         Rt = 0
@@ -151,19 +177,69 @@ def heuristic_demo(H, env, N_ep, show=False):
         steps.append(n_step)
     return R_ep, steps
 
-def heuristic_memory_demo(H, env, N_ep, fname=None):
+def heuristic_memory_demo(H, env, N_ep, fname=None, show_progress=True, memory_size=None, batch_heuristic=False):
     """
     Create a demonstration replay buffer using a heuristic policy H
+
+    With a batch of environments such as `VecCartPole`, all environments are
+    stepped together and the transitions of every step are added to the
+    memory as one batch.
+
+    ...
+
+    Parameters
+    ----------
+    H : function
+        Heuristic which takes a single state and returns an action
+    env : VecCartPole or Environment
+        Environment, where a batch of environments is stepped together
+    N_ep : int
+        Number of episodes, with a batch of environments the transitions of
+        episodes still running when the last one finishes are also kept
+    fname : str, optional
+        File the memory is pickled to, by default it is not saved
+    show_progress : bool, optional
+        Displays a tqdm progress bar over episodes
+    memory_size : int, optional
+        Maximum number of stored transitions, default unbounded
+    batch_heuristic : bool, optional
+        H takes the states of a batch of environments, one row each, and returns
+        their actions, default False
+
+    Returns
+    -------
+    ReplayMemory
+        Demonstration transitions, e.g. the `demo_memory` of an agent's memory
     """
-    mem = ReplayMemory()
-    for ep_no in trange(N_ep):
+    mem = ReplayMemory(memory_size)
+    if hasattr(env, 'n_env'):
+        t = progress_range(N_ep, show_progress)
+        bar = getattr(t, 'update', None)
+        n_done = 0
         s = env.reset()
-        done = False
-        while not done:
-            prev_s = s
-            a = H(s[0])
-            s, r, done, _ = env.step(a)
-            mem.add([prev_s.reshape(-1),a,r,s.reshape(-1),done])
+        while n_done < N_ep:
+            a = np.asarray(H(s)) if batch_heuristic else np.array([H(s_i) for s_i in s])
+            s_next, r, done, info = env.step(a)
+            s_end = s_next.copy()
+            s_end[done] = info['terminal_state']
+            mem.add_batch(s, a, r, s_end, done)
+            n_new = min(np.count_nonzero(done), N_ep-n_done)
+            n_done += n_new
+            if bar and n_new:
+                bar(n_new)
+            s = s_next
+        if bar:
+            t.close()
+    else:
+        for ep_no in progress_range(N_ep, show_progress):
+            s = env.reset()
+            done = False
+            while not done:
+                prev_s = s
+                a = H(s[0])
+                s, r, done, _ = env.step(a)
+                mem.add([prev_s.reshape(-1),a,r,s.reshape(-1),done])
     if fname is not None:
-        pickle.dump(mem,open(fname,'wb'))
+        with open(fname, 'wb') as f:
+            pickle.dump(mem, f)
     return mem